@@ -0,0 +1,55 @@
+import sys
+import os
+import copy
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core import Project
+
+def scaledProject(filename, copies):
+    """
+    Loads a project file and duplicates its shots until
+    we have the requested number of copies of each.
+    """
+    with open(filename) as infile:
+        root = json.load(infile)
+
+    shots = {}
+    for i in range(0, copies):
+        for shotname, shot in root["shots"].items():
+            newname = "{}_{}".format(shotname, i)
+            shot = copy.deepcopy(shot)
+            shot["name"] = newname
+            shots[newname] = shot
+    root["shots"] = shots
+    return root
+
+def countNodes(root):
+    num = 0
+    for shot in root["shots"].values():
+        if shot["graph"]:
+            num += len(shot["graph"]["nodes"])
+    return num
+
+if __name__ == '__main__':
+    copies = 5000
+    if len(sys.argv) > 1:
+        copies = int(sys.argv[1])
+
+    filename = os.path.join(os.path.dirname(__file__), "..", "projects", "test.sg")
+    root = scaledProject(filename, copies)
+    numNodes = countNodes(root)
+
+    start = time.perf_counter()
+    project = Project.deserialize(root)
+    elapsed = time.perf_counter() - start
+    print("Opened {} shots in {:.3f}s".format(len(project.shots), elapsed))
+
+    start = time.perf_counter()
+    for shot in project.shots.values():
+        shot.graph
+    elapsed = time.perf_counter() - start
+    print("Deserialized {} shots, {} nodes in {:.2f}s ({:.1f}us per node)".format(
+                    len(project.shots), numNodes, elapsed, elapsed / max(numNodes, 1) * 1e6))
@@ -0,0 +1,68 @@
+import sys
+import os
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core import Graph
+from core import Project
+from bench_load import scaledProject, countNodes
+
+def nodeMemory(classname, num, graph=None):
+    """
+    Bytes allocated per node creating num nodes of classname,
+    on their own or added to graph.
+    """
+    nodes = []
+    cls = None
+    if graph is None:
+        from core import registry
+        cls = registry.nodeClass(classname)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for x in range(0, num):
+        if graph is None:
+            nodes.append(cls.create("foo"))
+        else:
+            graph.createNode(classname, "foo")
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / num, elapsed
+
+def projectMemory(filename, copies):
+    """
+    Bytes allocated per node opening copies of the shots in a project
+    file and loading all their graphs.
+    """
+    root = scaledProject(filename, copies)
+    num = countNodes(root)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    project = Project.deserialize(root)
+    for shot in project.shots.values():
+        shot.graph
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / max(num, 1), num, elapsed
+
+if __name__ == '__main__':
+    num = 100000
+    if len(sys.argv) > 1:
+        num = int(sys.argv[1])
+
+    for classname in ("Node", "RenderAction", "MayaFile"):
+        perNode, elapsed = nodeMemory(classname, num)
+        print("{} {} nodes: {:.0f} bytes per node, {:.2f}s".format(num, classname, perNode, elapsed))
+
+    perNode, elapsed = nodeMemory("RenderAction", num, Graph())
+    print("{} RenderAction nodes in a graph: {:.0f} bytes per node, {:.2f}s".format(num, perNode, elapsed))
+
+    filename = os.path.join(os.path.dirname(__file__), "..", "projects", "test.sg")
+    copies = max(num // max(countNodes(scaledProject(filename, 1)), 1), 1)
+    perNode, numNodes, elapsed = projectMemory(filename, copies)
+    print("{} nodes in a loaded project: {:.0f} bytes per node, {:.2f}s".format(numNodes, perNode, elapsed))
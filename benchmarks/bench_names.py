@@ -0,0 +1,30 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core import Graph
+
+def createNodes(num):
+    graph = Graph()
+    start = time.perf_counter()
+    for x in range(0, num):
+        graph.createNode("RenderAction", "foo")
+    elapsed = time.perf_counter() - start
+    return graph, elapsed
+
+if __name__ == '__main__':
+    num = 100000
+    if len(sys.argv) > 1:
+        num = int(sys.argv[1])
+
+    graph, elapsed = createNodes(num)
+    print("Created {} RenderAction nodes in {:.2f}s ({:.1f}us per node)".format(
+                    len(graph.nodes), elapsed, elapsed / num * 1e6))
+
+    start = time.perf_counter()
+    for x in range(0, num):
+        graph.createUniqueName("RenderAction")
+    elapsed = time.perf_counter() - start
+    print("Named {} nodes in {:.3f}s ({:.2f}us per name)".format(num, elapsed, elapsed / num * 1e6))
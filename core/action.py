@@ -3,10 +3,14 @@ import logging
 from .node import Node
 from core import data
 from .attributes import *
+from . import registry
 
 logger = logging.getLogger(__name__)
 
 class Action(Node):
+    __slots__ = ()
+    abstract = True
+
     def __init__(self, match):
         super(Action, self).__init__(match)
         inputAttr = InputAttribute("scenefile", None, hidden=True)
@@ -28,17 +32,15 @@ class Action(Node):
 
     @classmethod
     def deserialize(cls, root):
-        import core.actions
         classname = root["class"]
-        if not classname in dir(core.actions):
+        cls = registry.nodeClass(classname, Action)
+        if not cls:
             logger.error("Unable to deserialize. Unknown classname: " + classname)
             raise Exception
 
-        cls = getattr(core.actions, classname)
-
         match = root["match"]
 
-        obj = cls(root["match"])
+        obj = cls.create(root["match"])
         obj.name = root["name"]
 
         attributes = root["attributes"]
@@ -64,12 +66,12 @@ class Action(Node):
             logger.error("Tried to create incompatible or unknown data: " + dataType)
             raise Exception
 
-        if not dataType in dir(data):
+        cls = registry.nodeClass(dataType, data.Data)
+        if not cls:
             logger.error("Tried to create non existing data type: " + dataType)
             raise Exception
 
-        cls = getattr(data, dataType)
-        node = cls(self.match)
+        node = cls.create(self.match)
 
         node["action"] = self
 
@@ -0,0 +1,116 @@
+"""
+Make style up-to-date checks for actions.
+
+Every action gets a fingerprint from its own attributes, its scene
+file's attributes, and the attributes and fingerprints of the data
+feeding that scene file. After an action runs its fingerprint is kept
+in a local cache, along with the size and modification time of the
+files its executor says it writes. Next time round the action is only
+run again if its fingerprint changed, one of those files changed or
+went missing, or an action upstream of it ran.
+
+    cache = ActionCache("show.sgcache")
+    engine = ExecutionEngine(cache=cache)
+    engine.wouldRun(engine.plan(shots))
+"""
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+from .attributes import InputAttribute, OutputAttribute
+
+logger = logging.getLogger(__name__)
+
+## Attributes that don't change what an action does
+IGNORED = ("pos.x", "pos.y")
+
+def nodeState(node):
+    """
+    What about node matters to the actions that use it. Connections
+    are left out, as they're covered by the fingerprints of upstream actions.
+    """
+    attributes = {}
+    for key, attribute in node.attributes.items():
+        if key in IGNORED or isinstance(attribute, (InputAttribute, OutputAttribute)):
+            continue
+        attributes[key] = attribute.serialize()
+    return [node.__class__.__name__, node.match, attributes]
+
+def fingerprint(task, upstream):
+    """
+    Fingerprint of task. upstream maps id() of the actions feeding
+    its scene file to their fingerprints.
+    """
+    state = {}
+    state["context"] = task.context()
+    state["action"] = nodeState(task.action)
+    scenefile = task.action["scenefile"].value
+    state["scenefile"] = nodeState(scenefile) if scenefile else None
+    state["data"] = []
+    if scenefile:
+        for data in scenefile["input"].value:
+            state["data"].append([nodeState(data), upstream.get(id(data["action"].value))])
+    data = json.dumps(state, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+def fileState(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class ActionCache:
+    """
+    Fingerprints and outputs of the actions that last ran successfully,
+    by shot and node name, kept in a json file.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self._changed = False
+        if os.path.exists(filename):
+            with open(filename) as infile:
+                self.entries = json.load(infile)
+
+    def _key(self, task):
+        return "{}:{}".format(*task.key)
+
+    def isUpToDate(self, task, fingerprint, outputs):
+        entry = self.entries.get(self._key(task))
+        if not entry or entry["fingerprint"] != fingerprint:
+            return False
+        if sorted(entry["outputs"]) != sorted(outputs):
+            return False
+        for filename, state in entry["outputs"].items():
+            if state is None or fileState(filename) != state:
+                return False
+        return True
+
+    def record(self, task, fingerprint, outputs):
+        entry = {}
+        entry["fingerprint"] = fingerprint
+        entry["outputs"] = dict((x, fileState(x)) for x in outputs)
+        self.entries[self._key(task)] = entry
+        self._changed = True
+
+    def forget(self, task):
+        if self.entries.pop(self._key(task), None):
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        handle, tempname = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(handle, "w") as outfile:
+                json.dump(self.entries, outfile)
+            os.replace(tempname, self.filename)
+        except Exception:
+            os.remove(tempname)
+            raise
+        self._changed = False
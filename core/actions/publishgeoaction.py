@@ -6,6 +6,8 @@ from core import Data
 logger = logging.getLogger(__name__)
 
 class PublishGeoAction(Action):
+    __slots__ = ()
+
     def __init__(self, match):
         super(PublishGeoAction, self).__init__(match)
 
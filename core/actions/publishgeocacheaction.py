@@ -6,6 +6,8 @@ from core import Data
 logger = logging.getLogger(__name__)
 
 class PublishGeocacheAction(Action):
+    __slots__ = ()
+
     def __init__(self, match):
         super(PublishGeocacheAction, self).__init__(match)
 
@@ -6,6 +6,8 @@ from core import Data
 logger = logging.getLogger(__name__)
 
 class PublishLookdevAction(Action):
+    __slots__ = ()
+
     def __init__(self, match):
         super(PublishLookdevAction, self).__init__(match)
 
@@ -7,6 +7,8 @@ from core.attributes import *
 logger = logging.getLogger(__name__)
 
 class RenderAction(Action):
+    __slots__ = ()
+
     def __init__(self, match):
         super(RenderAction, self).__init__(match)
 
@@ -1,14 +1,134 @@
+"""
+Attributes, and the specs and schemas describing them.
+
+What an attribute is (its class, key, whether it's hidden, its enum
+elements and connection callback) lives in an AttributeSpec, separate
+from its value. Specs are interned, so an attribute only keeps its
+parent, its spec and its value. So are the AttributeSchemas listing
+the specs of a node in order, so every node built the same way shares
+one schema to look its attributes up by key.
+"""
 import sys
-import copy
+import types
 
 import logging
 
+from . import registry
+from . import trace
+
 logger = logging.getLogger(__name__)
 
+## Interned enum elements, so nodes share them instead of each having a copy
+_elements = {}
+
+def internElements(elements):
+    if elements is None:
+        return None
+    elements = tuple(elements)
+    return _elements.setdefault(elements, elements)
+
+
+class AttributeSpec:
+    """
+    Everything about an attribute but its value. Get them through
+    AttributeSpec.get(), which hands out one shared spec per description.
+    A callback with method set is a function taking the node first.
+    """
+    __slots__ = ("cls", "key", "hidden", "elements", "callback", "method")
+    _specs = {}
+
+    def __init__(self, cls, key, hidden, elements, callback, method):
+        self.cls = cls
+        self.key = key
+        self.hidden = hidden
+        self.elements = elements
+        self.callback = callback
+        self.method = method
+
+    @classmethod
+    def get(cls, attributeClass, key, hidden=False, elements=None, callback=None, method=False):
+        elements = internElements(elements)
+        description = (attributeClass, key, hidden, elements, callback, method)
+        if isinstance(callback, types.MethodType):
+            ## Bound to some object, so there's nothing to share
+            return cls(*description)
+        spec = cls._specs.get(description)
+        if spec is None:
+            spec = cls._specs.setdefault(description, cls(*description))
+        return spec
+
+    def replaced(self, **changes):
+        description = {}
+        description["attributeClass"] = self.cls
+        description["key"] = self.key
+        description["hidden"] = self.hidden
+        description["elements"] = self.elements
+        description["callback"] = self.callback
+        description["method"] = self.method
+        description.update(changes)
+        return AttributeSpec.get(**description)
+
+
+class AttributeSchema:
+    """
+    The specs of a node's attributes, in order. Adding or changing an
+    attribute moves a node on to another interned schema, so nodes that
+    were built the same way all end up sharing one.
+    """
+    __slots__ = ("specs", "slots", "inputSlots", "outputSlots", "_extended", "_replaced")
+
+    def __init__(self, specs=()):
+        self.specs = specs
+        ## key -> index into specs, and into a node's values
+        self.slots = dict((spec.key, i) for i, spec in enumerate(specs))
+        self.inputSlots = tuple(i for i, spec in enumerate(specs) if issubclass(spec.cls, InputAttribute))
+        self.outputSlots = tuple(i for i, spec in enumerate(specs) if issubclass(spec.cls, OutputAttribute))
+        self._extended = {}
+        self._replaced = {}
+
+    def extended(self, spec):
+        schema = self._extended.get(spec)
+        if schema is None:
+            schema = AttributeSchema(self.specs + (spec,))
+            if not isinstance(spec.callback, types.MethodType):
+                schema = self._extended.setdefault(spec, schema)
+        return schema
+
+    def replaced(self, slot, spec):
+        if self.specs[slot] is spec:
+            return self
+        schema = self._replaced.get((slot, spec))
+        if schema is None:
+            schema = AttributeSchema(self.specs[:slot] + (spec,) + self.specs[slot+1:])
+            if not isinstance(spec.callback, types.MethodType):
+                schema = self._replaced.setdefault((slot, spec), schema)
+        return schema
+
+EMPTY_SCHEMA = AttributeSchema()
+
+def unboundSpec(spec, node):
+    """
+    spec, with a connection callback that's a method of node swapped for
+    the plain function, so nodes of the same class can share it.
+    """
+    callback = spec.callback
+    if isinstance(callback, types.MethodType) and callback.__self__ is node:
+        return spec.replaced(callback=callback.__func__, method=True)
+    return spec
+
+
 class Attribute:
+    __slots__ = ("_parent", "_spec", "_value")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        registry.registerAttributeClass(cls)
+
     def __init__(self, key, value=None, parent=None, hidden=False):
+        self._parent = None
+        self._value = None
         if isinstance(key, str):
-            self.key = str(key)
+            self._spec = AttributeSpec.get(self.__class__, str(key), hidden)
         else:
             logger.error("Attribute names must be strings. Received: " + type(key))
             raise Exception
@@ -17,20 +137,45 @@ class Attribute:
             raise Exception
         self.parent = parent
         self.value = value
-        self.hidden = hidden
+
+    def _setSpec(self, spec):
+        self._spec = spec
+        if self._parent is not None:
+            ## Moves our node on to the schema with the new spec
+            self._parent._specChanged(self)
+
+    def _copy(self, parent):
+        """
+        A copy for a copy of our node. Connection lists are copied,
+        other values are shared.
+        """
+        attribute = self.__class__.__new__(self.__class__)
+        attribute._parent = parent
+        attribute._spec = self._spec
+        value = self._value
+        attribute._value = list(value) if isinstance(value, list) else value
+        return attribute
+
+    @property
+    def key(self):
+        return self._spec.key
+
+    @property
+    def hidden(self):
+        return self._spec.hidden
+
+    @hidden.setter
+    def hidden(self, hidden):
+        self._setSpec(self._spec.replaced(hidden=hidden))
 
     @classmethod
     def deserialize(self, root):
         classname = root["class"]
-        if not classname in dir(sys.modules[__name__]):
+        cls = registry.attributeClass(classname)
+        if not cls:
             logger.error("Asked to deserialize unknown class: " + classname)
             raise Exception
-        
-        if classname == self.__class__.__name__:
-            logger.error("Asked to serialize Attribute, which is an abstract class")
-            raise Exception
 
-        cls = getattr(sys.modules[__name__], classname)
         obj = cls.deserialize(root)
         return obj
 
@@ -41,9 +186,8 @@ class Attribute:
     @parent.setter
     def parent(self, parent):
         if parent == "None":
-            self._parent = None
-        else:
-            self._parent = parent
+            parent = None
+        self._parent = parent
 
     def parentName(self):
         if self.parent:
@@ -51,14 +195,34 @@ class Attribute:
         else:
             return "None"
 
+    def parentGraph(self):
+        """
+        The graph our parent node lives in, if any.
+        """
+        parent = self.parent
+        if parent is None:
+            return None
+        return getattr(parent, "graph", None)
+
     @property
     def value(self):
         return self._value
 
     @value.setter
     def value(self, value):
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        self._valueChanged(oldValue)
+
+    def _valueChanged(self, oldValue):
+        """
+        Lets the graph know, so it can tell its subscribers.
+        """
+        graph = self.parentGraph()
+        if graph:
+            graph._attributeChanged(self, oldValue)
 
     def setValue(self, value):
         """
@@ -99,6 +263,8 @@ class Attribute:
             return "Parent:{} Key:{} Value:{}".format(self.parentName(), self.key, str(self.value))
 
 class BoolAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(BoolAttribute, self).__init__(key=key, value=value, parent=parent, hidden=hidden)
 
@@ -119,29 +285,44 @@ class BoolAttribute(Attribute):
             logger.error("Expected Bool, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        self._valueChanged(oldValue)
 
 class ColorAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(ColorAttribute, self).__init__(key=key, value=value, parent=parent, hidden=hidden)
 
 class EnumAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, elements=[], value=None, parent=None, hidden=False):
-        self.elements = copy.copy(elements)
+        super(EnumAttribute, self).__init__(key=key, parent=parent, hidden=hidden)
+        self.elements = elements
         if len(self.elements):
             self._value = 0
-        else:
-            self._value = None
-        super(EnumAttribute, self).__init__(key=key, parent=parent, hidden=hidden)
+
+    @property
+    def elements(self):
+        return self._spec.elements or ()
+
+    @elements.setter
+    def elements(self, elements):
+        self._setSpec(self._spec.replaced(elements=elements))
 
     def addElement(self, element):
-        self.elements.append(element)
+        self.elements = self.elements + (element,)
         if self._value == None:
             self.value = self.elements.index(element)
 
     def removeElement(self, element):
-        self.elements.remove(element)
+        elements = list(self.elements)
+        elements.remove(element)
+        self.elements = elements
 
     @property
     def value(self):
@@ -152,6 +333,7 @@ class EnumAttribute(Attribute):
 
     @value.setter
     def value(self, value):
+        oldValue = self.value
         if isinstance(value, (bool, type(None))):
             return
         elif isinstance(value, int): 
@@ -166,7 +348,9 @@ class EnumAttribute(Attribute):
                 return
             else:
                 self._value = self.elements.index(value)
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        self._valueChanged(oldValue)
 
     @classmethod
     def deserialize(self, root):
@@ -181,7 +365,7 @@ class EnumAttribute(Attribute):
     def serialize(self):
         root = super(EnumAttribute, self).serialize()
 
-        root["elements"] = self.elements
+        root["elements"] = list(self.elements)
         root["value"] = self._value
         
         return root
@@ -200,6 +384,8 @@ class EnumAttribute(Attribute):
         return True
 
 class FloatAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(FloatAttribute, self).__init__(key, value, parent, hidden)
 
@@ -220,11 +406,16 @@ class FloatAttribute(Attribute):
             logger.error("Expected number, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        self._valueChanged(oldValue)
 
 
 class StringAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(StringAttribute, self).__init__(key, value, parent, hidden)
 
@@ -245,14 +436,18 @@ class StringAttribute(Attribute):
             logger.error("Expected String, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        self._valueChanged(oldValue)
 
 
 class InputAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(InputAttribute, self).__init__(key, value, parent, hidden)
-        self._connectionCallback = None
 
     @classmethod
     def deserialize(self, root):
@@ -277,7 +472,7 @@ class InputAttribute(Attribute):
         return root
 
     def setConnectionCallback(self, callback):
-        self._connectionCallback = callback
+        self._setSpec(self._spec.replaced(callback=callback, method=False))
 
     def isLegalConnection(self, connection):
         logger.debug("Checking connection legality")
@@ -290,9 +485,12 @@ class InputAttribute(Attribute):
             logger.debug("Connection would cause a loop.")
             return False
 
-        logger.debug("Connection callback: {}".format(self._connectionCallback))
-        if callable(self._connectionCallback):
-            return self._connectionCallback(connection)
+        spec = self._spec
+        logger.debug("Connection callback: %s", spec.callback)
+        if spec.method:
+            return spec.callback(self.parent, connection)
+        if callable(spec.callback):
+            return spec.callback(connection)
         ## Default to all connections being legal
         return True
 
@@ -312,16 +510,58 @@ class InputAttribute(Attribute):
             logger.error("Expected Node, string or None, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        graph = self.parentGraph()
+        if graph:
+            graph._inputChanged(self, [oldValue], [value])
 
 
 class ArrayInputAttribute(InputAttribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(ArrayInputAttribute, self).__init__(key=key, value=value, parent=parent, hidden=hidden)
 
     def append(self, value):
-        self.elements.append(value)
+        """
+        Adds a connection without replacing the existing ones.
+        """
+        self._value.append(value)
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, self._value)
+        graph = self.parentGraph()
+        if graph:
+            graph._inputChanged(self, [], [value])
+
+    def insert(self, index, value):
+        """
+        Adds a connection at index, like list.insert.
+        """
+        self._value.insert(index, value)
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, self._value)
+        graph = self.parentGraph()
+        if graph:
+            graph._inputChanged(self, [], [value])
+
+    def remove(self, value):
+        """
+        Removes a single connection, and returns the index it was at.
+        Matches by identity, since nodes compare equal by content.
+        """
+        for i, element in enumerate(self._value):
+            if element is value:
+                del self._value[i]
+                if trace.logger.isEnabledFor(logging.DEBUG):
+                    trace.valueSet(self, self._value)
+                graph = self.parentGraph()
+                if graph:
+                    graph._inputChanged(self, [value], [])
+                return i
+        logger.warning("{}.{} is not connected to {}".format(self.parentName(), self.key, value))
 
     @classmethod
     def deserialize(self, root):
@@ -340,11 +580,16 @@ class ArrayInputAttribute(InputAttribute):
             logger.error("Expected list or None, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None) or []
         self._value = []
         if value:
             for element in value:
                 self._value.append(element)
+        graph = self.parentGraph()
+        if graph:
+            graph._inputChanged(self, oldValue, self._value)
 
     def isUpstream(self, node):
         if self.value:
@@ -366,6 +611,8 @@ class ArrayInputAttribute(InputAttribute):
         return root
 
 class OutputAttribute(Attribute):
+    __slots__ = ()
+
     def __init__(self, key, value=None, parent=None, hidden=False):
         super(OutputAttribute, self).__init__(key=key, value=value, parent=parent, hidden=hidden)
 
@@ -398,8 +645,11 @@ class OutputAttribute(Attribute):
             logger.error("Expected Node, string or None, got {}".format(type(value)))
             raise Exception
             return
-        logger.debug("{}.{} = {}".format(self.parentName(), self.key, value))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.valueSet(self, value)
+        oldValue = getattr(self, "_value", None)
         self._value = value
+        self._valueChanged(oldValue)
 
     def isUpstream(self, node):
         return self.parent.isUpstream(node)
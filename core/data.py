@@ -2,10 +2,13 @@ import logging
 
 from .node import Node
 from .attributes import *
+from . import registry
 
 logger = logging.getLogger(__name__)
 
 class Data(Node):
+    __slots__ = ()
+
     def __init__(self, match):
         super(Data, self).__init__(match)
         inputAttr = InputAttribute("action", None, hidden=True)
@@ -28,15 +31,14 @@ class Data(Node):
     @classmethod
     def deserialize(cls, root):
         classname = root["class"]
-        if not classname in dir(sys.modules[__name__]):
+        cls = registry.nodeClass(classname, Data)
+        if not cls:
             logger.error("Unable to deserialize. Unknown classname: " + classname)
             raise Exception
 
-        cls = getattr(sys.modules[__name__], classname)
-
         match = root["match"]
 
-        obj = cls(root["match"])
+        obj = cls.create(root["match"])
         obj.name = root["name"]
 
         attributes = root["attributes"]
@@ -52,6 +54,8 @@ class Data(Node):
 
 
 class GeoData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(GeoData, self).__init__(match)
 
@@ -64,6 +68,8 @@ class GeoData(Data):
 
 
 class GeocacheData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(GeocacheData, self).__init__(match)
 
@@ -77,6 +83,8 @@ class GeocacheData(Data):
 
 
 class LookdevData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(LookdevData, self).__init__(match)
 
@@ -88,6 +96,8 @@ class LookdevData(Data):
         return isinstance(connection.parent, PublishLookdevAction)
 
 class PlateData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(PlateData, self).__init__(match)
 
@@ -99,6 +109,8 @@ class PlateData(Data):
         return isinstance(connection.parent, PuclishPlateAction)
 
 class RenderData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(RenderData, self).__init__(match)
 
@@ -110,6 +122,8 @@ class RenderData(Data):
         return isinstance(connection.parent, RenderAction)
 
 class ComprenderData(Data):
+    __slots__ = ()
+
     def __init__(self, match):
        super(ComprenderData, self).__init__(match)
 
@@ -0,0 +1,68 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GraphEvent:
+    """
+    Base class for the changes a Graph reports to its subscribers.
+    Subscribe to GraphEvent to receive everything.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __repr__(self):
+        return "<{}>".format(self.__class__.__name__)
+
+class NodeAddedEvent(GraphEvent):
+    def __init__(self, graph, node):
+        super(NodeAddedEvent, self).__init__(graph)
+        self.node = node
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.node.name)
+
+class NodeRemovedEvent(GraphEvent):
+    def __init__(self, graph, node):
+        super(NodeRemovedEvent, self).__init__(graph)
+        self.node = node
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.node.name)
+
+class NodeRenamedEvent(GraphEvent):
+    def __init__(self, graph, node, oldName):
+        super(NodeRenamedEvent, self).__init__(graph)
+        self.node = node
+        self.oldName = oldName
+
+    def __repr__(self):
+        return "<{} {} -> {}>".format(self.__class__.__name__, self.oldName, self.node.name)
+
+class AttributeChangedEvent(GraphEvent):
+    """
+    A non-connection attribute was set. Connections are
+    reported through ConnectionChangedEvent instead.
+    """
+    def __init__(self, graph, attribute, oldValue):
+        super(AttributeChangedEvent, self).__init__(graph)
+        self.attribute = attribute
+        self.node = attribute.parent
+        self.oldValue = oldValue
+
+    def __repr__(self):
+        return "<{} {}.{}>".format(self.__class__.__name__, self.node.name, self.attribute.key)
+
+class ConnectionChangedEvent(GraphEvent):
+    """
+    An input attribute was connected or disconnected.
+    removed and added hold the upstream nodes involved.
+    """
+    def __init__(self, graph, attribute, removed, added):
+        super(ConnectionChangedEvent, self).__init__(graph)
+        self.attribute = attribute
+        self.node = attribute.parent
+        self.removed = removed
+        self.added = added
+
+    def __repr__(self):
+        return "<{} {}.{}>".format(self.__class__.__name__, self.node.name, self.attribute.key)
@@ -0,0 +1,371 @@
+"""
+Runs the actions in shot graphs, in dependency order.
+
+An action depends on the actions whose data feeds its scene file, so
+for SceneFile -> Action -> Data -> SceneFile -> Action chains the
+second action waits for the first. Actions with nothing left to wait
+for run concurrently, at most maxWorkers at a time, each by the
+executor registered for its class. When an action fails, everything
+downstream of it is skipped, and independent branches carry on. With an
+ActionCache, actions that are up to date aren't run again, see
+core/actioncache.py.
+
+    engine = ExecutionEngine(maxWorkers=8)
+    engine.registerExecutor(Action, LocalExecutor(["run", "{class}", "{shot}", "{node}"]))
+    run = engine.plan(project.shots.values())
+    engine.execute(run)
+"""
+import os
+import queue
+import logging
+import subprocess
+import collections
+import concurrent.futures
+
+from .action import Action
+from . import actioncache
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+## Not run, since nothing changed since it last ran
+UPTODATE = "uptodate"
+
+
+class Task:
+    """
+    One action, run in the context of one shot. Template graphs are
+    shared between shots, so the same action can have a task per shot.
+    """
+    def __init__(self, shot, action):
+        self.shot = shot
+        self.action = action
+        self.dependencies = []
+        self.dependents = []
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.fingerprint = None
+
+    @property
+    def key(self):
+        return (self.shot.name, self.action.name)
+
+    def context(self):
+        """
+        Values for executors to build commands from.
+        """
+        context = {}
+        context["shot"] = self.shot.name
+        context["node"] = self.action.name
+        context["class"] = self.action.__class__.__name__
+        context["match"] = self.action.match
+        context["name"] = self.action.visualName()
+        context["subpart"] = self.action["subpart"].value
+        return context
+
+    def __repr__(self):
+        return "<Task {}:{} {}>".format(self.shot.name, self.action.name, self.state)
+
+
+class Executor:
+    """
+    Runs tasks for the action classes it's registered for. run() is
+    called on a worker thread, returns the task's result and raises
+    when the task fails.
+    """
+    def run(self, task):
+        logger.error("{} can't run {}".format(self.__class__.__name__, task))
+        raise Exception("{} can't run tasks".format(self.__class__.__name__))
+
+    def outputs(self, task):
+        """
+        Files task writes, for telling whether it's up to date.
+        """
+        return []
+
+
+class FunctionExecutor(Executor):
+    """
+    Runs tasks by calling func(task).
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def run(self, task):
+        return self.func(task)
+
+
+class LocalExecutor(Executor):
+    """
+    Runs each task as a local subprocess. command is a list of arguments
+    formatted with Task.context(), or a function returning the arguments
+    for a task. Returns the command's output.
+    """
+    def __init__(self, command, timeout=None, outputs=None):
+        self.command = command
+        self.timeout = timeout
+        ## Formatted like command
+        self._outputs = outputs or []
+
+    def outputs(self, task):
+        context = task.context()
+        return [x.format(**context) for x in self._outputs]
+
+    def arguments(self, task):
+        if callable(self.command):
+            return self.command(task)
+        context = task.context()
+        return [x.format(**context) for x in self.command]
+
+    def run(self, task):
+        arguments = self.arguments(task)
+        logger.debug("Running {}".format(arguments))
+        result = subprocess.run(arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                timeout=self.timeout)
+        output = result.stdout.decode("utf-8", "replace")
+        if result.returncode:
+            logger.error("{} failed with exit code {}".format(task, result.returncode))
+            raise Exception("Exit code {}: {}".format(result.returncode, output[-1000:]))
+        return output
+
+
+def actionDependencies(graph):
+    """
+    Returns (action, upstream actions) for every action in graph,
+    sorted so that upstream actions come first.
+    """
+    upstreamOf = {}
+    actions = [x for x in graph.nodes.values() if isinstance(x, Action)]
+    for action in actions:
+        upstreamOf[id(action)] = []
+    for action in actions:
+        scenefile = action["scenefile"].value
+        if not scenefile:
+            continue
+        for data in scenefile["input"].value:
+            upstream = data["action"].value
+            if id(upstream) in upstreamOf and not any(x is upstream for x in upstreamOf[id(action)]):
+                upstreamOf[id(action)].append(upstream)
+
+    ## Kahn's algorithm
+    waiting = {}
+    dependents = collections.defaultdict(list)
+    ready = collections.deque()
+    for action in actions:
+        waiting[id(action)] = len(upstreamOf[id(action)])
+        for upstream in upstreamOf[id(action)]:
+            dependents[id(upstream)].append(action)
+        if not waiting[id(action)]:
+            ready.append(action)
+    ordered = []
+    while ready:
+        action = ready.popleft()
+        ordered.append((action, upstreamOf[id(action)]))
+        for dependent in dependents[id(action)]:
+            waiting[id(dependent)] -= 1
+            if not waiting[id(dependent)]:
+                ready.append(dependent)
+    if len(ordered) != len(actions):
+        logger.error("Actions depend on each other in a loop")
+        raise Exception
+    return ordered
+
+
+class ExecutionRun:
+    """
+    The tasks of a planned run, in dependency order, and how far along they are.
+    """
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.total = len(tasks)
+        self.finished = 0
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Lets running tasks finish, and skips the rest.
+        """
+        self.cancelled = True
+
+    def tasksInState(self, state):
+        return [x for x in self.tasks if x.state == state]
+
+    def succeeded(self):
+        return all(x.state in (DONE, UPTODATE) for x in self.tasks)
+
+
+class ExecutionEngine:
+    def __init__(self, maxWorkers=None, cache=None):
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.cache = cache
+        ## Action class -> Executor
+        self._executors = {}
+
+    def registerExecutor(self, actionClass, executor):
+        """
+        Runs actions of actionClass, and its subclasses unless they
+        have an executor of their own, with executor.
+        """
+        self._executors[actionClass] = executor
+
+    def executor(self, action):
+        for cls in action.__class__.__mro__:
+            executor = self._executors.get(cls)
+            if executor:
+                return executor
+        return None
+
+    def plan(self, shots):
+        """
+        Creates the tasks for every action in shots, sorted so that
+        dependencies come first.
+        """
+        shots = list(shots)
+        tasks = []
+        ## Shots sharing a template's graph share its ordering too
+        orderings = {}
+        for shot in shots:
+            ## Read only, so shots sharing a graph keep sharing it
+            graph = shot.readGraph()
+            if graph is None:
+                continue
+            if id(graph) not in orderings:
+                orderings[id(graph)] = actionDependencies(graph)
+            taskForNode = {}
+            for action, upstream in orderings[id(graph)]:
+                task = Task(shot, action)
+                for node in upstream:
+                    dependency = taskForNode[id(node)]
+                    task.dependencies.append(dependency)
+                    dependency.dependents.append(task)
+                taskForNode[id(action)] = task
+                tasks.append(task)
+                if self.cache:
+                    upstream = dict((id(x.action), x.fingerprint) for x in task.dependencies)
+                    task.fingerprint = actioncache.fingerprint(task, upstream)
+
+        logger.info("Planned {} tasks across {} shots".format(len(tasks), len(shots)))
+        return ExecutionRun(tasks)
+
+    def _isUpToDate(self, task, executor):
+        if not self.cache:
+            return False
+        ## Like make, anything downstream of an action that ran runs too
+        if any(x.state != UPTODATE for x in task.dependencies):
+            return False
+        return self.cache.isUpToDate(task, task.fingerprint, executor.outputs(task))
+
+    def wouldRun(self, run):
+        """
+        The tasks in a planned run that executing it would actually run.
+        """
+        stale = set()
+        tasks = []
+        for task in run.tasks:
+            executor = self.executor(task.action)
+            if executor and self.cache and not any(id(x) in stale for x in task.dependencies) and \
+                    self.cache.isUpToDate(task, task.fingerprint, executor.outputs(task)):
+                continue
+            stale.add(id(task))
+            tasks.append(task)
+        return tasks
+
+    def run(self, shots):
+        run = self.plan(shots)
+        self.execute(run)
+        return run
+
+    def execute(self, run):
+        """
+        Runs the tasks in run, blocking until they're all finished or skipped.
+        """
+        waiting = {}
+        ready = collections.deque()
+        for task in run.tasks:
+            waiting[id(task)] = len(task.dependencies)
+            if not task.dependencies:
+                ready.append(task)
+
+        ## Workers report back through here, so finishing a task costs
+        ## the same however many tasks are in the run
+        finished = queue.Queue()
+        running = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while ready or running:
+                while ready and running < self.maxWorkers and not run.cancelled:
+                    task = ready.popleft()
+                    executor = self.executor(task.action)
+                    if executor is None:
+                        logger.error("No executor for {}".format(task.action.__class__.__name__))
+                        task.error = "No executor for {}".format(task.action.__class__.__name__)
+                        self._failed(run, task)
+                        continue
+                    if self._isUpToDate(task, executor):
+                        task.state = UPTODATE
+                        run.finished += 1
+                        self._release(task, waiting, ready)
+                        continue
+                    task.state = RUNNING
+                    future = pool.submit(executor.run, task)
+                    future.add_done_callback(lambda future, task=task: finished.put((task, future)))
+                    running += 1
+
+                if run.cancelled:
+                    for task in ready:
+                        task.state = SKIPPED
+                        task.error = "Cancelled"
+                        run.finished += 1
+                    ready.clear()
+                if not running:
+                    continue
+
+                task, future = finished.get()
+                running -= 1
+                try:
+                    task.result = future.result()
+                except Exception as e:
+                    logger.error("{} failed: {}".format(task, e))
+                    task.error = str(e) or e.__class__.__name__
+                    self._failed(run, task)
+                    continue
+
+                task.state = DONE
+                run.finished += 1
+                if self.cache:
+                    self.cache.record(task, task.fingerprint, self.executor(task.action).outputs(task))
+                self._release(task, waiting, ready)
+
+        for task in run.tasks:
+            if task.state == PENDING:
+                task.state = SKIPPED
+                task.error = "Cancelled"
+                run.finished += 1
+        if self.cache:
+            self.cache.save()
+        return run
+
+    def _release(self, task, waiting, ready):
+        for dependent in task.dependents:
+            waiting[id(dependent)] -= 1
+            if not waiting[id(dependent)] and dependent.state == PENDING:
+                ready.append(dependent)
+
+    def _failed(self, run, task):
+        task.state = FAILED
+        run.finished += 1
+        if self.cache:
+            self.cache.forget(task)
+        stack = list(task.dependents)
+        while stack:
+            dependent = stack.pop()
+            if dependent.state != PENDING:
+                continue
+            dependent.state = SKIPPED
+            dependent.error = "Upstream {} failed".format(task.action.name)
+            run.finished += 1
+            stack.extend(dependent.dependents)
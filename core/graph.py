@@ -1,36 +1,480 @@
+import bisect
 import logging
 import sys
+import weakref
+from contextlib import contextmanager
 
 from core import actions
 from core import scenefiles
 from core import data
 from core import Node
+from core.node import contentDigest
+from core import registry
+from core import trace
 from core.attributes import *
+from core.events import *
 
 logger = logging.getLogger(__name__)
 
+## Node hashes are summed modulo this into the graph's hash
+HASH_MODULUS = 2 ** 160
+
+def splitName(name):
+    """
+    Splits a node name into its basename and trailing number,
+    so that "name22" becomes ("name", 22). Names without a number
+    give None as their number.
+    """
+    i = len(name)
+    while i > 0 and name[i-1].isnumeric():
+        i -= 1
+    if i == len(name):
+        return name, None
+    return name[:i], int(name[i:])
+
+def _callbackReference(func, weak):
+    """
+    Wraps a callback so that calling the result gives back func,
+    or None once a weakly referenced func has been garbage collected.
+    """
+    if not weak:
+        return lambda: func
+    if hasattr(func, "__self__") and hasattr(func, "__func__"):
+        return weakref.WeakMethod(func)
+    return weakref.ref(func)
+
 class Graph:
+    ## Projects hold a graph per shot, most of them small
+    __slots__ = ("nodes", "dirty", "_graphChangedCallbacks", "_subscribers", "_batchDepth",
+                 "_batchChanged", "_batchEvents", "_nextOrder", "_orderValid", "_orderDirty",
+                 "_nameIndex", "_hashTotal", "_staleNodes", "_contentHash", "__weakref__")
+
     def __init__(self):
         self.nodes = {}
-        self._graphChangedCallbacks = []
+        ## Set by any edit, cleared when the graph is saved
+        self.dirty = False
+        ## Lists once anything's added, as most graphs never get any
+        self._graphChangedCallbacks = ()
+        self._subscribers = ()
+        self._batchDepth = 0
+        self._batchChanged = False
+        self._batchEvents = None
+        ## The per node indexes are kept on the nodes themselves, rather
+        ## than in dicts keyed by id, as that's most of a graph's memory.
+        ## Reverse adjacency: node._consumers lists the nodes with inputs
+        ## connected to node, once per connection, or is None when there are
+        ## none. Nodes rather than attributes, so that loading a graph
+        ## doesn't have to make attribute objects for every connection.
+        ## Topological order: node._rank, upstream nodes rank lower.
+        ## Kept up to date incrementally (Pearce & Kelly) as connections are
+        ## made, so loop checks only have to look between two ranks.
+        self._nextOrder = 0
+        self._orderValid = True
+        self._orderDirty = False
+        ## basename -> [starts, ends] of the sorted runs of numbers in use,
+        ## so the first free number after any other is a single bisect away.
+        ## Only built once a name clashes, which loaded graphs never do.
+        self._nameIndex = None
+        ## Merkle hash: the sum of the node hashes. Summing makes the total
+        ## independent of node order, and lets an edit swap out just the
+        ## hashes that went stale instead of rehashing everything. A node's
+        ## _stale is False while its _hash is in the total, True while it's
+        ## waiting in _staleNodes to be hashed again, and None otherwise.
+        self._hashTotal = 0
+        self._staleNodes = None
+        self._contentHash = None
 
     def graphChanged(self):
-        for func in self._graphChangedCallbacks:
-            if callable(func):
+        if self._batchDepth:
+            self._batchChanged = True
+            return
+        for reference in list(self._graphChangedCallbacks):
+            func = reference()
+            if func is None:
+                if reference in self._graphChangedCallbacks:
+                    self._graphChangedCallbacks.remove(reference)
+            elif callable(func):
                 func()
 
-    def addGraphChangedCallback(self, func):
-        if func not in self._graphChangedCallbacks:
-            self._graphChangedCallbacks.append(func)
+    def subscribe(self, func, eventTypes=GraphEvent, weak=False):
+        """
+        Calls func with a GraphEvent for every change made to the graph.
+        eventTypes is an event class, or a tuple of them, to filter on.
+        With weak set, the graph doesn't keep func (or the object of a bound
+        method) alive, and the subscription goes away along with it.
+        """
+        if not self._subscribers:
+            self._subscribers = []
+        self._subscribers.append((_callbackReference(func, weak), eventTypes))
+
+    def unsubscribe(self, func):
+        self._subscribers = [x for x in self._subscribers if x[0]() not in (func, None)]
+
+    def _emit(self, event):
+        if self._batchDepth:
+            if self._batchEvents is None:
+                self._batchEvents = []
+            self._batchEvents.append(event)
+            return
+        for subscriber in list(self._subscribers):
+            reference, eventTypes = subscriber
+            ## Checked before the filter, so subscribers to rare events get dropped too
+            func = reference()
+            if func is None:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+            elif isinstance(event, eventTypes):
+                func(event)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups a set of edits, so that graphChanged callbacks fire once
+        when the outermost batch ends instead of once per edit.
+        Events are held back until then too, and delivered in order.
+
+            with graph.batch():
+                for node in nodes:
+                    graph.addNode(node)
+        """
+        self._batchDepth += 1
+        try:
+            yield self
+        finally:
+            self._batchDepth -= 1
+            if not self._batchDepth:
+                events = self._batchEvents or ()
+                self._batchEvents = None
+                for event in events:
+                    self._emit(event)
+                if self._batchChanged:
+                    self._batchChanged = False
+                    self.graphChanged()
+
+    def addGraphChangedCallback(self, func, weak=False):
+        if func not in [x() for x in self._graphChangedCallbacks]:
+            if not self._graphChangedCallbacks:
+                self._graphChangedCallbacks = []
+            self._graphChangedCallbacks.append(_callbackReference(func, weak))
+
+    def removeGraphChangedCallback(self, func):
+        self._graphChangedCallbacks = [x for x in self._graphChangedCallbacks if x() not in (func, None)]
 
     def clear(self):
+        removed = list(self.nodes.values())
+        self.dirty = True
         self.nodes.clear()
+        self._nextOrder = 0
+        self._orderValid = True
+        self._orderDirty = False
+        self._nameIndex = None
+        self._hashTotal = 0
+        self._staleNodes = None
+        self._contentHash = None
+        for node in removed:
+            node.graph = None
+            node._hash = None
+            node._rank = None
+            node._consumers = None
+            node._stale = None
+            if self._subscribers:
+                self._emit(NodeRemovedEvent(self, node))
         self.graphChanged()
 
+    def consumers(self, node):
+        """
+        Returns the input attributes in this graph that are connected to node.
+        An array input connected to the same node twice is listed twice.
+        """
+        attributes = []
+        for consumer in self.downstream(node):
+            for slot in consumer._schema.inputSlots:
+                attribute = consumer._attributes[slot]
+                value = attribute._value
+                for upstream in value if isinstance(value, list) else [value]:
+                    if upstream is node:
+                        attributes.append(attribute)
+        return attributes
+
+    def downstream(self, node):
+        """
+        Returns the nodes in this graph that take node as an input.
+        """
+        nodes = []
+        seen = set()
+        for consumer in node._consumers or ():
+            if id(consumer) not in seen:
+                seen.add(id(consumer))
+                nodes.append(consumer)
+        return nodes
+
+    def _inputChanged(self, attribute, removed, added):
+        """
+        Called by input attributes when their connections change,
+        so we can keep the reverse index up to date.
+        """
+        node = attribute.parent
+        if self.nodes.get(node.name) is not node:
+            return
+        self.dirty = True
+        self._invalidateHash(node)
+        for upstream in removed:
+            self._removeConsumer(upstream, attribute)
+        for upstream in added:
+            self._addConsumer(upstream, attribute)
+        if self._subscribers:
+            removed = [x for x in removed if isinstance(x, Node)]
+            added = [x for x in added if isinstance(x, Node)]
+            self._emit(ConnectionChangedEvent(self, attribute, removed, added))
+
+    def _attributeChanged(self, attribute, oldValue):
+        """
+        Called by attributes when their value is set.
+        """
+        node = attribute.parent
+        if self.nodes.get(node.name) is not node:
+            return
+        self.dirty = True
+        self._invalidateHash(node)
+        if self._subscribers:
+            self._emit(AttributeChangedEvent(self, attribute, oldValue))
+
+    def markClean(self):
+        self.dirty = False
+
+    def _invalidateHash(self, node):
+        """
+        Forgets the hashes of node and everything downstream of it.
+        A node whose hash is already gone has nothing downstream left to forget.
+        """
+        self._contentHash = None
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current._hash is None and current._stale:
+                continue
+            if current._stale is False:
+                self._hashTotal -= int(current._hash, 16)
+            current._hash = None
+            if not current._stale:
+                current._stale = True
+                if self._staleNodes is None:
+                    self._staleNodes = []
+                self._staleNodes.append(current)
+            stack.extend(self.downstream(current))
+
+    def contentHash(self):
+        """
+        Hash of every node in the graph. Graphs that hash the same are
+        equal. Only the nodes changed since the last call, and whatever is
+        downstream of them, get hashed again.
+        """
+        if self._contentHash is not None:
+            return self._contentHash
+        ## Upstream first, so hashing a node never has to recurse far
+        self._ensureOrder()
+        stale = sorted(self._staleNodes or (), key=lambda x: x._rank or 0)
+        self._staleNodes = None
+        for node in stale:
+            ## Nodes removed, or added back and listed twice, are skipped
+            if not node._stale or self.nodes.get(node.name) is not node:
+                continue
+            self._hashTotal += int(node.contentHash(), 16)
+            node._stale = False
+        self._hashTotal %= HASH_MODULUS
+        self._contentHash = contentDigest(["Graph", len(self.nodes), self._hashTotal])
+        return self._contentHash
+
+    def _addConsumer(self, upstream, attribute):
+        if isinstance(upstream, Node):
+            if upstream._consumers is None:
+                upstream._consumers = [attribute.parent]
+            else:
+                upstream._consumers.append(attribute.parent)
+            self._orderEdge(upstream, attribute.parent)
+
+    def _removeConsumer(self, upstream, attribute):
+        if not isinstance(upstream, Node):
+            return
+        consumers = upstream._consumers
+        if not consumers:
+            return
+        for i, consumer in enumerate(consumers):
+            if consumer is attribute.parent:
+                del consumers[i]
+                break
+        if not consumers:
+            upstream._consumers = None
+        if not self._orderValid:
+            self._orderDirty = True
+
+    def _connectedNodes(self, attribute):
+        value = attribute.value
+        if isinstance(value, list):
+            return value
+        return [value]
+
+    def _indexNode(self, node):
+        for attribute in node.inputs():
+            for upstream in self._connectedNodes(attribute):
+                self._addConsumer(upstream, attribute)
+
+    def _unindexNode(self, node):
+        for attribute in node.inputs():
+            for upstream in self._connectedNodes(attribute):
+                self._removeConsumer(upstream, attribute)
+        node._rank = None
+
+    def isUpstream(self, upstream, node):
+        """
+        True if upstream is node, or feeds into it through any chain
+        of connections. Only nodes in between the two in the topological
+        order need to be visited.
+        """
+        if upstream is node:
+            return True
+        self._ensureOrder()
+        upperBound = self._rankOf(node)
+        lowerBound = self._rankOf(upstream)
+        if not self._orderValid or upperBound is None or lowerBound is None:
+            return node._searchUpstream(upstream)
+        if lowerBound > upperBound:
+            return False
+        found, visited = self._searchDownstream(upstream, upperBound, node)
+        return found
+
+    def wouldCreateLoop(self, upstream, node):
+        """
+        True if connecting upstream into one of node's inputs would make a loop.
+        """
+        return self.isUpstream(node, upstream)
+
+    def _rankOf(self, node):
+        return node._rank if node.graph is self else None
+
+    def _ensureOrder(self):
+        if self._orderValid or not self._orderDirty:
+            return
+        self._orderDirty = False
+        self._rebuildOrder()
+
+    def _rebuildOrder(self):
+        """
+        Recomputes the topological order from scratch (Kahn's algorithm).
+        Only needed after the graph has contained a loop.
+        """
+        indegree = {}
+        for node in self.nodes.values():
+            indegree[id(node)] = len([x for x in node.upstreamNodes() if self.nodes.get(x.name) is x])
+        ready = [x for x in self.nodes.values() if not indegree[id(x)]]
+        order = {}
+        while ready:
+            node = ready.pop()
+            order[id(node)] = len(order)
+            for consumer in self.downstream(node):
+                if id(consumer) not in indegree:
+                    continue
+                indegree[id(consumer)] -= len([x for x in consumer.upstreamNodes() if x is node])
+                if not indegree[id(consumer)]:
+                    ready.append(consumer)
+        if len(order) != len(self.nodes):
+            logger.debug("Graph still contains a loop. Keeping unordered.")
+            return
+        for node in self.nodes.values():
+            node._rank = order[id(node)]
+        self._nextOrder = len(order)
+        self._orderValid = True
+
+    def _orderEdge(self, upstream, node):
+        """
+        Restores the topological order after a connection upstream -> node
+        has been added. Nodes outside the affected region keep their rank.
+        """
+        if not self._orderValid:
+            return
+        upperBound = self._rankOf(upstream)
+        lowerBound = self._rankOf(node)
+        if upperBound is None or lowerBound is None:
+            return
+        if upperBound < lowerBound:
+            return
+
+        found, forward = self._searchDownstream(node, upperBound, upstream)
+        if found:
+            logger.warning("Connecting {} to {} created a loop".format(upstream.name, node.name))
+            self._orderValid = False
+            return
+        backward = self._searchUpstream(upstream, lowerBound)
+
+        backward.sort(key=lambda x: x._rank)
+        forward.sort(key=lambda x: x._rank)
+        affected = backward + forward
+        ranks = sorted(x._rank for x in affected)
+        for x, rank in zip(affected, ranks):
+            x._rank = rank
+
+    def _searchDownstream(self, start, upperBound, target=None):
+        """
+        Visits everything downstream of start ranked no higher than upperBound.
+        Returns whether target was reached, and the visited nodes.
+        """
+        visited = {id(start): start}
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            for consumer in self.downstream(current):
+                if consumer is target:
+                    return True, list(visited.values())
+                rank = consumer._rank if consumer.graph is self else None
+                if rank is None or rank > upperBound or id(consumer) in visited:
+                    continue
+                visited[id(consumer)] = consumer
+                stack.append(consumer)
+        return False, list(visited.values())
+
+    def _searchUpstream(self, start, lowerBound):
+        """
+        Visits everything upstream of start ranked no lower than lowerBound.
+        """
+        visited = {id(start): start}
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            for upstream in current.upstreamNodes():
+                rank = upstream._rank if upstream.graph is self else None
+                if rank is None or rank < lowerBound or id(upstream) in visited:
+                    continue
+                visited[id(upstream)] = upstream
+                stack.append(upstream)
+        return list(visited.values())
+
+    def copyNodes(self, nodes):
+        """
+        Adds copies of nodes from another graph, connected to each other
+        like the originals are. Connections to anything else are left out.
+        Copies share attribute specs and values with their originals, see
+        Node._clone, so nothing is deserialized. Returns the copies, in order.
+        """
+        copies = {}
+        for node in nodes:
+            copies[id(node)] = node._clone(node.match)
+        for copy in copies.values():
+            for attribute in copy.inputs():
+                value = attribute._value
+                if isinstance(value, list):
+                    attribute._value = [copies[id(x)] for x in value if id(x) in copies]
+                elif value is not None:
+                    attribute._value = copies.get(id(value))
+        with self.batch():
+            for copy in copies.values():
+                self.addNode(copy)
+        return list(copies.values())
+
     def paste(self, data):
         tempGraph = Graph.deserialize(data)
-        for node in tempGraph.nodes.values():
-            self.addNode(node)
+        with self.batch():
+            for node in list(tempGraph.nodes.values()):
+                self.addNode(node)
 
     def createUniqueName(self, name):
         """
@@ -42,65 +486,195 @@ class Graph:
         if name not in self.nodes:
             return name
 
-        ## It's not unique, so we increment a number at the end until it's unique
-        ## First we have to check if it already ends with a number,
-        ## so that "name22" increments to "name23" and not "name221"
-        basename = name
-        number = 1
-        for i in range(0, len(name)):
-            tail = name[len(name)-(i+1):]
-            if tail.isnumeric():
-                number = int(tail)
-                basename = name[:len(name)-(i+1)]
-            else:
-                break
+        ## It's not unique, so we increment the number at the end,
+        ## so that "name22" increments to "name23" and not "name221".
+        ## Rather than probing every number we look up the run of numbers
+        ## in use that the number falls in, and take the one after it.
+        basename, number = splitName(name)
+        if number is None:
+            number = 1
+        if self._nameIndex is None:
+            self._nameIndex = {}
+            for other in self.nodes:
+                self._claimName(other)
+        runs = self._nameIndex.get(basename)
+        if runs:
+            starts, ends = runs
+            i = bisect.bisect_right(starts, number) - 1
+            if i >= 0 and ends[i] >= number:
+                number = ends[i] + 1
         newname = basename + str(number)
         while(newname in self.nodes):
             number += 1
             newname = basename + str(number)
         return newname
 
+    def _indexedNumber(self, name):
+        """
+        Basename and number of name, if it's one createUniqueName could
+        have made. Numbers with leading zeros don't count.
+        """
+        basename, number = splitName(name)
+        if number is None or name[len(basename):] != str(number):
+            return basename, None
+        return basename, number
+
+    def _claimName(self, name):
+        if self._nameIndex is None:
+            return
+        basename, number = self._indexedNumber(name)
+        if number is None:
+            return
+        starts, ends = self._nameIndex.setdefault(basename, [[], []])
+        i = bisect.bisect_right(starts, number) - 1
+        if i >= 0 and ends[i] >= number:
+            return
+        joinsLeft = i >= 0 and ends[i] == number - 1
+        joinsRight = i + 1 < len(starts) and starts[i+1] == number + 1
+        if joinsLeft and joinsRight:
+            ends[i] = ends[i+1]
+            del starts[i+1]
+            del ends[i+1]
+        elif joinsLeft:
+            ends[i] = number
+        elif joinsRight:
+            starts[i+1] = number
+        else:
+            starts.insert(i + 1, number)
+            ends.insert(i + 1, number)
+
+    def _releaseName(self, name):
+        if self._nameIndex is None:
+            return
+        basename, number = self._indexedNumber(name)
+        runs = self._nameIndex.get(basename)
+        if number is None or not runs:
+            return
+        starts, ends = runs
+        i = bisect.bisect_right(starts, number) - 1
+        if i < 0 or ends[i] < number:
+            return
+        start, end = starts[i], ends[i]
+        if start == end:
+            del starts[i]
+            del ends[i]
+            if not starts:
+                del self._nameIndex[basename]
+        elif number == start:
+            starts[i] = number + 1
+        elif number == end:
+            ends[i] = number - 1
+        else:
+            ends[i] = number - 1
+            starts.insert(i + 1, number + 1)
+            ends.insert(i + 1, end)
+
     def renameNode(self, node, newname):
-        if node not in self.nodes.values():
+        if self.nodes.get(node.name) is not node:
             logger.error("Asked to rename a node not in the graph")
             raise Exception
-        self.nodes.pop(node.name)
+        oldName = node.name
+        self.nodes.pop(oldName)
+        self._releaseName(oldName)
         newname = self.createUniqueName(newname)
         node._name = newname 
         self.nodes[node.name] = node
+        self._claimName(node.name)
+        self.dirty = True
+        self._invalidateHash(node)
+        if self._subscribers:
+            self._emit(NodeRenamedEvent(self, node, oldName))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.nodeRenamed(self, node, oldName)
 
     def addNode(self, node):
+        if self.nodes.get(node.name) is node:
+            return
         name = self.createUniqueName(node.name)
         node._name = name
         self.nodes[node.name] = node
+        self._claimName(name)
+        self.dirty = True
+        previous = node.graph
+        if previous is not None and previous is not self:
+            ## Moved over from another graph, like when pasting. Its
+            ## indexes there are dropped, keeping what points into this one
+            previous._unindexNode(node)
+            if node._consumers:
+                node._consumers = [x for x in node._consumers if x.graph is self] or None
+        node._hash = None
+        node._stale = None
+        self._invalidateHash(node)
         if node.graph is not self:
             node.setGraph(self)
-        logger.info("Added node: {}".format(node.name))
-        logger.debug("Node list: {}".format(self.nodes.keys()))
+        node._rank = self._nextOrder
+        self._nextOrder += 1
+        self._indexNode(node)
+        for attribute in self.consumers(node):
+            self._orderEdge(node, attribute.parent)
+        if self._subscribers:
+            self._emit(NodeAddedEvent(self, node))
+        if trace.logger.isEnabledFor(logging.DEBUG):
+            trace.nodeAdded(self, node)
         self.graphChanged()
 
     def removeNode(self, node):
-        for key, value in self.nodes.items():
-            if value == node:
-                del self.nodes[key]
-                self.graphChanged()
-                return
+        return self.removeNodes([node])
+
+    def removeNodes(self, nodes):
+        """
+        Removes nodes from the graph, disconnecting them from anything
+        left downstream. Returns the (attribute, node, index) connections
+        that were broken, in order, so that callers like undo can restore
+        them by going through them in reverse. index is where node was
+        in an array input, and None for other inputs.
+        """
+        removed = []
+        for node in nodes:
+            if self.nodes.get(node.name) is node:
+                del self.nodes[node.name]
+                removed.append(node)
+        if not removed:
+            return []
+        self.dirty = True
+
+        for node in removed:
+            self._releaseName(node.name)
+            self._unindexNode(node)
+            if node._stale is False:
+                self._hashTotal -= int(node._hash, 16)
+            node._stale = None
+        self._contentHash = None
+
+        ## Whatever still consumes the removed nodes lives outside the selection
+        disconnected = []
+        for node in removed:
+            for attribute in self.consumers(node):
+                if isinstance(attribute, ArrayInputAttribute):
+                    index = attribute.remove(node)
+                else:
+                    index = None
+                    attribute.value = None
+                disconnected.append((attribute, node, index))
+
+        for node in removed:
+            node.graph = None
+            node._hash = None
+            if self._subscribers:
+                self._emit(NodeRemovedEvent(self, node))
+            if trace.logger.isEnabledFor(logging.DEBUG):
+                trace.nodeRemoved(self, node)
+        logger.info("Removed {} nodes".format(len(removed)))
+        self.graphChanged()
+        return disconnected
 
     def createNode(self, classname, match):
-        module = None
-        if classname in dir(scenefiles):
-            module = scenefiles
-        elif classname in dir(actions):
-            module = actions
-        elif classname in dir(data):
-            module = data
-
-        if not module:
+        cls = registry.nodeClass(classname)
+        if not cls:
             logger.error("Unable to find Node class: {nm}".format(nm=classname))
             raise Exception
 
-        cls = getattr(module, classname)
-        node = cls(match)
+        node = cls.create(match)
         self.addNode(node)
         return node
 
@@ -112,6 +686,21 @@ class Graph:
             root["nodes"].append(node.serialize())
         return root
 
+    def snapshot(self):
+        """
+        A function returning what serialize() would return now. Nodes
+        are copied rather than serialized, which is much quicker, so the
+        function can be called from another thread while the graph keeps
+        changing.
+        """
+        nodes = [x.snapshot() for x in self.nodes.values()]
+        def serialize():
+            root = {}
+            root["class"] = "Graph"
+            root["nodes"] = [x.serialize() for x in nodes]
+            return root
+        return serialize
+
     @classmethod
     def deserialize(cls, root):
         classname = root["class"]
@@ -120,48 +709,47 @@ class Graph:
             raise Exception
 
         graph = Graph()
-        for node in root["nodes"]:
-            classname = node["class"]
-            logger.debug("Deserializing {} object".format(classname))
-            module = None
-            if classname in dir(scenefiles):
-                module = scenefiles
-            elif classname in dir(actions):
-                module = actions
-            elif classname in dir(data):
-                module = data
-            if not module:
-                logger.error("Unable to find Node class: {nm}".format(nm=classname))
-                raise Exception
-
-            cls = getattr(module, classname)
-            obj = cls.deserialize(node)
-            graph.addNode(obj)
+        with graph.batch():
+            for node in root["nodes"]:
+                classname = node["class"]
+                logger.debug("Deserializing %s object", classname)
+                cls = registry.nodeClass(classname)
+                if not cls:
+                    logger.error("Unable to find Node class: {nm}".format(nm=classname))
+                    raise Exception
+
+                obj = cls.deserialize(node)
+                graph.addNode(obj)
         
-        ## Connection attributes will deserialize to strings.
-        ## So after all nodes are initialized we hook them up
-        ## TODO: There's probably a smarter/cleaner way to do this
-
-        for node in graph.nodes.values():
-            for attribute in node.attributes.values():
-                ## Update: Uhm, now things have truly gotten messy
-                ## Will clean this up very soon (famous last words..)
-                if isinstance(attribute, InputAttribute):
-                    if isinstance(attribute, ArrayInputAttribute):
-                        if attribute.value:
-                            nodelist = []
-                            for nodename in attribute.value:
-                                nodelist.append(graph.nodes[nodename])
-                            attribute.value = nodelist
+            ## Connection attributes will deserialize to strings.
+            ## So after all nodes are initialized we hook them up
+            ## TODO: There's probably a smarter/cleaner way to do this
+
+            for node in graph.nodes.values():
+                for attribute in node.inputs():
+                    ## Update: Uhm, now things have truly gotten messy
+                    ## Will clean this up very soon (famous last words..)
+                    if isinstance(attribute, InputAttribute):
+                        if isinstance(attribute, ArrayInputAttribute):
+                            if attribute.value:
+                                nodelist = []
+                                for nodename in attribute.value:
+                                    nodelist.append(graph.nodes[nodename])
+                                attribute.value = nodelist
+                            else:
+                                attribute.value = []
                         else:
-                            attribute.value = []
-                    else:
-                        nodename = attribute.value
-                        if nodename:
-                            attribute.value = graph.nodes[nodename]
+                            nodename = attribute.value
+                            if nodename:
+                                attribute.value = graph.nodes[nodename]
 
+        graph.markClean()
         return graph
 
     def __eq__(self, other):
+        if not isinstance(other, Graph):
+            return False
+        if self.contentHash() == other.contentHash():
+            return True
         return self.nodes == other.nodes
 
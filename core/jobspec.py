@@ -0,0 +1,166 @@
+"""
+Farm job specs for whole projects.
+
+Walks the shots of a project one at a time, and writes a job with a
+task per action per shot, in Tractor's .alf format or as json. Tasks
+wait on the tasks of the actions feeding their scene files. Output is
+written as it's generated, and shots that weren't loaded are read
+without being kept loaded, so writing a job for thousands of shots
+never holds more than one shot's graph and tasks.
+
+Shots that share a template's graph, without overrides of their own,
+share the tasks of its actions too. They're written for the first of
+those shots and referenced after that: as an Instance in .alf, and
+with "instance" in json.
+
+    python -m core.jobspec show.sg show.alf
+"""
+import json
+import logging
+import argparse
+
+from .execution import Task, actionDependencies
+
+logger = logging.getLogger(__name__)
+
+## Formatted with core.execution.Task.context()
+DEFAULT_COMMAND = ["stuffgrapher-action", "{class}", "{shot}", "{node}"]
+DEFAULT_SERVICE = "PixarRender"
+
+
+class JobTask:
+    def __init__(self, title, shot, command, dependencies, instance=None):
+        self.title = title
+        self.shot = shot
+        self.command = command
+        ## Titles of the tasks this one waits on
+        self.dependencies = dependencies
+        ## Title of the same action's task in an earlier shot sharing the template, if any
+        self.instance = instance
+
+    def serialize(self):
+        root = {}
+        root["title"] = self.title
+        root["shot"] = self.shot
+        if self.instance:
+            root["instance"] = self.instance
+        else:
+            root["command"] = self.command
+            root["dependencies"] = self.dependencies
+        return root
+
+
+def jobTasks(project, command=DEFAULT_COMMAND):
+    """
+    Yields (shot, tasks) for every shot in project, with tasks sorted
+    so that dependencies come first. Shots are only read when reached,
+    and those that weren't loaded yet stay unloaded.
+    """
+    ## (template, action name) -> title of the task that runs it
+    instances = {}
+    ## Orderings of template graphs, which many shots share, by template
+    orderings = {}
+    for shot in project.shots.values():
+        template = shot.parentName() if shot.override is None else None
+        ordering = orderings.get(template) if template else None
+        if ordering is None:
+            graph = shot.readGraph()
+            if graph is None:
+                continue
+            ordering = actionDependencies(graph)
+            if template:
+                orderings[template] = ordering
+
+        tasks = []
+        titles = {}
+        for action, upstream in ordering:
+            title = "{}:{}".format(shot.name, action.name)
+            context = Task(shot, action).context()
+            arguments = [x.format(**context) for x in command]
+            dependencies = [titles[id(x)] for x in upstream]
+            instance = instances.get((template, action.name)) if template else None
+            tasks.append(JobTask(title, shot.name, arguments, dependencies, instance))
+            titles[id(action)] = title
+        ## Only after the whole shot, so instances always refer to an earlier shot
+        if template:
+            for (action, upstream), task in zip(ordering, tasks):
+                instances.setdefault((template, action.name), task.title)
+        yield shot, tasks
+
+
+def _alfWord(word):
+    word = str(word)
+    if word and not any(x in word for x in " \t\n{}\\\"$[];"):
+        return word
+    return "{" + word.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}") + "}"
+
+def writeAlf(project, outfile, command=DEFAULT_COMMAND, service=DEFAULT_SERVICE):
+    """
+    Writes a Tractor job for project to outfile. A task's subtasks are
+    the tasks it waits on. Those already written are Instances.
+    """
+    outfile.write("##AlfredToDo 3.0\n")
+    outfile.write("Job -title {} -subtasks {{\n".format(_alfWord(project.name or "untitled")))
+    for shot, tasks in jobTasks(project, command):
+        taskForTitle = dict((task.title, task) for task in tasks)
+        waitedOn = set(x for task in tasks for x in task.dependencies)
+        written = set()
+        outfile.write("    Task -title {} -subtasks {{\n".format(_alfWord(shot.name)))
+        for task in tasks:
+            if task.title not in waitedOn:
+                _writeAlfTask(outfile, task, taskForTitle, written, service, 2)
+        outfile.write("    }\n")
+    outfile.write("}\n")
+
+def _writeAlfTask(outfile, task, taskForTitle, written, service, depth):
+    indent = "    " * depth
+    if task.instance:
+        outfile.write("{}Instance {}\n".format(indent, _alfWord(task.instance)))
+        return
+    if task.title in written:
+        outfile.write("{}Instance {}\n".format(indent, _alfWord(task.title)))
+        return
+    written.add(task.title)
+    outfile.write("{}Task -title {} -subtasks {{\n".format(indent, _alfWord(task.title)))
+    for title in task.dependencies:
+        _writeAlfTask(outfile, taskForTitle[title], taskForTitle, written, service, depth + 1)
+    outfile.write("{}}} -cmds {{\n".format(indent))
+    outfile.write("{}    RemoteCmd {{{}}} -service {}\n".format(
+                    indent, " ".join(_alfWord(x) for x in task.command), _alfWord(service)))
+    outfile.write("{}}}\n".format(indent))
+
+def writeJson(project, outfile, command=DEFAULT_COMMAND):
+    """
+    Writes a job for project to outfile as json, with a flat list of
+    tasks that refer to the tasks they wait on by title.
+    """
+    outfile.write('{{"title": {}, "tasks": ['.format(json.dumps(project.name)))
+    first = True
+    for shot, tasks in jobTasks(project, command):
+        for task in tasks:
+            if not first:
+                outfile.write(",")
+            first = False
+            outfile.write("\n" + json.dumps(task.serialize()))
+    outfile.write("\n]}\n")
+
+def write(project, filename, command=DEFAULT_COMMAND):
+    """
+    Writes a job for project to filename, as json if it ends with .json
+    and as .alf otherwise.
+    """
+    with open(filename, "w") as outfile:
+        if filename.endswith(".json"):
+            writeJson(project, outfile, command)
+        else:
+            writeAlf(project, outfile, command)
+
+
+if __name__ == "__main__":
+    from . import projectfile
+    parser = argparse.ArgumentParser(description="Write a farm job for every action in a project")
+    parser.add_argument("project")
+    parser.add_argument("destination", help="Written as json if it ends with .json, .alf otherwise")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    write(projectfile.read(args.project), args.destination)
@@ -0,0 +1,320 @@
+"""
+Append-only journal of edits, kept next to a project file.
+
+Every committed edit appends one line of json to <project>.sgj, so a
+crash costs nothing more than opening the last saved project and
+replaying the journal on top of it. Saving the project folds the
+journal into the project file and starts a new one.
+
+Records carry the generation of the project when they were written,
+and saves write a newer one into the file. A crash after the file is
+written but before the journal is dropped leaves records the file
+already has, which replay() skips.
+
+Records hold a list of operations on the graphs of the project's shots
+and templates:
+
+    graph    the whole graph of a shot, for graphs the journal first sees edited
+    add      a serialized node added to a graph
+    remove   the name of a node removed from a graph
+    rename   a node's old and new name
+    set      a serialized attribute, for value and connection changes
+    override the whole override layer of a shot, see core/override.py
+    shots    the names of all templates, and names, parents and
+             whether they have overrides of all shots
+"""
+import os
+import json
+import logging
+import functools
+import weakref
+
+from .graph import Graph
+from .shot import Shot
+from .events import *
+from .override import applyOp, connect
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = ".sgj"
+## Journal being folded into the project by a save still in flight
+SAVING = ".saving"
+
+def journalName(filename):
+    return os.path.splitext(filename)[0] + EXTENSION
+
+
+class Journal:
+    """
+    Records edits to project's graphs in the journal for filename.
+    Nothing is written until commit(), which should be called whenever
+    an edit is done, like when a command is pushed to the undo stack.
+    """
+    def __init__(self, project, filename):
+        self.project = project
+        self.filename = journalName(filename)
+        self._file = None
+        self._pending = []
+        ## (group, shot name) -> (shot, weak reference to its graph or None, callback),
+        ## and id(graph) -> (group, shot name). Graphs are held weakly, so resolved
+        ## overrides nobody's using can go
+        self._watched = {}
+        self._keys = {}
+        self._structure = self._shotStructure()
+        self._scan(record=False)
+
+    def _shotStructure(self):
+        structure = {}
+        structure["templates"] = list(self.project.templates.keys())
+        structure["shots"] = [[name, shot.parentName(), shot.override is not None]
+                                for name, shot in self.project.shots.items()]
+        return structure
+
+    def _scan(self, record=True):
+        """
+        Picks up changes the journal couldn't see through graph events:
+        shots added, removed or renamed, graphs loaded or replaced.
+        Graphs that aren't in memory are left that way, so this is
+        cheap next to the edits it's committing.
+        """
+        structure = self._shotStructure()
+        if record and structure != self._structure:
+            op = {"op": "shots"}
+            op.update(structure)
+            self._pending.append(op)
+        self._structure = structure
+
+        seen = set()
+        for group, shots in (("templates", self.project.templates), ("shots", self.project.shots)):
+            for name, shot in shots.items():
+                ## Inheriting shots share their template's graph, and shots that were
+                ## never loaded are in the project as they are, unless renamed
+                if shot.parentName() and shot.override is None:
+                    continue
+                if not (shot.isLoaded() or shot.isDirty()):
+                    continue
+                key = (group, name)
+                graph = shot.loadedGraph()
+                seen.add(key)
+                watched = self._watched.get(key)
+                if watched and watched[0] is shot and self._watchedGraph(key) is graph:
+                    continue
+                moved = not watched or watched[0] is not shot
+                if watched:
+                    self._unwatch(key)
+                callback = None
+                if graph is not None:
+                    if id(graph) in self._keys and self._watchedGraph(self._keys[id(graph)]) is graph:
+                        ## Moved, like when a shot was renamed
+                        self._unwatch(self._keys[id(graph)])
+                    callback = functools.partial(self._graphEvent, key, shot.override)
+                    graph.subscribe(callback)
+                    self._keys[id(graph)] = key
+                self._watched[key] = (shot, weakref.ref(graph) if graph is not None else None, callback)
+                ## New, renamed or replaced; graphs just loaded are in the project already
+                if record and shot.isDirty() and (moved or graph is not None):
+                    if shot.override is not None:
+                        self._pending.append({"op": "override", "shot": list(key),
+                                              "override": shot.override.serialize()})
+                    else:
+                        if graph is None:
+                            graph = shot.readGraph()
+                        self._pending.append({"op": "graph", "shot": list(key),
+                                              "graph": graph.serialize() if graph is not None else None})
+
+        for key in list(self._watched):
+            if key not in seen:
+                self._unwatch(key)
+
+    def _watchedGraph(self, key):
+        reference = self._watched[key][1]
+        return reference() if reference is not None else None
+
+    def _unwatch(self, key):
+        graph = self._watchedGraph(key)
+        shot, reference, callback = self._watched.pop(key)
+        if graph is not None:
+            graph.unsubscribe(callback)
+            if self._keys.get(id(graph)) == key:
+                del self._keys[id(graph)]
+
+    def _graphEvent(self, key, override, event):
+        if override is not None and override.isResolving():
+            return
+        op = {"shot": list(key)}
+        if isinstance(event, NodeAddedEvent):
+            op["op"] = "add"
+            op["node"] = event.node.serialize()
+        elif isinstance(event, NodeRemovedEvent):
+            op["op"] = "remove"
+            op["node"] = event.node.name
+        elif isinstance(event, NodeRenamedEvent):
+            op["op"] = "rename"
+            op["node"] = event.node.name
+            op["old"] = event.oldName
+        elif isinstance(event, (AttributeChangedEvent, ConnectionChangedEvent)):
+            if event.node is None:
+                return
+            op["op"] = "set"
+            op["node"] = event.node.name
+            op["attribute"] = event.attribute.serialize()
+        else:
+            return
+        self._pending.append(op)
+
+    def commit(self):
+        """
+        Appends everything edited since the last commit as one record.
+        """
+        self._scan()
+        if not self._pending:
+            return
+        if not self._file:
+            self._file = open(self.filename, "a")
+        record = {"generation": self.project.generation, "ops": self._pending}
+        self._pending = []
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def size(self):
+        """
+        Bytes of journal not yet folded into the project.
+        """
+        size = 0
+        for filename in (self.filename + SAVING, self.filename):
+            if os.path.exists(filename):
+                size += os.path.getsize(filename)
+        return size
+
+    def checkpoint(self):
+        """
+        Call as a save takes its snapshot of the project. Records so far
+        are set aside, and dropped by saved() once the save went through.
+        If it didn't, they're kept and replayed along with the rest.
+        """
+        self.commit()
+        self._close()
+        if not os.path.exists(self.filename):
+            return
+        saving = self.filename + SAVING
+        if os.path.exists(saving):
+            with open(self.filename) as infile, open(saving, "a") as outfile:
+                outfile.write(infile.read())
+            os.remove(self.filename)
+        else:
+            os.replace(self.filename, saving)
+
+    def saved(self):
+        saving = self.filename + SAVING
+        if os.path.exists(saving):
+            os.remove(saving)
+
+    def discard(self):
+        """
+        Closes the journal and removes it, for when the edits are
+        either all saved or not wanted.
+        """
+        self.close()
+        for filename in (self.filename + SAVING, self.filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close()
+        for key in list(self._watched):
+            self._unwatch(key)
+
+
+def replay(project, filename):
+    """
+    Applies the journal left next to filename, if any, to project.
+    A record cut short by a crash ends the replay, and records older
+    than the project's generation are already in it.
+    Returns the number of records applied.
+    """
+    name = journalName(filename)
+    count = 0
+    skipped = 0
+    for path in (name + SAVING, name):
+        if not os.path.exists(path):
+            continue
+        with open(path) as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring incomplete journal record in {}".format(path))
+                    return count
+                if record.get("generation", project.generation) < project.generation:
+                    skipped += 1
+                    continue
+                applyRecord(project, record)
+                count += 1
+    if skipped:
+        logger.info("Skipped {} journal records already saved to {}".format(skipped, filename))
+    if count:
+        logger.info("Replayed {} journal records from {}".format(count, name))
+    return count
+
+def applyRecord(project, record):
+    ## Connections are made once the whole record is in, since
+    ## they can point at nodes added later in the record
+    connections = []
+    for op in record["ops"]:
+        if op["op"] == "shots":
+            _applyShots(project, op)
+            continue
+
+        group, name = op["shot"]
+        shots = getattr(project, group)
+        shot = shots.get(name)
+        if op["op"] == "graph":
+            if shot is None:
+                shot = Shot(name)
+                shots[name] = shot
+            if op["graph"]:
+                shot.graph = Graph.deserialize(op["graph"])
+            else:
+                shot.graph = None
+            continue
+        if op["op"] == "override":
+            if shot is None:
+                logger.warning("Journal refers to missing {} {}".format(group, name))
+            else:
+                shot.setOverrideData(op["override"])
+            continue
+
+        if shot is None or shot.graph is None:
+            logger.warning("Journal refers to missing {} {}".format(group, name))
+            continue
+        applyOp(shot.graph, op, connections)
+
+    connect(connections)
+
+def _applyShots(project, op):
+    templates = {}
+    for name in op["templates"]:
+        templates[name] = project.templates.get(name) or Shot(name)
+    project.templates.clear()
+    project.templates.update(templates)
+
+    shots = {}
+    for name, parent, overrides in op["shots"]:
+        shot = project.shots.get(name) or Shot(name)
+        if parent != shot.parentName():
+            if parent:
+                shot.setParentName(parent, project.templates)
+            else:
+                shot.graph = None
+        if overrides and shot.override is None:
+            shot.enableOverrides()
+        elif not overrides and shot.override is not None:
+            shot.disableOverrides()
+        shots[name] = shot
+    project.shots.clear()
+    project.shots.update(shots)
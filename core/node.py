@@ -1,24 +1,145 @@
 import logging
 import json
+import hashlib
+import collections.abc
 
 from .attributes import *
+from . import registry
 
 logger = logging.getLogger(__name__)
 
+def contentDigest(state):
+    """
+    Hash of anything json can encode, the same for equal state.
+    """
+    data = json.dumps(state, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+## Node class -> node built by its __init__, that create() copies
+_prototypes = {}
+
+class AttributeMap(collections.abc.Mapping):
+    """
+    A node's attributes by key, in the order they were added. Setting
+    one replaces the attribute with that key.
+    """
+    __slots__ = ("_node",)
+
+    def __init__(self, node):
+        self._node = node
+
+    def __getitem__(self, key):
+        return self._node._attributes[self._node._schema.slots[key]]
+
+    def __setitem__(self, key, attribute):
+        if key != attribute.key:
+            logger.error("Attribute {} can't be stored as {}".format(attribute.key, key))
+            raise Exception
+        self._node._setAttribute(attribute)
+
+    def __contains__(self, key):
+        return key in self._node._schema.slots
+
+    def __iter__(self):
+        return iter(self._node._schema.slots)
+
+    def __len__(self):
+        return len(self._node._schema.specs)
+
+
+class NodeName:
+    """
+    Stands in for a connected node in a snapshot, by name.
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
 class Node:
     """
     Base class for all node types
     """
+    ## Attributes are kept in a list, looked up by key through a schema
+    ## shared between nodes built the same way. See core/attributes.py
+    __slots__ = ("match", "graph", "_name", "_hash", "_hashing", "_schema", "_attributes",
+                 "_rank", "_consumers", "_stale")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ## Base classes set abstract, so they can't be created by name
+        if not cls.__dict__.get("abstract", False):
+            registry.registerNodeClass(cls)
+
     def __init__(self, match):
-        self.attributes = {}
+        self._schema = EMPTY_SCHEMA
+        self._attributes = []
         self.match = match
         self.graph = None
         self._name = self.__class__.__name__
+        ## Cached contentHash(), cleared by the graph when we or anything upstream changes
+        self._hash = None
+        self._hashing = False
+        ## Indexes the graph keeps on us, see core/graph.py
+        self._rank = None
+        self._consumers = None
+        self._stale = None
         self.addAttribute(OutputAttribute("out", None, hidden=True))
         self.addAttribute(FloatAttribute("pos.x", 0, hidden=True))
         self.addAttribute(FloatAttribute("pos.y", 0, hidden=True))
 
 
+    @classmethod
+    def create(cls, match):
+        """
+        A new node, the same as cls(match) would make, but copied from a
+        prototype built once per class instead of going through __init__.
+        The prototype is built as cls(None), so subclasses' __init__ has
+        to build the same attributes whatever match is, and any state of
+        their own outside of attributes has to be copied in _clone.
+        """
+        prototype = _prototypes.get(cls)
+        if prototype is None:
+            prototype = _prototypes.setdefault(cls, cls(None))
+        return prototype._clone(match)
+
+    def _clone(self, match):
+        """
+        A copy of this node, outside of any graph. Connection lists are
+        copied, other values are shared. Subclasses keeping state of their
+        own that shouldn't be shared copy it here.
+        """
+        node = self.__class__.__new__(self.__class__)
+        node._schema = self._schema
+        node._attributes = [x._copy(node) for x in self._attributes]
+        node.match = match
+        node.graph = None
+        node._name = self._name
+        node._hash = None
+        node._hashing = False
+        node._rank = None
+        node._consumers = None
+        node._stale = None
+        if hasattr(self, "__dict__"):
+            node.__dict__.update(self.__dict__)
+        return node
+
+    def snapshot(self):
+        """
+        A copy of this node as it is now, outside of any graph, for
+        serializing while the node itself keeps changing. Connected
+        nodes are kept by name.
+        """
+        node = self._clone(self.match)
+        for attribute in node._attributes:
+            value = attribute._value
+            if isinstance(value, Node):
+                attribute._value = NodeName(value.name)
+            elif isinstance(value, list):
+                attribute._value = [NodeName(x.name) if isinstance(x, Node) else x for x in value]
+        return node
+
     def visualName(self):
         return self.name
 
@@ -33,52 +154,135 @@ class Node:
         else:
             self._name = value
 
+    @property
+    def attributes(self):
+        return AttributeMap(self)
+
+    def _setAttribute(self, attribute):
+        """
+        Adds attribute, replacing any attribute with the same key.
+        """
+        attribute.parent = self
+        spec = attribute._spec = unboundSpec(attribute._spec, self)
+        slot = self._schema.slots.get(spec.key)
+        if slot is None:
+            slot = len(self._attributes)
+            self._schema = self._schema.extended(spec)
+            self._attributes.append(attribute)
+        else:
+            self._schema = self._schema.replaced(slot, spec)
+            self._attributes[slot] = attribute
+        return slot
+
+    def _specChanged(self, attribute):
+        slot = self._schema.slots.get(attribute.key)
+        if slot is not None and self._attributes[slot] is attribute:
+            spec = attribute._spec = unboundSpec(attribute._spec, self)
+            self._schema = self._schema.replaced(slot, spec)
+
     def addAttribute(self, attribute):
         if not isinstance(attribute, Attribute):
             logger.error("addAttribute takes only Attribute objects. Got " + str(type(attribute)))
             raise Exception
-        if attribute.key in self.attributes:
+        if attribute.key in self._schema.slots:
             logger.warning("Attribute with name {nm} already exists. Ignoring.".format(nm=attribute.key))
             return
-        attribute.parent = self
-        self.attributes[attribute.key] = attribute
+        self._setAttribute(attribute)
+        if self.graph and isinstance(attribute, InputAttribute):
+            self.graph._inputChanged(attribute, [], self.graph._connectedNodes(attribute))
 
     def hasAttribute(self, attributename):
-        return attributename in self.attributes
+        return attributename in self._schema.slots
 
     def setGraph(self, graph):
         self.graph = graph
-        if self not in graph.nodes.values():
+        if graph.nodes.get(self.name) is not self:
             self.graph.addNode(self)
 
     def inputs(self):
-        attrs = []
-        for attribute in self.attributes.values():
-            if isinstance(attribute, InputAttribute):
-                attrs.append(attribute)
-        return attrs
+        return [self._attributes[slot] for slot in self._schema.inputSlots]
 
     def outputs(self):
-        attrs = []
-        for attribute in self.attributes.values():
-            if isinstance(attribute, OutputAttribute):
-                attrs.append(attribute)
-        return attrs
+        return [self._attributes[slot] for slot in self._schema.outputSlots]
+
+    def upstreamNodes(self):
+        """
+        Nodes directly connected to our inputs.
+        """
+        nodes = []
+        for slot in self._schema.inputSlots:
+            value = self._attributes[slot]._value
+            if isinstance(value, list):
+                nodes.extend(x for x in value if isinstance(x, Node))
+            elif isinstance(value, Node):
+                nodes.append(value)
+        return nodes
 
     def isUpstream(self, node):
-        if node == self:
-            return True
-        for connection in self.inputs():
-            if connection.isUpstream(node):
+        """
+        True if node is this node, or is connected into it
+        through any chain of inputs.
+        """
+        if self.graph:
+            return self.graph.isUpstream(node, self)
+        return self._searchUpstream(node)
+
+    def _searchUpstream(self, node):
+        visited = set()
+        stack = [self]
+        while stack:
+            current = stack.pop()
+            if current is node:
                 return True
+            if id(current) in visited:
+                continue
+            visited.add(id(current))
+            stack.extend(current.upstreamNodes())
         return False
 
+    def contentHash(self):
+        """
+        Hash of our class, name, match and attribute values, and of the
+        names and hashes of the nodes connected to our inputs. Nodes
+        that hash the same are equal, and so is everything upstream of them.
+        """
+        if self._hash is not None:
+            return self._hash
+        self._hashing = True
+        try:
+            contentHash = contentDigest(self._hashState())
+        finally:
+            self._hashing = False
+        ## Only kept while we're in a graph, which tells us when it goes stale
+        if self.graph is not None and self.graph.nodes.get(self._name) is self:
+            self._hash = contentHash
+        return contentHash
+
+    def _hashState(self):
+        state = [self.__class__.__name__, self.name, self.match]
+        for attribute in self._attributes:
+            if not isinstance(attribute, InputAttribute):
+                state.append(attribute.serialize())
+                continue
+            value = attribute.value
+            connections = []
+            for upstream in value if isinstance(value, list) else [value]:
+                if not isinstance(upstream, Node):
+                    connections.append(upstream)
+                elif upstream._hashing:
+                    ## Graphs can hold loops while being edited
+                    connections.append([upstream.name, None])
+                else:
+                    connections.append([upstream.name, upstream.contentHash()])
+            state.append([attribute.key, attribute.__class__.__name__, attribute.hidden, connections])
+        return state
+
     @classmethod
     def deserialize(cls, root):
         if root["class"] != "Node":
             logger.error("Wrong deserializer called: " + root["class"])
             raise Exception
-        obj = Node(root["match"])
+        obj = Node.create(root["match"])
         obj.name = root["name"]
 
         attributes = root["attributes"]
@@ -98,15 +302,20 @@ class Node:
         root["class"] = self.__class__.__name__
         root["attributes"] = {}
         root["match"] = self.match
-        for key, value in self.attributes.items():
-            root["attributes"][key] = value.serialize()
+        for attribute in self._attributes:
+            root["attributes"][attribute.key] = attribute.serialize()
         return root
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
-        if self.attributes != other.attributes:
+        if self._hash is not None and self._hash == other._hash:
+            return True
+        if self._schema.slots.keys() != other._schema.slots.keys():
             return False
+        for slot, attribute in enumerate(self._attributes):
+            if attribute != other._attributes[other._schema.slots[attribute.key]]:
+                return False
         if self.match != other.match:
             return False
         return True
@@ -116,3 +325,5 @@ class Node:
 
     def __setitem__(self, key, value):
         self.attributes[key].value = value
+
+registry.registerNodeClass(Node)
@@ -0,0 +1,296 @@
+"""
+Copy-on-write override layers for shots that inherit a template's graph.
+
+A shot with overrides doesn't share its template's graph. It keeps only
+what it changed: nodes it added, template nodes it removed, and template
+attributes it set or reconnected. The graph the shot works with is
+resolved from the template plus those changes, and resolved again once
+the template changes. Edits made to the resolved graph are picked up as
+overrides, so a thousand near identical shots cost a thousand small
+lists of differences.
+
+The resolved graph is only kept for as long as something uses it, like
+a view showing the shot, or until its edits are saved. Resolving copies
+the template's nodes with Graph.copyNodes, sharing their attribute
+specs and values, rather than serializing and deserializing them.
+
+Overrides are stored as the same add, remove and set ops as the journal.
+"""
+import logging
+import weakref
+
+from .graph import Graph
+from .events import *
+from .attributes import Attribute, InputAttribute, ArrayInputAttribute, OutputAttribute
+from . import registry
+
+logger = logging.getLogger(__name__)
+
+class Override:
+    def __init__(self, data=None):
+        ## Serialized overrides, or a function returning them. None while the
+        ## resolved graph holds edits that are newer, until they're saved
+        self._data = data
+        ## The resolved graph while it holds edits, and otherwise a weak
+        ## reference to it, so it goes once nobody's using it
+        self._graph = None
+        self._weakGraph = None
+        self._template = None
+        self._valid = False
+        self._resolving = False
+        ## Set by edits to the resolved graph, cleared on save
+        self.dirty = False
+        ## Names of the nodes the shot added, or replaced, and of the template nodes
+        ## it removed, and the (node, key) of template attributes it changed.
+        ## Dicts are used as ordered sets.
+        self.added = {}
+        self.removed = {}
+        self.attributes = {}
+
+    def graph(self, template):
+        """
+        The template graph with the overrides applied.
+        """
+        if template is not self._template:
+            if self._template is not None:
+                self._template.unsubscribe(self._templateChanged)
+            if template is not None:
+                template.subscribe(self._templateChanged, weak=True)
+            self._template = template
+            self._valid = False
+        if template is None:
+            return None
+        graph = self.resolvedGraph()
+        if graph is None or not self._valid:
+            graph = self._resolve(graph)
+        return graph
+
+    def resolvedGraph(self):
+        """
+        The resolved graph if anything is still using it, without resolving.
+        """
+        if self._graph is not None:
+            return self._graph
+        if self._weakGraph is not None:
+            return self._weakGraph()
+        return None
+
+    def isResolved(self):
+        """
+        False until graph() has been called, or once the graph it
+        returned is gone.
+        """
+        return self.resolvedGraph() is not None
+
+    def isResolving(self):
+        """
+        True while the graph is being rebuilt, for subscribers of the
+        resolved graph to tell rebuilding from edits.
+        """
+        return self._resolving
+
+    def _templateChanged(self, event):
+        self._valid = False
+
+    def _resolve(self, graph):
+        """
+        Resolves into graph, or a new graph if None, and returns it.
+        """
+        ops = self.ops()
+        if graph is None:
+            graph = Graph()
+            graph.subscribe(self._graphEvent)
+        dirty = graph.dirty
+        logger.debug("Resolving overrides on {} template nodes".format(len(self._template.nodes)))
+
+        ## Rebuilt in place, so whoever is looking at the graph sees the changes
+        self._resolving = True
+        ## Added node name -> the name it got, when the template has a node by that name now
+        renamed = {}
+        try:
+            with graph.batch():
+                graph.clear()
+                graph.copyNodes(self._template.nodes.values())
+                connections = []
+                for op in ops:
+                    node = applyOp(graph, op, connections)
+                    if node is not None and node.name != op["node"]["name"]:
+                        logger.warning("Template node {} clashes with the shot's own. Renamed the shot's to {}".format(
+                                        op["node"]["name"], node.name))
+                        renamed[op["node"]["name"]] = node.name
+                connect(connections, renamed)
+        finally:
+            self._resolving = False
+
+        self.added = {}
+        self.removed = {}
+        self.attributes = {}
+        for op in ops:
+            if op["op"] == "add":
+                name = op["node"]["name"]
+                self.added[renamed.get(name, name)] = None
+            elif op["op"] == "remove":
+                self.removed[op["node"]] = None
+            elif op["op"] == "set":
+                self.attributes[(op["node"], op["attribute"]["key"])] = None
+        graph.dirty = dirty
+        self._valid = True
+        if self._graph is None:
+            if renamed:
+                ## The stored ops name the wrong nodes now, so the graph has to be saved
+                self._graph = graph
+                self._data = None
+                self.dirty = True
+            else:
+                self._data = {"class": "Override", "ops": ops}
+                self._weakGraph = weakref.ref(graph)
+        return graph
+
+    def _graphEvent(self, event):
+        if self._resolving:
+            return
+        if self._graph is None:
+            ## Holds the overrides from now on, until they're saved
+            self._graph = event.graph
+            self._data = None
+        self.dirty = True
+        if isinstance(event, NodeAddedEvent):
+            self.added[event.node.name] = None
+        elif isinstance(event, NodeRemovedEvent):
+            name = event.node.name
+            self.added.pop(name, None)
+            if name in self._template.nodes:
+                self.removed[name] = None
+            self._dropAttributes(name)
+        elif isinstance(event, NodeRenamedEvent):
+            if event.oldName in self.added:
+                del self.added[event.oldName]
+            else:
+                ## Renaming a template node makes it the shot's own
+                self.removed[event.oldName] = None
+                self._dropAttributes(event.oldName)
+            self.added[event.node.name] = None
+        elif isinstance(event, (AttributeChangedEvent, ConnectionChangedEvent)):
+            if event.node is None or event.node.name in self.added:
+                return
+            self.attributes[(event.node.name, event.attribute.key)] = None
+
+    def _dropAttributes(self, name):
+        for key in [x for x in self.attributes if x[0] == name]:
+            del self.attributes[key]
+
+    def ops(self):
+        """
+        The overrides as ops: removals first, then added nodes, then attributes.
+        """
+        if self._data is not None:
+            data = self._data
+            if callable(data):
+                data = data()
+            return data["ops"]
+
+        ops = []
+        if self._graph is None:
+            return ops
+        for name in self.removed:
+            ops.append({"op": "remove", "node": name})
+        for name in self.added:
+            node = self._graph.nodes.get(name)
+            if node is not None:
+                ops.append({"op": "add", "node": node.serialize()})
+        for name, key in self.attributes:
+            node = self._graph.nodes.get(name)
+            if node is not None and key in node.attributes:
+                ops.append({"op": "set", "node": name, "attribute": node.attributes[key].serialize()})
+        return ops
+
+    def markClean(self):
+        """
+        Called once saved. The overrides go back to being kept as ops,
+        and the resolved graph only for as long as it's being used.
+        """
+        self.dirty = False
+        if self._graph is not None:
+            self._data = self.serialize()
+            self._weakGraph = weakref.ref(self._graph)
+            self._graph = None
+
+    def pendingData(self):
+        """
+        The serialized overrides, or loader, the ops are read from.
+        None while the resolved graph holds them.
+        """
+        return self._data
+
+    def isEmpty(self):
+        return not self.ops()
+
+    def serialize(self):
+        root = {}
+        root["class"] = "Override"
+        root["ops"] = self.ops()
+        return root
+
+    @classmethod
+    def deserialize(cls, root):
+        if root["class"] != "Override":
+            logger.error("Wrong deserializer called: " + root["class"])
+            raise Exception
+        return Override(root)
+
+
+def applyOp(graph, op, connections):
+    """
+    Applies an add, remove, rename or set op to graph. Connections are
+    added to connections instead of being made, so that they can refer
+    to nodes added by later ops. Pass them on to connect() once done.
+    Returns the node an add op added, which the graph may have renamed.
+    """
+    if op["op"] == "add":
+        cls = registry.nodeClass(op["node"]["class"])
+        if not cls:
+            logger.error("Unable to find Node class: {}".format(op["node"]["class"]))
+            raise Exception
+        node = cls.deserialize(op["node"])
+        graph.addNode(node)
+        for attribute in node.attributes.values():
+            if isinstance(attribute, InputAttribute):
+                connections.append((graph, attribute, attribute.value))
+        return node
+
+    node = graph.nodes.get(op.get("old", op["node"]))
+    if node is None:
+        logger.warning("Unable to find node {} to {}".format(op.get("old", op["node"]), op["op"]))
+        return None
+    if op["op"] == "remove":
+        graph.removeNodes([node])
+    elif op["op"] == "rename":
+        graph.renameNode(node, op["node"])
+    elif op["op"] == "set":
+        data = op["attribute"]
+        attribute = node.attributes.get(data["key"])
+        if attribute is None:
+            node.addAttribute(Attribute.deserialize(data))
+            attribute = node.attributes[data["key"]]
+        if isinstance(attribute, (InputAttribute, OutputAttribute)):
+            connections.append((graph, attribute, data["value"]))
+            return
+        if "elements" in data:
+            attribute.elements = data["elements"]
+        attribute.value = data["value"]
+    return None
+
+def connect(connections, renamed=None):
+    """
+    Makes the connections collected by applyOp, by node name.
+    renamed maps names to the ones the nodes ended up with.
+    """
+    renamed = renamed or {}
+    for graph, attribute, value in connections:
+        if isinstance(attribute, ArrayInputAttribute):
+            names = [renamed.get(x, x) for x in value or []]
+            attribute.value = [graph.nodes[x] for x in names if x in graph.nodes]
+        elif value:
+            attribute.value = graph.nodes.get(renamed.get(value, value))
+        else:
+            attribute.value = None
@@ -9,11 +9,21 @@ class Project:
     """
     Container for an entire project.
     """
-    def __init__(self, name="", shots={}, templates={}, filename=""):
+    def __init__(self, name="", shots=None, templates=None, filename=""):
         self.name = name
+        if shots is None:
+            shots = {}
         self.shots = shots
+        if templates is None:
+            templates = {}
         self.templates = templates
         self.filename = filename
+        ## The file the project was last loaded from or saved to.
+        ## Shots that aren't dirty match what's stored there.
+        self.source = None
+        ## Counts saves. Journal records written before a save carry an
+        ## older generation than the file, so replaying them can skip them
+        self.generation = 0
 
     def addShot(self, shot):
         ##TODO: Introspection
@@ -23,6 +33,21 @@ class Project:
         ##TODO: Introspection
         self.templates[template.name] = template
 
+    def dirtyShots(self):
+        """
+        Templates and shots changed since the project was last loaded or saved.
+        """
+        shots = []
+        for shot in list(self.templates.values()) + list(self.shots.values()):
+            if shot.isDirty():
+                shots.append(shot)
+        return shots
+
+    def markClean(self, source=None):
+        for shot in list(self.templates.values()) + list(self.shots.values()):
+            shot.markClean()
+        self.source = source
+
     def serialize(self):
         root = {}
 
@@ -39,6 +64,9 @@ class Project:
             root["templates"][templatename] = self.templates[templatename].serialize()
 
         root["filename"] = self.filename
+        ## Left out until the first save, like in files from before there were any
+        if self.generation:
+            root["generation"] = self.generation
 
         return root
 
@@ -52,7 +80,10 @@ class Project:
         filename = root["filename"]
 
         project = Project(name=name, filename=filename)
+        project.generation = root.get("generation", 0)
 
+        ## Graphs are only deserialized once a shot is looked at,
+        ## so opening a big project costs next to nothing
         templateData = root["templates"]
         for data in templateData.values():
             project.addTemplate(Shot.deserialize(data))
@@ -60,10 +91,11 @@ class Project:
         shotData = root["shots"]
         for data in shotData.values():
             shot = Shot.deserialize(data)
-            if data["parent"]:
-                shot.parent = project.templates[data["parent"]["name"]]
+            if shot.parentName():
+                shot.setParentName(shot.parentName(), project.templates)
             project.addShot(shot)
 
+        project.markClean()
         return project
 
 
@@ -0,0 +1,342 @@
+"""
+SQLite backed project storage.
+
+Graphs are stored content addressed. A graph is a list of node hashes,
+and every distinct node, with its attributes, is stored once, keyed by
+the hash of its content. Shots and templates point at their graph by
+its hash. Shots whose graphs are the same, like ones pasted from one
+another, share all of its rows, and graphs that differ in a few nodes
+share the rows of the rest. When opened, shots whose graphs are the
+same share a single graph in memory too, see core/share.py.
+
+Saving only touches the shots that changed since the project was
+loaded or last saved, writes only the nodes that aren't stored yet,
+and deletes the rows nothing points at any more. Questions about the
+project can be answered with SQL without loading any graphs:
+
+    store = ProjectStore("show.sgdb")
+    project = store.project()
+    store.shotsWithNodeClass("HoudiniFile")
+"""
+import os
+import json
+import sqlite3
+import logging
+
+from .node import contentDigest
+from .project import Project
+from .shot import Shot
+from .share import shareGraphs
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS project (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    position INTEGER,
+    graph TEXT
+);
+CREATE TABLE IF NOT EXISTS shots (
+    name TEXT PRIMARY KEY,
+    parent TEXT,
+    position INTEGER,
+    graph TEXT
+);
+CREATE TABLE IF NOT EXISTS graphs (
+    hash TEXT,
+    position INTEGER,
+    node TEXT,
+    PRIMARY KEY (hash, position)
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    hash TEXT PRIMARY KEY,
+    name TEXT,
+    class TEXT,
+    match TEXT
+);
+CREATE TABLE IF NOT EXISTS attributes (
+    node TEXT,
+    key TEXT,
+    class TEXT,
+    value TEXT,
+    data TEXT,
+    position INTEGER,
+    PRIMARY KEY (node, key)
+);
+CREATE TABLE IF NOT EXISTS overrides (
+    shot TEXT PRIMARY KEY,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS templates_graph ON templates (graph);
+CREATE INDEX IF NOT EXISTS shots_graph ON shots (graph);
+CREATE INDEX IF NOT EXISTS graphs_node ON graphs (node);
+CREATE INDEX IF NOT EXISTS nodes_class ON nodes (class);
+"""
+
+def graphRows(root):
+    """
+    Flattens a serialized graph into its hash, and per node its
+    hash, node row and attribute rows, keyed the same way as the tables.
+    """
+    nodes = []
+    for node in root["nodes"]:
+        attributes = []
+        for position, (key, attribute) in enumerate(node["attributes"].items()):
+            attributes.append((key,
+                               attribute["class"],
+                               json.dumps(attribute.get("value")),
+                               json.dumps(attribute),
+                               position))
+        row = (node["name"], node["class"], json.dumps(node["match"]))
+        nodes.append((contentDigest([row, attributes]), row, attributes))
+    return contentDigest([x[0] for x in nodes]), nodes
+
+
+class StoreLoader:
+    """
+    Rebuilds a serialized graph, by its hash, from the store.
+    """
+    def __init__(self, store, graph):
+        self.store = store
+        self.graph = graph
+
+    def __call__(self):
+        return self.store.readGraph(self.graph)
+
+
+class ProjectStore:
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+        ## What we last read or wrote, per shot and template, so saves can diff
+        self._shotRows = {"template": {}, "shot": {}}
+        for name, position, graph in self.connection.execute(
+                                "SELECT name, position, graph FROM templates"):
+            self._shotRows["template"][name] = (None, position, graph)
+        for name, parent, position, graph in self.connection.execute(
+                                "SELECT name, parent, position, graph FROM shots"):
+            self._shotRows["shot"][name] = (parent, position, graph)
+        ## Overrides are small, so they're kept whole, as json
+        self._overrideRows = dict(self.connection.execute("SELECT shot, data FROM overrides"))
+
+    def close(self):
+        self.connection.close()
+
+    def _meta(self, key, default=""):
+        row = self.connection.execute("SELECT value FROM project WHERE key=?", (key,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        return default
+
+    def readGraph(self, graph):
+        """
+        The serialized graph with the given hash.
+        """
+        nodes = {}
+        for nodeHash, nodename, classname, match in self.connection.execute(
+                                "SELECT nodes.hash, nodes.name, nodes.class, nodes.match FROM graphs "
+                                "JOIN nodes ON nodes.hash=graphs.node WHERE graphs.hash=? ORDER BY graphs.position",
+                                (graph,)):
+            node = {}
+            node["name"] = nodename
+            node["class"] = classname
+            node["attributes"] = {}
+            node["match"] = json.loads(match)
+            nodes[nodeHash] = node
+        for nodeHash, key, data in self.connection.execute(
+                                "SELECT attributes.node, attributes.key, attributes.data FROM graphs "
+                                "JOIN attributes ON attributes.node=graphs.node WHERE graphs.hash=? "
+                                "ORDER BY graphs.position, attributes.position",
+                                (graph,)):
+            nodes[nodeHash]["attributes"][key] = json.loads(data)
+
+        root = {}
+        root["class"] = "Graph"
+        root["nodes"] = list(nodes.values())
+        return root
+
+    def _storedGraph(self, shot):
+        """
+        Hash of the shot's graph, if it's waiting to be read from this store.
+        """
+        pending = shot.pendingGraphData()
+        if isinstance(pending, StoreLoader) and pending.store is self:
+            return pending.graph
+        return None
+
+    def project(self):
+        """
+        Builds a Project whose shots read their graphs from
+        the store the first time they're needed.
+        """
+        project = Project(name=self._meta("name"), filename=self._meta("filename", self.filename))
+        project.generation = self._meta("generation", 0)
+
+        rows = self.connection.execute("SELECT name, graph FROM templates ORDER BY position")
+        for name, graph in rows.fetchall():
+            template = Shot(name)
+            if graph:
+                template.setGraphData(StoreLoader(self, graph))
+            project.addTemplate(template)
+
+        rows = self.connection.execute("SELECT name, parent, graph FROM shots ORDER BY position")
+        for name, parent, graph in rows.fetchall():
+            shot = Shot(name)
+            if parent:
+                shot.setParentName(parent, project.templates)
+                if name in self._overrideRows:
+                    shot.setOverrideData(json.loads(self._overrideRows[name]))
+            elif graph:
+                shot.setGraphData(StoreLoader(self, graph))
+            project.addShot(shot)
+
+        shareGraphs(list(project.templates.values()) + list(project.shots.values()), self._storedGraph)
+        project.markClean(os.path.abspath(self.filename))
+        return project
+
+    def save(self, project):
+        """
+        Writes project to the store, touching only rows that changed.
+        Shots that haven't changed since they were last loaded from or
+        saved to the store are skipped entirely.
+        """
+        source = os.path.abspath(self.filename)
+        project.generation += 1
+        with self.connection:
+            for key in ("name", "filename", "generation"):
+                value = getattr(project, key)
+                if self._meta(key, None) != value:
+                    self.connection.execute("INSERT OR REPLACE INTO project VALUES (?, ?)", (key, json.dumps(value)))
+            ## Only deleted once both are saved, since they can share graphs
+            released = self._saveShots("template", project.templates, project.source == source)
+            released |= self._saveShots("shot", project.shots, project.source == source)
+            self._release(released)
+        project.markClean(source)
+
+    def _saveShots(self, kind, shots, isSource=False):
+        """
+        Returns the hashes of the graphs that shots stopped pointing at.
+        """
+        table = kind + "s"
+        stored = self._shotRows[kind]
+        released = set()
+
+        for name in list(stored):
+            if name not in shots:
+                logger.debug("Deleting {} {}".format(kind, name))
+                self.connection.execute("DELETE FROM {} WHERE name=?".format(table), (name,))
+                if kind == "shot":
+                    self._saveOverride(name, None)
+                released.add(stored[name][2])
+                del stored[name]
+
+        for position, (name, shot) in enumerate(shots.items()):
+            parent = shot.parentName() if kind == "shot" else None
+            previous = stored.get(name)
+            ## Clean shots already match their rows, so aren't serialized at all
+            unchanged = isSource and previous is not None and not shot.isDirty()
+            if unchanged:
+                graph = previous[2]
+            elif parent:
+                ## Inheriting shots have no graph of their own
+                graph = None
+            else:
+                graph = self._storedGraph(shot)
+                if graph is None:
+                    graph = self._saveGraph(self._graphData(shot))
+
+            row = (parent, position, graph)
+            if previous != row:
+                if kind == "shot":
+                    self.connection.execute("INSERT OR REPLACE INTO shots VALUES (?, ?, ?, ?)",
+                                            (name, parent, position, graph))
+                else:
+                    self.connection.execute("INSERT OR REPLACE INTO templates VALUES (?, ?, ?)",
+                                            (name, position, graph))
+                stored[name] = row
+                if previous is not None and previous[2] != graph:
+                    released.add(previous[2])
+
+            if kind == "shot" and not unchanged:
+                override = None
+                if parent and shot.override is not None:
+                    override = json.dumps(shot.override.serialize())
+                self._saveOverride(name, override)
+        released.discard(None)
+        return released
+
+    def _graphData(self, shot):
+        ## Shots that weren't loaded are saved as they were read, without loading them
+        pending = shot.pendingGraphData()
+        if pending is None:
+            graph = shot.graph
+            return graph.serialize() if graph is not None else None
+        return pending() if callable(pending) else pending
+
+    def _saveOverride(self, shot, data):
+        if self._overrideRows.get(shot) == data:
+            return
+        if data is None:
+            self.connection.execute("DELETE FROM overrides WHERE shot=?", (shot,))
+            del self._overrideRows[shot]
+        else:
+            self.connection.execute("INSERT OR REPLACE INTO overrides VALUES (?, ?)", (shot, data))
+            self._overrideRows[shot] = data
+
+    def _saveGraph(self, root):
+        """
+        Stores a serialized graph, unless one with the same hash is
+        already stored, writing only the nodes that aren't. Returns
+        its hash, or None if root is.
+        """
+        if root is None:
+            return None
+        graph, nodes = graphRows(root)
+        if self.connection.execute("SELECT 1 FROM graphs WHERE hash=? LIMIT 1", (graph,)).fetchone():
+            return graph
+        self.connection.executemany("INSERT OR REPLACE INTO graphs VALUES (?, ?, ?)",
+                                    [(graph, position, x[0]) for position, x in enumerate(nodes)])
+        for nodeHash, row, attributes in nodes:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, ?)", (nodeHash,) + row)
+            if cursor.rowcount:
+                self.connection.executemany("INSERT OR REPLACE INTO attributes VALUES (?, ?, ?, ?, ?, ?)",
+                                            [(nodeHash,) + x for x in attributes])
+        return graph
+
+    def _release(self, graphs):
+        """
+        Deletes the graphs that no shot or template points at any more,
+        and the nodes that only they had.
+        """
+        for graph in graphs:
+            if self.connection.execute("SELECT 1 FROM shots WHERE graph=? UNION ALL "
+                                       "SELECT 1 FROM templates WHERE graph=? LIMIT 1",
+                                       (graph, graph)).fetchone():
+                continue
+            nodes = [x[0] for x in self.connection.execute("SELECT node FROM graphs WHERE hash=?", (graph,))]
+            self.connection.execute("DELETE FROM graphs WHERE hash=?", (graph,))
+            for node in nodes:
+                if self.connection.execute("SELECT 1 FROM graphs WHERE node=? LIMIT 1", (node,)).fetchone():
+                    continue
+                self.connection.execute("DELETE FROM nodes WHERE hash=?", (node,))
+                self.connection.execute("DELETE FROM attributes WHERE node=?", (node,))
+
+    def shotsWithNodeClass(self, classname):
+        """
+        Names of the shots whose graph, own or inherited
+        from their template, contains a node of the given class.
+        """
+        rows = self.connection.execute("""
+                SELECT name FROM shots WHERE
+                    graph IN (SELECT graphs.hash FROM nodes JOIN graphs ON graphs.node=nodes.hash
+                              WHERE nodes.class=?) OR
+                    parent IN (SELECT templates.name FROM nodes JOIN graphs ON graphs.node=nodes.hash
+                               JOIN templates ON templates.graph=graphs.hash WHERE nodes.class=?)
+                ORDER BY position
+                """, (classname, classname))
+        return [x[0] for x in rows]
@@ -0,0 +1,510 @@
+"""
+Chunked project file format.
+
+A project file starts with a fixed size header pointing at an index,
+followed by one independently encoded chunk per template and shot:
+
+    header   magic, format version, index offset, index length
+    chunks   one serialized Shot each, json and optionally zlib/lzma compressed
+    index    json: project name, and per shot/template its chunk
+             offset, length, codec, parent template, whether
+             it has overrides, its content hash and that of its graph
+
+The file is memory mapped when opened, and shots are only read and
+decoded when their graph is first needed. Saving back to the same file
+appends only the chunks of changed shots plus a new index, and then
+points the header at it. Shots that were edited but hash the same as
+what is stored, say after an undo, count as unchanged. The old chunks
+are left as garbage until the file gets compacted by a full write.
+
+Chunks holding a graph are content addressed: shots whose graphs hash
+the same, like ones pasted from one another, point at a single chunk.
+When opened, they share a single graph in memory too, until it's
+edited, see core/share.py.
+
+Plain json projects (the old .sg format) are still read, and can be
+written with exportJson.
+"""
+import os
+import sys
+import json
+import lzma
+import mmap
+import zlib
+import struct
+import logging
+import argparse
+import tempfile
+
+from .project import Project
+from .shot import Shot
+from .share import shareGraphs
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SGPROJ\x00\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQ")
+CODECS = ("json", "zlib", "lzma")
+## Fraction of the file that may be unreferenced chunks before a save compacts it
+MAX_GARBAGE = 0.5
+
+def encode(root, codec="zlib"):
+    data = json.dumps(root, separators=(",", ":")).encode("utf-8")
+    if codec == "zlib":
+        return zlib.compress(data)
+    elif codec == "lzma":
+        return lzma.compress(data)
+    elif codec == "json":
+        return data
+    logger.error("Unknown codec: " + str(codec))
+    raise Exception
+
+def decode(data, codec):
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "lzma":
+        data = lzma.decompress(data)
+    elif codec != "json":
+        logger.error("Unknown codec: " + str(codec))
+        raise Exception
+    return json.loads(data.decode("utf-8"))
+
+def isProjectFile(filename):
+    """
+    True if filename is in the chunked format, rather than plain json.
+    """
+    with open(filename, "rb") as infile:
+        return infile.read(len(MAGIC)) == MAGIC
+
+
+class ChunkLoader:
+    """
+    Reads a single shot's graph, or overrides, out of an open ProjectFile.
+    """
+    def __init__(self, projectFile, entry, key="graph"):
+        self.projectFile = projectFile
+        self.entry = entry
+        self.key = key
+
+    def __call__(self):
+        return self.projectFile.readChunk(self.entry)[self.key]
+
+    def raw(self):
+        """
+        The chunk as stored, without decoding it.
+        """
+        offset = self.entry["offset"]
+        return self.projectFile._mmap[offset:offset+self.entry["length"]]
+
+
+class ProjectFile:
+    """
+    Read access to a chunked project file.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, indexOffset, indexLength = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            logger.error("Not a project file: " + filename)
+            raise Exception
+        if version > VERSION:
+            logger.error("Project file version {} is newer than supported ({})".format(version, VERSION))
+            raise Exception
+        self.index = json.loads(self._mmap[indexOffset:indexOffset+indexLength].decode("utf-8"))
+
+    def readChunk(self, entry):
+        ## Safe from any thread, since the map is read only
+        offset = entry["offset"]
+        return decode(self._mmap[offset:offset+entry["length"]], entry["codec"])
+
+    def readShot(self, name):
+        return self._named(self.readChunk(self.index["shots"][name]), name)
+
+    def readTemplate(self, name):
+        return self._named(self.readChunk(self.index["templates"][name]), name)
+
+    def _named(self, root, name):
+        ## Shared chunks carry the name of the shot that wrote them
+        root = dict(root)
+        root["name"] = name
+        return root
+
+    def project(self):
+        """
+        Builds a Project whose shots read their graphs from this file
+        the first time they're needed.
+        """
+        project = Project(name=self.index["name"], filename=self.index["filename"])
+        project.generation = self.index.get("generation", 0)
+
+        for name, entry in self.index["templates"].items():
+            template = Shot(name)
+            template.setGraphData(ChunkLoader(self, entry))
+            template.markClean(entry.get("hash"))
+            project.addTemplate(template)
+
+        for name, entry in self.index["shots"].items():
+            shot = Shot(name)
+            if entry["parent"]:
+                shot.setParentName(entry["parent"], project.templates)
+                if entry.get("override"):
+                    shot.setOverrideData(ChunkLoader(self, entry, "override"))
+            else:
+                shot.setGraphData(ChunkLoader(self, entry))
+            shot.markClean(entry.get("hash"))
+            project.addShot(shot)
+
+        shareGraphs(list(project.templates.values()) + list(project.shots.values()), pendingGraphHash)
+        project.source = os.path.abspath(self.filename)
+        return project
+
+    def close(self):
+        self._mmap.close()
+
+
+def readIndex(filename):
+    """
+    The header and index of a chunked project file, without mapping it.
+    Returns (None, None) if filename isn't one.
+    """
+    with open(filename, "rb") as infile:
+        header = infile.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None, None
+        magic, version, indexOffset, indexLength = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            return None, None
+        infile.seek(indexOffset)
+        index = json.loads(infile.read(indexLength).decode("utf-8"))
+    return HEADER.unpack(header), index
+
+def graphHash(shot):
+    """
+    Content hash of the shot's own graph, if it has one and it can be
+    had without loading it.
+    """
+    if shot.parentName():
+        return None
+    pending = shot.pendingGraphData()
+    if isinstance(pending, ChunkLoader):
+        return pending.entry.get("graph")
+    if pending is not None or shot.graph is None:
+        return None
+    return shot.graph.contentHash()
+
+def pendingGraphHash(shot):
+    """
+    Content hash of the shot's graph, if it's waiting to be read from
+    a project file.
+    """
+    pending = shot.pendingGraphData()
+    if isinstance(pending, ChunkLoader) and pending.key == "graph":
+        return pending.entry.get("graph")
+    return None
+
+def save(project, filename, codec="zlib"):
+    """
+    Saves project to filename, appending only the shots that changed
+    if filename is the chunked file the project was loaded from or
+    last saved to. Falls back to a full write otherwise, or when more
+    than MAX_GARBAGE of the file would be dead chunks.
+    Returns True if the save was incremental.
+    """
+    job = SaveJob(project, filename, codec)
+    try:
+        job.run()
+    except Exception:
+        job.cancel()
+        raise
+    job.finish()
+    return job.incremental
+
+def write(project, filename, codec="zlib"):
+    """
+    Writes all of project in the chunked format, without changing
+    what the project considers saved.
+    """
+    job = SaveJob(project, filename, codec, incremental=False, generation=project.generation)
+    try:
+        job.run()
+    finally:
+        job.cancel()
+
+
+class Chunk:
+    """
+    A shot as snapshotted by a SaveJob. The graph is read with loader
+    when root doesn't have it, and left out when another chunk has it.
+    """
+    def __init__(self, group, name, root, loader, clean, contentHash, graphHash):
+        self.group = group
+        self.name = name
+        self.root = root
+        self.loader = loader
+        self.clean = clean
+        self.contentHash = contentHash
+        self.graphHash = graphHash
+
+
+class SaveJob:
+    """
+    A save split in two, so the slow part can run in the background.
+
+    Creating the job takes a snapshot of the project, and has to happen on
+    the thread that edits it. Shots in the snapshot are marked clean right
+    away, so edits made while the job runs make them dirty again and get
+    picked up by the next save. run() encodes and writes the snapshot and
+    can run on any thread. Afterwards, back on the editing thread, call
+    finish() if run() succeeded or cancel() if it didn't.
+
+    The file gets generation, by default the project's next one, which
+    the project moves on to with the snapshot. See core/journal.py.
+    """
+    def __init__(self, project, filename, codec="zlib", incremental=True, generation=None):
+        self.project = project
+        self.filename = filename
+        self.codec = codec
+        self.source = os.path.abspath(filename)
+        ## Progress, in chunks, for whoever is waiting on run()
+        self.done = 0
+        self.total = 0
+        ## After a full write, the written file, opened by finish() for
+        ## unloaded shots to read from. Whoever held the old one can close it
+        self.projectFile = None
+
+        self.index = {}
+        self.index["class"] = project.__class__.__name__
+        self.index["name"] = project.name
+        self.index["filename"] = project.filename
+        if generation is None:
+            project.generation += 1
+            generation = project.generation
+        self.index["generation"] = generation
+        self.index["shots"] = {}
+        self.index["templates"] = {}
+
+        old = None
+        header = None
+        if incremental and project.source == self.source and os.path.exists(filename):
+            header, old = readIndex(filename)
+
+        self.chunks = []
+        ## (shot, contentHash) of the dirty shots in the snapshot
+        self.cleaned = []
+        ## Graph hash -> entry of the chunk holding that graph, or None
+        ## while it's still to be written by an earlier chunk
+        self.graphs = {}
+        ## Offset -> length of the chunks kept from the old file
+        kept = {}
+        for group, shots in (("templates", project.templates), ("shots", project.shots)):
+            for name, shot in shots.items():
+                dirty = shot.isDirty()
+                entry = old[group].get(name) if old else None
+                if entry and entry["parent"] == shot.parentName() and \
+                        (not dirty or entry.get("hash") == shot.contentHash()):
+                    self.index[group][name] = entry
+                    kept[entry["offset"]] = entry["length"]
+                    if entry.get("graph"):
+                        self.graphs[entry["graph"]] = entry
+                    if dirty:
+                        self.cleaned.append((shot, entry["hash"]))
+                    continue
+                chunk = self._snapshot(group, name, shot)
+                self.chunks.append(chunk)
+                if dirty:
+                    self.cleaned.append((shot, chunk.contentHash))
+
+        self.incremental = old is not None
+        if self.incremental:
+            size = os.path.getsize(filename)
+            ## The new index replaces the old one, so that counts as live too
+            live = HEADER.size + header[3] + sum(kept.values())
+            if size and 1.0 - float(live) / size > MAX_GARBAGE:
+                logger.debug("Compacting {}".format(filename))
+                self.incremental = False
+                self.index["shots"] = {}
+                self.index["templates"] = {}
+                self.graphs = {}
+                self.chunks = [self._snapshot(group, name, shot)
+                                for group, shots in (("templates", project.templates), ("shots", project.shots))
+                                for name, shot in shots.items()]
+
+        for shot, contentHash in self.cleaned:
+            shot.markClean(contentHash)
+        self.total = len(self.chunks)
+
+    def _snapshot(self, group, name, shot):
+        pending = shot.pendingGraphData()
+        clean = not shot.isDirty()
+        contentHash = shot.contentHash(load=False)
+        hashed = graphHash(shot)
+        shared = hashed in self.graphs
+        if hashed and not shared:
+            self.graphs[hashed] = None
+        root = shot.serialize(graph=False)
+        loader = None
+        if shared or root["parent"]:
+            ## The same as an earlier chunk's graph, or the template's
+            pass
+        elif isinstance(pending, ChunkLoader):
+            ## Never loaded, so read from its file in run() instead
+            loader = pending
+        elif pending is not None:
+            ## Other loaders, like the project store's, only work on this thread
+            root["graph"] = pending() if callable(pending) else pending
+        elif shot.graph is not None:
+            ## Copied now, and serialized and encoded in run()
+            loader = shot.graph.snapshot()
+        return Chunk(group, name, root, loader, clean, contentHash, hashed)
+
+    def run(self):
+        if self.incremental:
+            self._append()
+        else:
+            self._write()
+
+    def _encodeChunks(self, outfile):
+        for chunk in self.chunks:
+            entry = {}
+            shared = self.graphs.get(chunk.graphHash)
+            if shared:
+                entry["offset"] = shared["offset"]
+                entry["length"] = shared["length"]
+                entry["codec"] = shared["codec"]
+            else:
+                root = chunk.root
+                loader = chunk.loader
+                if chunk.clean and isinstance(loader, ChunkLoader) and loader.entry["codec"] == self.codec:
+                    ## Unchanged and already encoded the way we want it
+                    data = loader.raw()
+                else:
+                    if loader is not None:
+                        root = dict(root)
+                        root["graph"] = loader()
+                    data = encode(root, self.codec)
+                entry["offset"] = outfile.tell()
+                entry["length"] = len(data)
+                entry["codec"] = self.codec
+                outfile.write(data)
+                if chunk.graphHash:
+                    self.graphs[chunk.graphHash] = entry
+            entry["parent"] = chunk.root["parent"]
+            if chunk.root.get("override"):
+                entry["override"] = True
+            if chunk.contentHash:
+                entry["hash"] = chunk.contentHash
+            if chunk.graphHash:
+                entry["graph"] = chunk.graphHash
+            self.index[chunk.group][chunk.name] = entry
+            self.done += 1
+
+    def _append(self):
+        with open(self.filename, "r+b") as outfile:
+            outfile.seek(0, os.SEEK_END)
+            self._encodeChunks(outfile)
+
+            indexData = json.dumps(self.index).encode("utf-8")
+            indexOffset = outfile.tell()
+            outfile.write(indexData)
+            ## Everything the new header points at has to be on disk first,
+            ## so a crash leaves the old header and index in charge
+            outfile.flush()
+            os.fsync(outfile.fileno())
+            outfile.seek(0)
+            outfile.write(HEADER.pack(MAGIC, VERSION, indexOffset, len(indexData)))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def _write(self):
+        ## Written next to filename and renamed into place, so a project
+        ## that is still reading lazily from the old file keeps working
+        directory = os.path.dirname(self.source)
+        handle, tempname = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as outfile:
+                outfile.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+                self._encodeChunks(outfile)
+
+                indexData = json.dumps(self.index).encode("utf-8")
+                indexOffset = outfile.tell()
+                outfile.write(indexData)
+                outfile.seek(0)
+                outfile.write(HEADER.pack(MAGIC, VERSION, indexOffset, len(indexData)))
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.replace(tempname, self.filename)
+        except Exception:
+            os.remove(tempname)
+            raise
+
+    def finish(self):
+        self.project.source = self.source
+        if self.incremental:
+            ## Chunks in the old file are still where they were
+            return
+        self.projectFile = ProjectFile(self.filename)
+        index = self.projectFile.index
+        for group, shots in (("templates", self.project.templates), ("shots", self.project.shots)):
+            for name, shot in shots.items():
+                entry = index[group].get(name)
+                if entry is None or entry["parent"] != shot.parentName():
+                    continue
+                ## Not loaded, so the same as what was just written
+                if not entry["parent"] and callable(shot.pendingGraphData()):
+                    shot.setGraphData(ChunkLoader(self.projectFile, entry))
+                if shot.override is not None and not shot.override.isResolved() and entry.get("override"):
+                    shot.setOverrideData(ChunkLoader(self.projectFile, entry, "override"))
+        shareGraphs(list(self.project.templates.values()) + list(self.project.shots.values()),
+                    pendingGraphHash)
+
+    def cancel(self):
+        """
+        Makes the shots in the snapshot dirty again.
+        """
+        for shot, contentHash in self.cleaned:
+            shot.markDirty()
+
+
+def read(filename):
+    """
+    Opens a project in either format.
+    """
+    if isProjectFile(filename):
+        return ProjectFile(filename).project()
+    return importJson(filename)
+
+def importJson(filename):
+    with open(filename) as infile:
+        data = json.load(infile)
+    project = Project.deserialize(data)
+    project.markClean(os.path.abspath(filename))
+    return project
+
+def exportJson(project, filename):
+    with open(filename, "w") as outfile:
+        json.dump(project.serialize(), outfile, indent=4)
+
+def convert(source, destination, codec="zlib"):
+    """
+    Converts between json and chunked project files.
+    Destinations ending in .json are written as plain json.
+    """
+    project = read(source)
+    if destination.endswith(".json"):
+        exportJson(project, destination)
+    else:
+        write(project, destination, codec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between json and chunked project files")
+    parser.add_argument("source")
+    parser.add_argument("destination", help="Written as plain json if it ends with .json")
+    parser.add_argument("-c", "--codec", choices=CODECS, default="zlib")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    convert(args.source, args.destination, args.codec)
@@ -0,0 +1,90 @@
+"""
+Lookup of node and attribute classes by name, used when creating
+and deserializing nodes. Every Node and Attribute subclass registers
+itself when it's defined. Classes living outside this package can be
+registered directly, or exposed through the "stuffgrapher.nodes"
+entry point group, which is loaded the first time a name isn't found.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+PLUGIN_GROUP = "stuffgrapher.nodes"
+
+_nodeClasses = {}
+_attributeClasses = {}
+_pluginsLoaded = False
+
+def registerNodeClass(cls):
+    name = cls.__name__
+    if _nodeClasses.get(name, cls) is not cls:
+        logger.warning("Node class {} registered twice. Replacing.".format(name))
+    _nodeClasses[name] = cls
+    return cls
+
+def unregisterNodeClass(cls):
+    if _nodeClasses.get(cls.__name__) is cls:
+        del _nodeClasses[cls.__name__]
+
+def registerAttributeClass(cls):
+    name = cls.__name__
+    if _attributeClasses.get(name, cls) is not cls:
+        logger.warning("Attribute class {} registered twice. Replacing.".format(name))
+    _attributeClasses[name] = cls
+    return cls
+
+def nodeClass(classname, baseclass=None):
+    """
+    Returns the node class registered under classname, or None.
+    With baseclass given, classes not deriving from it are ignored.
+    """
+    cls = _nodeClasses.get(classname)
+    if cls is None and not _pluginsLoaded:
+        loadPlugins()
+        cls = _nodeClasses.get(classname)
+    if cls is None:
+        return None
+    if baseclass and not issubclass(cls, baseclass):
+        return None
+    return cls
+
+def attributeClass(classname):
+    cls = _attributeClasses.get(classname)
+    if cls is None and not _pluginsLoaded:
+        loadPlugins()
+        cls = _attributeClasses.get(classname)
+    return cls
+
+def nodeClasses():
+    return dict(_nodeClasses)
+
+def loadPlugins():
+    """
+    Imports everything exposed through the plugin entry point group.
+    Entry points can name a module, whose classes register themselves
+    as they're defined, or a class.
+    """
+    global _pluginsLoaded
+    _pluginsLoaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    try:
+        plugins = entry_points(group=PLUGIN_GROUP)
+    except TypeError:
+        plugins = entry_points().get(PLUGIN_GROUP, [])
+    for plugin in plugins:
+        try:
+            obj = plugin.load()
+        except Exception:
+            logger.exception("Unable to load plugin: " + plugin.name)
+            continue
+        if isinstance(obj, type):
+            from .node import Node
+            from .attributes import Attribute
+            if issubclass(obj, Node):
+                registerNodeClass(obj)
+            elif issubclass(obj, Attribute):
+                registerAttributeClass(obj)
+        logger.info("Loaded plugin: " + plugin.name)
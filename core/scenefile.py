@@ -4,6 +4,7 @@ from .node import Node
 from .data import Data
 import core.actions
 from .attributes import *
+from . import registry
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,9 @@ departments = [
             ]
 
 class SceneFile(Node):
+    __slots__ = ()
+    abstract = True
+
     def __init__(self, match):
         super(SceneFile, self).__init__(match)
         inputAttr = ArrayInputAttribute("input", hidden=True)
@@ -44,12 +48,13 @@ class SceneFile(Node):
             logger.error("Tried to create incompatible or unknown action: " + actionname)
             raise Exception
 
-        if not actionname in dir(core.actions):
+        from .action import Action
+        cls = registry.nodeClass(actionname, Action)
+        if not cls:
             logger.error("Tried to create non existing action object: " + actionname)
             raise Exception
 
-        cls = getattr(core.actions, actionname)
-        action = cls(match)
+        action = cls.create(match)
 
         action["scenefile"] = self
 
@@ -60,17 +65,15 @@ class SceneFile(Node):
 
     @classmethod
     def deserialize(cls, root):
-        import core.scenefiles
         classname = root["class"]
-        if not classname in dir(core.scenefiles):
+        cls = registry.nodeClass(classname, SceneFile)
+        if not cls:
             logger.error("Unable to deserialize. Unknown classname: " + classname)
             raise Exception
 
-        cls = getattr(core.scenefiles, classname)
-
         match = root["match"]
 
-        obj = cls(root["match"])
+        obj = cls.create(root["match"])
         obj.name = root["name"]
 
         attributes = root["attributes"]
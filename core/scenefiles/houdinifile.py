@@ -6,6 +6,8 @@ from core.actions import *
 logger = logging.getLogger(__name__)
 
 class HoudiniFile(SceneFile):
+    __slots__ = ()
+
     def __init__(self, match):
         super(HoudiniFile, self).__init__(match)
 
@@ -5,6 +5,8 @@ from core.scenefile import SceneFile
 logger = logging.getLogger(__name__)
 
 class MayaFile(SceneFile):
+    __slots__ = ()
+
     def __init__(self, match):
         super(MayaFile, self).__init__(match)
         
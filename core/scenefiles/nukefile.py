@@ -5,6 +5,8 @@ from core.scenefile import SceneFile
 logger = logging.getLogger(__name__)
 
 class NukeFile(SceneFile):
+    __slots__ = ()
+
     def __init__(self, match):
         super(NukeFile, self).__init__(match)
 
@@ -0,0 +1,101 @@
+"""
+Graphs shared in memory between shots whose graphs hash the same, like
+ones pasted from one another.
+
+Shots in a share read a single graph, loaded once for all of them,
+instead of each loading a copy of its own. Both Shot.graph and
+Shot.readGraph() return it, so viewing a shot keeps it shared. The
+first edit ends the share: the shot that last handed the graph out
+through Shot.graph keeps it, since that's the one being edited, and
+the other shots go back to loading their own graphs from wherever
+they'd have loaded them anyway. Like with Override, a shot only pays
+for a graph of its own once it needs one.
+
+    shareGraphs(project.shots.values(), lambda shot: graphHashes.get(shot.name))
+"""
+import logging
+
+from .graph import Graph
+
+logger = logging.getLogger(__name__)
+
+class GraphShare:
+    def __init__(self, data):
+        ## Serialized graph, or a function returning one, until first read
+        self._data = data
+        self._graph = None
+        ## Shot that last handed the graph out through Shot.graph, if any
+        self.holder = None
+        ## id -> shot, of the shots reading the graph
+        self._shots = {}
+
+    def graph(self):
+        """
+        The shared graph, loaded the first time it's needed.
+        """
+        if self._graph is None and self._data is not None:
+            data = self._data
+            self._data = None
+            logger.debug("Loading graph shared by {} shots".format(len(self._shots)))
+            if callable(data):
+                data = data()
+            if data:
+                self._graph = Graph.deserialize(data)
+                self._graph.subscribe(self._graphEvent)
+        return self._graph
+
+    def hold(self, shot):
+        """
+        The shared graph, as handed out by shot, which gets to keep it
+        if it's edited.
+        """
+        graph = self.graph()
+        if graph is not None:
+            self.holder = shot
+        return graph
+
+    def join(self, shot):
+        self._shots[id(shot)] = shot
+
+    def leave(self, shot):
+        self._shots.pop(id(shot), None)
+        if self.holder is shot:
+            self.holder = None
+
+    def shots(self):
+        """
+        The shots reading the graph.
+        """
+        return list(self._shots.values())
+
+    def _graphEvent(self, event):
+        ## Edited, so it's the holder's alone from now on
+        logger.debug("Shared graph edited. No longer sharing it with {} shots".format(len(self._shots)))
+        graph = self._graph
+        graph.unsubscribe(self._graphEvent)
+        self._graph = None
+        holder = self.holder
+        for shot in self.shots():
+            if shot is holder:
+                shot.graph = graph
+            else:
+                shot.shareGraph(None)
+
+
+def shareGraphs(shots, graphHash):
+    """
+    Puts shots whose graphs hash the same in a share per hash. graphHash
+    returns a shot's hash, or None to leave it out, and should only
+    return one for shots that haven't been loaded.
+    """
+    groups = {}
+    for shot in shots:
+        key = graphHash(shot)
+        if key:
+            groups.setdefault(key, []).append(shot)
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        share = GraphShare(group[0].pendingGraphData())
+        for shot in group:
+            shot.shareGraph(share)
@@ -1,45 +1,300 @@
 import logging
 
 from .graph import Graph
+from .node import contentDigest
+from .override import Override
 
 logger = logging.getLogger(__name__)
 
 class Shot:
     def __init__(self, name):
-        self.name = name
+        self._name = name
+        ## New shots haven't been saved anywhere yet
+        self._dirty = True
         self._parent = None
-        self.graph = None
+        self._graph = None
+        ## Serialized graph, deserialized on first access to graph
+        self._graphData = None
+        ## Template name and where to find it, resolved on first access to parent
+        self._parentName = None
+        self._templates = None
+        ## Changes made on top of the template's graph, if any
+        self._override = None
+        ## contentHash() as of the last load or save, if known
+        self._savedHash = None
+        ## Graph shared with shots whose graphs hash the same, see core/share.py
+        self._share = None
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+        self._dirty = True
+
+    @property
+    def graph(self):
+        if self._parentName is not None:
+            self._resolveParent()
+        if self._override is not None and self._parent:
+            return self._override.graph(self._parent.graph)
+        if self._share is not None:
+            ## Ours if it's edited, see core/share.py
+            graph = self._share.hold(self)
+            if graph is not None:
+                return graph
+            self._leaveShare()
+        if self._graphData is not None:
+            data = self._graphData
+            self._graphData = None
+            logger.debug("Loading graph for shot: " + self.name)
+            if callable(data):
+                data = data()
+            self._graph = Graph.deserialize(data)
+        return self._graph
+
+    def readGraph(self):
+        """
+        The graph, without keeping it loaded on the shot if it wasn't
+        already, for reading through a project one shot at a time.
+        Template graphs are still loaded, since many shots share them.
+        """
+        if self._parentName is not None:
+            self._resolveParent()
+        if self._override is not None and self._parent:
+            if self._override.isResolved():
+                return self._override.graph(self._parent.graph)
+            ## Resolved on a copy, so the shot's own overrides stay unresolved
+            return Override(self._override.serialize()).graph(self._parent.graph)
+        if self._share is not None:
+            return self._share.graph()
+        if self._graphData is not None:
+            data = self._graphData
+            if callable(data):
+                data = data()
+            return Graph.deserialize(data) if data else None
+        return self._graph
+
+    def loadedGraph(self):
+        """
+        The shot's own graph if it's in memory, without loading or
+        resolving anything. None for shots inheriting their template's.
+        """
+        if self._override is not None:
+            return self._override.resolvedGraph()
+        if self.parentName():
+            return None
+        return self._graph
+
+    @graph.setter
+    def graph(self, value):
+        self._leaveShare()
+        self._graphData = None
+        self._graph = value
+        self._dirty = True
 
     @property
     def parent(self):
+        if self._parentName is not None:
+            self._resolveParent()
         return self._parent
 
     @parent.setter
     def parent(self, value):
+        self._parentName = None
+        self._templates = None
         if value:
             self.graph = value.graph
             self._parent = value
         else:
             self.graph = Graph()
             self._parent = None
+            self._override = None
+
+    @property
+    def override(self):
+        return self._override
+
+    def enableOverrides(self):
+        """
+        Stops sharing the template's graph. Edits to the shot's graph are
+        kept as overrides on top of the template from now on.
+        """
+        if not self.parentName():
+            logger.error("Only shots with a template can have overrides: " + self.name)
+            raise Exception
+        if self._override is None:
+            self._override = Override()
+            self._dirty = True
+
+    def disableOverrides(self):
+        """
+        Drops the overrides, going back to sharing the template's graph.
+        """
+        if self._override is not None:
+            self._override = None
+            self._dirty = True
+
+    def setOverrideData(self, data):
+        """
+        Gives the shot serialized overrides, or a function returning them,
+        to be applied the first time the graph is needed.
+        """
+        self._override = Override(data)
+
+    def parentName(self):
+        """
+        Name of the template, without loading it.
+        """
+        if self._parentName is not None:
+            return self._parentName
+        if self._parent:
+            return self._parent.name
+        return None
+
+    def pendingGraphData(self):
+        """
+        The serialized graph, or loader, waiting to be deserialized.
+        None once the graph has been loaded.
+        """
+        return self._graphData
+
+    def setGraphData(self, data):
+        """
+        Gives the shot a serialized graph, or a function returning one,
+        to be deserialized the first time the graph is needed.
+        """
+        self._leaveShare()
+        self._graph = None
+        self._graphData = data
+
+    def shareGraph(self, share):
+        """
+        Has the shot use a GraphShare's graph, until the shared graph is
+        edited, instead of loading its own. The graph data given
+        to setGraphData is kept, for loading once it stops sharing.
+        None stops sharing.
+        """
+        self._leaveShare()
+        self._share = share
+        if share is not None:
+            share.join(self)
 
-    def serialize(self):
+    def _leaveShare(self):
+        if self._share is not None:
+            self._share.leave(self)
+            self._share = None
+
+    def setParentName(self, name, templates):
+        """
+        Links the shot to a template without loading anything.
+        The template is looked up in templates, and its graph shared,
+        the first time the shot's parent or graph is needed.
+        """
+        self._leaveShare()
+        self._parent = None
+        self._graph = None
+        self._graphData = None
+        self._parentName = name
+        self._templates = templates
+
+    def _resolveParent(self):
+        name = self._parentName
+        templates = self._templates
+        self._parentName = None
+        self._templates = None
+        if templates is None or name not in templates:
+            logger.error("Unable to find template {} for shot {}".format(name, self.name))
+            return
+        ## Linking up what was loaded isn't a change
+        dirty = self._dirty
+        self.parent = templates[name]
+        self._dirty = dirty
+
+    def isDirty(self):
+        """
+        True if the shot, or its graph, changed since it was last loaded or saved.
+        Shots that were never loaded can't have changed.
+        """
+        if self._dirty:
+            return True
+        if self._override is not None and self._override.dirty:
+            return True
+        ## Inherited graphs are saved with the template
+        if self.parentName() or not self.isLoaded():
+            return False
+        return self._graph is not None and self._graph.dirty
+
+    def markDirty(self):
+        self._dirty = True
+
+    def markClean(self, contentHash=None):
+        """
+        Marks the shot as matching what was loaded or saved. contentHash
+        is the shot's hash there, if known, so it can be had without loading.
+        """
+        self._dirty = False
+        self._savedHash = contentHash
+        if self._override is not None:
+            self._override.markClean()
+        if self._graph is not None and self._graphData is None and not self.parentName():
+            self._graph.markClean()
+
+    def contentHash(self, load=True):
+        """
+        Hash of the shot's name, template, and graph or overrides, as
+        compared by ==. Inherited graphs are left out, like they are
+        when saving. With load unset, returns None rather than loading
+        a graph just to hash it.
+        """
+        if self._savedHash is not None and not self.isDirty():
+            return self._savedHash
+        parentName = self.parentName()
+        state = ["Shot", self.name, parentName]
+        if parentName:
+            state.append(self._override.ops() if self._override is not None else None)
+        elif not load and not self.isLoaded():
+            return None
+        else:
+            graph = self.readGraph()
+            state.append(graph.contentHash() if graph is not None else None)
+        return contentDigest(state)
+
+    def isLoaded(self):
+        """
+        False until the shot's graph has been deserialized.
+        """
+        return self._graphData is None and self._parentName is None
+
+    def serialize(self, graph=True):
+        """
+        With graph unset, the graph is left out, as None.
+        """
         root = {}
         
         root["class"] = "Shot"
         
         root["name"] = self.name
         
-        if self.graph:
+        parentName = self.parentName()
+        if parentName or not graph:
+            ## Shared with the template, so only stored there
+            root["graph"] = None
+        elif self._graphData is not None:
+            ## Never loaded, so it can't have changed
+            root["graph"] = self._graphData
+            if callable(root["graph"]):
+                root["graph"] = root["graph"]()
+        elif self.graph:
             root["graph"] = self.graph.serialize()
         else:
             root["graph"] = None
         
-        if self.parent:
-            root["parent"] = self.parent
-        else:
-            root["parent"] = None
+        root["parent"] = parentName
+        if parentName and self._override is not None:
+            root["override"] = self._override.serialize()
 
         return root
 
@@ -52,22 +307,36 @@ class Shot:
         name = root["name"]
         obj = Shot(name)
        
+        ## Only the template's name. Whoever holds the templates links
+        ## it up, see Project.deserialize
         parent = root["parent"]
+        if isinstance(parent, dict):
+            parent = parent["name"]
         if parent:
-            obj.parent = parent
-
-        graph = root["graph"]
-        if graph:
-            obj.graph = Graph.deserialize(graph)
+            obj.setParentName(parent, None)
+            if root.get("override"):
+                obj.setOverrideData(root["override"])
+        else:
+            graph = root["graph"]
+            if graph:
+                obj.setGraphData(graph)
 
+        obj.markClean()
         return obj
 
     def __eq__(self, other):
         if self.name != other.name:
             return False
-        if self.graph != other.graph:
+        if self.contentHash() == other.contentHash():
+            return True
+        if self.parentName() != other.parentName():
             return False
-        if self.parent != other.parent:
+        ## Children are equal as long as they inherit the same template
+        ## and change it the same way
+        if self.parentName():
+            if (self._override is None) != (other._override is None):
+                return False
+            return self._override is None or self._override.ops() == other._override.ops()
+        if self.readGraph() != other.readGraph():
             return False
         return True
-
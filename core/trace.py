@@ -0,0 +1,100 @@
+"""
+Tracing for the hot paths in core: attribute values being set, and
+nodes being added, removed and renamed. Call sites check the level of
+the core.trace logger first, so tracing costs a single check unless
+it's enabled for DEBUG, in which case every change is logged.
+
+For profiling, a Recorder keeps the changes as timestamped entries
+instead of logging them:
+
+    with trace.Recorder() as recorder:
+        graph = Graph.deserialize(root)
+    for entry in recorder.entries:
+        print(entry.time, entry.op, entry.node, entry.key, entry.value)
+
+Call sites look like:
+
+    if trace.logger.isEnabledFor(logging.DEBUG):
+        trace.valueSet(self, value)
+"""
+import time
+import logging
+import collections
+
+logger = logging.getLogger(__name__)
+
+## time is time.perf_counter(). Nodes in value are given by name
+TraceEntry = collections.namedtuple("TraceEntry", ["time", "op", "node", "key", "value"])
+
+SET = "set"
+ADD = "add"
+REMOVE = "remove"
+RENAME = "rename"
+
+_recorders = []
+## Level and propagation of logger from before the first recorder started
+_saved = None
+
+def _nodeName(value):
+    if isinstance(value, (list, tuple)):
+        return [_nodeName(x) for x in value]
+    if hasattr(value, "attributes"):
+        return value.name
+    return value
+
+def _trace(op, node, key, value, message, *args):
+    if _recorders:
+        entry = TraceEntry(time.perf_counter(), op, node, key, _nodeName(value))
+        for recorder in _recorders:
+            recorder.entries.append(entry)
+    else:
+        logger.debug(message, *args)
+
+def valueSet(attribute, value):
+    _trace(SET, attribute.parentName(), attribute.key, value,
+           "%s.%s = %s", attribute.parentName(), attribute.key, value)
+
+def nodeAdded(graph, node):
+    _trace(ADD, node.name, None, None, "Added node: %s", node.name)
+
+def nodeRemoved(graph, node):
+    _trace(REMOVE, node.name, None, None, "Removed node: %s", node.name)
+
+def nodeRenamed(graph, node, oldName):
+    _trace(RENAME, node.name, None, oldName, "Renamed node: %s -> %s", oldName, node.name)
+
+
+class Recorder:
+    """
+    Records what's traced while started, instead of logging it.
+    """
+    def __init__(self):
+        self.entries = []
+
+    def start(self):
+        global _saved
+        if self in _recorders:
+            return
+        if not _recorders:
+            ## Turned on just for us, so keep it out of the logs
+            _saved = (logger.level, logger.propagate)
+            logger.setLevel(logging.DEBUG)
+            logger.propagate = False
+        _recorders.append(self)
+
+    def stop(self):
+        global _saved
+        if self not in _recorders:
+            return
+        _recorders.remove(self)
+        if not _recorders:
+            logger.setLevel(_saved[0])
+            logger.propagate = _saved[1]
+            _saved = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
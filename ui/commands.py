@@ -6,6 +6,8 @@ from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
+from core.attributes import *
+
 logger = logging.getLogger(__name__)
 
 class CreateNodeCommand(QUndoCommand):
@@ -19,18 +21,18 @@ class CreateNodeCommand(QUndoCommand):
     def undo(self):
         logger.info("Undoing Create Node")
         self._nodegraph.removeNode(self._node)
-        self._nodegraph.graphChanged()
 
     def redo(self):
         logger.info("Creaating Node")
-        if self._node:
-            self._nodegraph.addNode(self._node)
-        else:
-            self._node = self._nodegraph.createNode(self._classname, "foo") 
+        with self._nodegraph.batch():
+            if self._node:
+                self._nodegraph.addNode(self._node)
+            else:
+                self._node = self._nodegraph.createNode(self._classname, "foo") 
 
-        self._node["pos.x"].value = self._pos.x()
-        self._node["pos.y"].value = self._pos.y()
-        self._nodegraph.graphChanged()
+            self._node["pos.x"].value = self._pos.x()
+            self._node["pos.y"].value = self._pos.y()
+            self._nodegraph.graphChanged()
 
 class CreateDataFromActionCommand(QUndoCommand):
     def __init__(self, node, dataType, pos, parent=None):
@@ -44,18 +46,18 @@ class CreateDataFromActionCommand(QUndoCommand):
     def undo(self):
         logger.info("Undoing Create Data from Action")
         self._graph.removeNode(self._dataNode)
-        self._graph.graphChanged()
 
     def redo(self):
         logger.info("Creating Data from Action")
-        if self._dataNode:
-            self._graph.addNode(self._dataNode)
-        else:
-            self._dataNode = self._node.createData(self._classname)
+        with self._graph.batch():
+            if self._dataNode:
+                self._graph.addNode(self._dataNode)
+            else:
+                self._dataNode = self._node.createData(self._classname)
 
-        self._dataNode["pos.x"].value = self._pos.x()
-        self._dataNode["pos.y"].value = self._pos.y()
-        self._graph.graphChanged()
+            self._dataNode["pos.x"].value = self._pos.x()
+            self._dataNode["pos.y"].value = self._pos.y()
+            self._graph.graphChanged()
 
 class CreateActionFromSceneCommand(QUndoCommand):
     def __init__(self, node, actionType, pos, parent=None):
@@ -69,18 +71,42 @@ class CreateActionFromSceneCommand(QUndoCommand):
     def undo(self):
         logger.info("Undoing Create Action from Node")
         self._graph.removeNode(self._actionNode)
-        self._graph.graphChanged()
 
     def redo(self):
         logger.info("Creating Action from Node")
-        if self._actionNode:
-            self._graph.addNode(self._actionNode)
-        else:
-            self._actionNode = self._node.createAction(self._classname, "foo")
+        with self._graph.batch():
+            if self._actionNode:
+                self._graph.addNode(self._actionNode)
+            else:
+                self._actionNode = self._node.createAction(self._classname, "foo")
+
+            self._actionNode["pos.x"].value = self._pos.x()
+            self._actionNode["pos.y"].value = self._pos.y()
+            self._graph.graphChanged()
+
+class DeleteNodesCommand(QUndoCommand):
+    def __init__(self, graph, nodes, parent=None):
+        QUndoCommand.__init__(self, parent)
+        self._graph = graph
+        self._nodes = list(nodes)
+        self._disconnected = []
 
-        self._actionNode["pos.x"].value = self._pos.x()
-        self._actionNode["pos.y"].value = self._pos.y()
-        self._graph.graphChanged()
+    def undo(self):
+        logger.info("Undoing Delete Nodes")
+        with self._graph.batch():
+            for node in self._nodes:
+                self._graph.addNode(node)
+            ## Backwards, so every array input gets its order back
+            for attribute, node, index in reversed(self._disconnected):
+                if isinstance(attribute, ArrayInputAttribute):
+                    attribute.insert(index, node)
+                else:
+                    attribute.value = node
+            self._graph.graphChanged()
+
+    def redo(self):
+        logger.info("Deleting {} nodes".format(len(self._nodes)))
+        self._disconnected = self._graph.removeNodes(self._nodes)
 
 
 class SetAttributeCommand(QUndoCommand):
@@ -138,15 +164,17 @@ class SetPositionCommand(QUndoCommand):
 
     def undo(self):
         logger.info("Undoing position change -> {} , {}".format(self._oldX, self._oldY))
-        self._node["pos.x"] = self._oldX
-        self._node["pos.y"] = self._oldY
-        self._node.graph.graphChanged()
+        with self._node.graph.batch():
+            self._node["pos.x"] = self._oldX
+            self._node["pos.y"] = self._oldY
+            self._node.graph.graphChanged()
 
     def redo(self):
         logger.info("Applying position change -> {} , {}".format(self._newX, self._newY))
-        self._node["pos.x"] = self._newX
-        self._node["pos.y"] = self._newY
-        self._node.graph.graphChanged()
+        with self._node.graph.batch():
+            self._node["pos.x"] = self._newX
+            self._node["pos.y"] = self._newY
+            self._node.graph.graphChanged()
 
 
 class CreateConnectionCommand(QUndoCommand):
@@ -156,7 +184,7 @@ class CreateConnectionCommand(QUndoCommand):
         self._fromNodeNew = fromNode
         self._fromNodeOld = None
         if toAttribute.value:
-            self._fromNode = toAttribute.value
+            self._fromNodeOld = toAttribute.value
 
     def redo(self):
         self._toAttribute.value = self._fromNodeNew
@@ -169,15 +197,15 @@ class CreateConnectionCommand(QUndoCommand):
 class AddConnectionCommand(QUndoCommand):
     def __init__(self, fromNode, toAttribute, parent=None):
         QUndoCommand.__init__(self, parent)
-        self._toAttrtibute = toAttribute
-        self._fromNodeNew = fromNode
+        self._toAttribute = toAttribute
+        self._fromNode = fromNode
 
     def redo(self):
-        self._toAttribute.value.append(self._fromNode)
+        self._toAttribute.append(self._fromNode)
         self._fromNode.graph.graphChanged()
 
     def undo(self):
-        self._toAttribute.value.remove(self._fromNode)
+        self._toAttribute.remove(self._fromNode)
         self._fromNode.graph.graphChanged()
 
 
@@ -1,6 +1,9 @@
 import sys
 import logging
 import json
+import shlex
+import os
+import concurrent.futures
 
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
@@ -16,9 +19,24 @@ from .commands import *
 from core import Shot
 from core import Graph
 from core import Project
+from core import projectfile
+from core import journal
+from core import Action
+from core.execution import ExecutionEngine, LocalExecutor, FAILED, SKIPPED, UPTODATE
+from core import jobspec
+from core.actioncache import ActionCache
+from core.projectdb import ProjectStore
 
 logger = logging.getLogger(__name__)
 
+## Journal size, in bytes, at which it gets folded into the project file
+AUTOSAVE_SIZE = 1024 * 1024
+## Command run per action, locally and on the farm, formatted with core.execution.Task.context()
+if "STUFFGRAPHER_ACTION_COMMAND" in os.environ:
+    ACTION_COMMAND = shlex.split(os.environ["STUFFGRAPHER_ACTION_COMMAND"])
+else:
+    ACTION_COMMAND = jobspec.DEFAULT_COMMAND
+
 class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
@@ -26,6 +44,21 @@ class MainWindow(QMainWindow):
         self.undoStack = QUndoStack(self)
 
         self.project = Project()
+        ## Open SQLite store, when working on a .sgdb project
+        self.projectStore = None
+        ## Open chunked project file, that unloaded shots read from
+        self.projectFile = None
+        ## Saves run one at a time, off the UI thread
+        self.saveExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.saveJob = None
+        self.saveFuture = None
+        self.saveIndex = None
+        ## Edits since the last save, for recovering from a crash
+        self.journal = None
+        ## Actions running in the background
+        self.executionExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.executionRun = None
+        self.executionFuture = None
         
         self._initUI()
         self._initMenuBar()
@@ -37,6 +70,25 @@ class MainWindow(QMainWindow):
 
         # Status Bar
         self.statusBar().showMessage("Ready")
+        self.saveProgress = QProgressBar()
+        self.saveProgress.setMaximumWidth(200)
+        self.saveProgress.hide()
+        self.statusBar().addPermanentWidget(self.saveProgress)
+
+        self.saveTimer = QTimer(self)
+        self.saveTimer.setInterval(100)
+        self.saveTimer.timeout.connect(self.pollSave)
+
+        ## Folds a journal grown big into the project file
+        self.autosaveTimer = QTimer(self)
+        self.autosaveTimer.setInterval(60 * 1000)
+        self.autosaveTimer.timeout.connect(self.autosave)
+        self.autosaveTimer.start()
+        self.undoStack.indexChanged.connect(self.commitJournal)
+
+        self.executionTimer = QTimer(self)
+        self.executionTimer.setInterval(250)
+        self.executionTimer.timeout.connect(self.pollActions)
         
         # Window Size
         self.setMinimumSize(400, 400)
@@ -95,6 +147,12 @@ class MainWindow(QMainWindow):
         saveAsAction.triggered.connect(self.saveas)
         self.fileMenu.addAction(saveAsAction)
 
+        ## Export JSON
+        exportAction = QAction("Export JSON", self)
+        exportAction.setStatusTip("Export project as plain json")
+        exportAction.triggered.connect(self.exportJson)
+        self.fileMenu.addAction(exportAction)
+
         ## Exit
         exitAction = QAction(" Exit", self)
         exitAction.setShortcut("Ctrl+Q")
@@ -155,11 +213,18 @@ class MainWindow(QMainWindow):
         self.tractorMenu.addAction(tractorScenefilesAction)
 
         tractorActionsAction = QAction("Run Actions", self)
+        tractorActionsAction.setStatusTip("Run the actions of every shot locally")
+        tractorActionsAction.triggered.connect(self.runActions)
         self.tractorMenu.addAction(tractorActionsAction)
 
         tractorDataAction = QAction("Generate Data", self)
         self.tractorMenu.addAction(tractorDataAction)
 
+        tractorJobAction = QAction("Write Job Spec", self)
+        tractorJobAction.setStatusTip("Write a farm job running every action in the project")
+        tractorJobAction.triggered.connect(self.writeJobSpec)
+        self.tractorMenu.addAction(tractorJobAction)
+
     def buildCreateNodeMenu(self, menu):
         
         ## Actions
@@ -248,27 +313,156 @@ class MainWindow(QMainWindow):
             self.saveas()
             return
 
-        logger.debug("Serializing data")
-        data = self.project.serialize()
-        logger.debug("Serialization successfull")
+        if self.saveFuture:
+            self.statusBar().showMessage("Still saving {}".format(self.project.filename))
+            return
 
-        ## TODO: File safety checks
         logger.info("Writing File {}".format(self.project.filename))
-        with open(self.project.filename, "w") as outfile:
-            json.dump(data, outfile, indent=4)
+        self.startJournal(self.project.filename)
+        self.journal.checkpoint()
+        if self.project.filename.endswith(".sgdb"):
+            ## SQLite connections can only be used from the thread that opened them,
+            ## and the store only writes what changed anyway
+            if not self.projectStore or self.projectStore.filename != self.project.filename:
+                self.projectStore = ProjectStore(self.project.filename)
+            self.projectStore.save(self.project)
+            self.journal.saved()
+            logger.info("File saved successfully")
+            self.undoStack.setClean()
+            self.updateWindowTitle()
+            return
+
+        ## Snapshot here, encode and write in the background
+        self.saveJob = projectfile.SaveJob(self.project, self.project.filename)
+        self.saveIndex = self.undoStack.index()
+        self.saveFuture = self.saveExecutor.submit(self.saveJob.run)
+        self.saveProgress.setMaximum(max(self.saveJob.total, 1))
+        self.saveProgress.setValue(0)
+        self.saveProgress.show()
+        self.statusBar().showMessage("Saving {}".format(self.project.filename))
+        self.saveTimer.start()
+
+    def pollSave(self):
+        job = self.saveJob
+        future = self.saveFuture
+        if not future:
+            return
+        self.saveProgress.setValue(job.done)
+        if not future.done():
+            return
+
+        self.saveTimer.stop()
+        self.saveProgress.hide()
+        self.saveJob = None
+        self.saveFuture = None
+        try:
+            future.result()
+        except Exception:
+            logger.exception("Failed to save {}".format(job.filename))
+            job.cancel()
+            self.statusBar().showMessage("Failed to save {}".format(job.filename))
+            return
+
+        job.finish()
+        if job.projectFile:
+            ## Written in full, and unloaded shots read from the new file now
+            if self.projectFile:
+                self.projectFile.close()
+            self.projectFile = job.projectFile
+        if self.journal:
+            self.journal.saved()
         logger.info("File saved successfully")
-        self.undoStack.setClean()
+        ## Edits made while saving aren't in the file
+        if self.undoStack.index() == self.saveIndex:
+            self.undoStack.setClean()
+        self.statusBar().showMessage("Saved {}".format(job.filename))
         self.updateWindowTitle()
 
+    def waitForSave(self):
+        if self.saveFuture:
+            concurrent.futures.wait([self.saveFuture])
+            self.pollSave()
+
+
+    def startJournal(self, filename):
+        if self.journal and self.journal.filename == journal.journalName(filename):
+            return
+        if self.journal:
+            ## Saved under a new name. The old journal still applies to the old file
+            self.journal.close()
+        self.journal = journal.Journal(self.project, filename)
+
+    def commitJournal(self):
+        if self.journal:
+            self.journal.commit()
+
+    def autosave(self):
+        self.commitJournal()
+        if self.journal and not self.saveFuture and self.journal.size() > AUTOSAVE_SIZE:
+            logger.info("Journal is {} bytes. Saving".format(self.journal.size()))
+            self.save()
+
+    def runActions(self):
+        if self.executionFuture:
+            self.statusBar().showMessage("Actions are already running")
+            return
+        cache = None
+        if self.project.filename:
+            ## Actions that ran before, and haven't changed since, are skipped
+            cache = ActionCache(os.path.splitext(self.project.filename)[0] + ".sgcache")
+        engine = ExecutionEngine(cache=cache)
+        engine.registerExecutor(Action, LocalExecutor(ACTION_COMMAND))
+        ## Planned here, since it reads the graphs
+        self.executionRun = engine.plan(self.project.shots.values())
+        logger.info("Running {} of {} actions".format(len(engine.wouldRun(self.executionRun)),
+                                                      self.executionRun.total))
+        self.executionFuture = self.executionExecutor.submit(engine.execute, self.executionRun)
+        self.executionTimer.start()
+
+    def writeJobSpec(self):
+        filename = QFileDialog.getSaveFileName(self, "Write Job Spec", "/Users/espennordahl/Desktop", "Jobs (*.alf *.json)")[0]
+        if not filename:
+            return
+        jobspec.write(self.project, filename, ACTION_COMMAND)
+        self.statusBar().showMessage("Wrote {}".format(filename))
+
+    def pollActions(self):
+        run = self.executionRun
+        if not self.executionFuture.done():
+            self.statusBar().showMessage("Running actions: {}/{}".format(run.finished, run.total))
+            return
+        self.executionTimer.stop()
+        future = self.executionFuture
+        self.executionFuture = None
+        self.executionRun = None
+        try:
+            future.result()
+        except Exception:
+            logger.exception("Running actions failed")
+        failed = run.tasksInState(FAILED)
+        skipped = run.tasksInState(SKIPPED)
+        upToDate = run.tasksInState(UPTODATE)
+        for task in failed:
+            logger.error("{} failed: {}".format(task, task.error))
+        self.statusBar().showMessage("Ran {} actions, {} up to date, {} failed, {} skipped".format(
+                                        run.total - len(upToDate), len(upToDate), len(failed), len(skipped)))
 
     def saveas(self):
-        filename = QFileDialog.getSaveFileName(self, "Save Project", "/Users/espennordahl/Desktop", "Projects (*.sg)")[0]
+        filename = QFileDialog.getSaveFileName(self, "Save Project", "/Users/espennordahl/Desktop", "Projects (*.sg *.sgdb)")[0]
+        if not filename:
+            return
         
         self.project.filename = filename
         self.project.name = filename.split("/")[-1]
 
         self.save()
  
+    def exportJson(self):
+        filename = QFileDialog.getSaveFileName(self, "Export Project", "/Users/espennordahl/Desktop", "JSON (*.json)")[0]
+        if not filename:
+            return
+        projectfile.exportJson(self.project, filename)
+
     def updateWindowTitle(self):
         if self.project.name:
             self.setWindowTitle("StuffGrapher - {}".format(self.project.name))
@@ -276,17 +470,37 @@ class MainWindow(QMainWindow):
             self.setWindowTitle("StuffGrapher - <Untitled Project>")
 
     def open(self):
-        filename = QFileDialog.getOpenFileName(self, "Open Project", "/Users/espennordahl/Desktop", "Projects (*.sg)")[0]
-        with open(filename) as infile:
-            data = json.load(infile)
+        filename = QFileDialog.getOpenFileName(self, "Open Project", "/Users/espennordahl/Desktop", "Projects (*.sg *.sgdb *.json)")[0]
+        if not filename:
+            return
 
         self.clearProject()
-        self.project = Project.deserialize(data)
+        if filename.endswith(".sgdb"):
+            self.projectStore = ProjectStore(filename)
+            self.project = self.projectStore.project()
+        elif projectfile.isProjectFile(filename):
+            self.projectFile = projectfile.ProjectFile(filename)
+            self.project = self.projectFile.project()
+        else:
+            self.project = projectfile.importJson(filename)
+
+        ## Left behind if we crashed with unsaved edits
+        recovered = journal.replay(self.project, filename)
+        self.startJournal(filename)
+        if recovered:
+            self.statusBar().showMessage("Recovered {} unsaved edits".format(recovered))
         self.shotBrowser.setProject(self.project)
         self.updateWindowTitle()
 
+    def discardJournal(self):
+        if self.journal:
+            self.journal.discard()
+            self.journal = None
+
     def closeEvent(self, event):
-        if self.undoStack.isClean():
+        self.waitForSave()
+        if self.undoStack.isClean() and not self.project.dirtyShots():
+            self.discardJournal()
             event.accept()
         else:
             msgBox = QMessageBox()
@@ -297,11 +511,24 @@ class MainWindow(QMainWindow):
             ret = msgBox.exec_()
             if ret == QMessageBox.Save:
                 self.save()
+                self.waitForSave()
+                self.discardJournal()
                 event.accept()
             elif ret == QMessageBox.Discard:
+                self.discardJournal()
                 event.accept()
             else:
                 event.ignore()
 
     def clearProject(self):
-        return
+        ## The save may still be reading unloaded shots from the open project
+        self.waitForSave()
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.projectStore:
+            self.projectStore.close()
+            self.projectStore = None
+        if self.projectFile:
+            self.projectFile.close()
+            self.projectFile = None
@@ -8,6 +8,7 @@ from .nodeitem import *
 
 from core import Node, Graph, SceneFile, Action, Data
 from core.attributes import *
+from core.events import *
 
 from .commands import *
 
@@ -19,7 +20,8 @@ class NodeGraphView(QGraphicsView):
     def __init__(self, parent=None):
         super(NodeGraphView, self).__init__(parent)
         self.undoStack = parent.undoStack
-        self.nodes = []
+        ## id(node) -> NodeItem, for the graph currently shown
+        self.nodeItems = {}
         self.shot = None
         self.oldSelection = []
         self.mousePosLocal = QPoint(0,0)
@@ -53,6 +55,9 @@ class NodeGraphView(QGraphicsView):
         if (event.type()==QEvent.KeyPress) and (event.key()==Qt.Key_Tab):
             self.createNodeMenu(self.mousePosGlobal)
             return True
+        elif (event.type()==QEvent.KeyPress) and (event.key() in (Qt.Key_Delete, Qt.Key_Backspace)):
+            self.deleteSelectedNodes()
+            return True
         else:
             return super(NodeGraphView, self).event(event)
 
@@ -74,11 +79,10 @@ class NodeGraphView(QGraphicsView):
 
         if selectedNodes != self.oldSelection:
             oldSelectionItems = []
-            for item in scene.items():
-                if hasattr(item, "node"):
-                    if isinstance(item.node, Node):
-                        if item.node in self.oldSelection:
-                            oldSelectionItems.append(item)
+            for node in self.oldSelection:
+                item = self.itemForNode(node)
+                if item:
+                    oldSelectionItems.append(item)
             command = SelectNodesCommand(self, oldSelectionItems, selection)
             self.undoStack.push(command)
             self.oldSelection = selectedNodes
@@ -89,18 +93,36 @@ class NodeGraphView(QGraphicsView):
             logging.warning("No shot selected. Unable to create node")
             return
         
-        node = self.shot.graph.createNode(classname, "foo") 
-        pos = self.mapToScene(self.mousePosLocal)
-        node["pos.x"].value = pos.x()
-        node["pos.y"].value = pos.y()
-
-        node.graph.graphChanged()
+        with self.shot.graph.batch():
+            node = self.shot.graph.createNode(classname, "foo") 
+            pos = self.mapToScene(self.mousePosLocal)
+            node["pos.x"].value = pos.x()
+            node["pos.y"].value = pos.y()
         
 
-    def addNodeItem(self, node):
+    def deleteSelectedNodes(self):
+        if not self.shot:
+            return
+        nodes = []
+        for item in self.scene().selectedItems():
+            if isinstance(getattr(item, "node", None), Node):
+                nodes.append(item.node)
+        if nodes:
+            command = DeleteNodesCommand(self.shot.graph, nodes)
+            self.undoStack.push(command)
+
+    def addNodeItem(self, item):
         scene = self.scene()
-        scene.addItem(node)
-        self.nodes.append(node)
+        scene.addItem(item)
+        self.nodeItems[id(item.node)] = item
+
+    def removeNodeItem(self, item):
+        del self.nodeItems[id(item.node)]
+        item.removedFromScene()
+        self.scene().removeItem(item)
+
+    def itemForNode(self, node):
+        return self.nodeItems.get(id(node))
 
     def itemFromNode(self, node):
         if isinstance(node, SceneFile):
@@ -116,13 +138,18 @@ class NodeGraphView(QGraphicsView):
 
     def setShot(self, shot):
         logger.debug("Setting shot: " + shot.name)
+        if self.shot and self.shot.graph:
+            self.shot.graph.unsubscribe(self.graphEvent)
         self.shot = shot
         self.scene().clear()
+        self.nodeItems = {}
 
         if not self.shot.graph:
             logger.debug("No graph for shot yet. Creating one")
             self.shot.graph = Graph()
-        self.shot.graph.addGraphChangedCallback(self.graphChanged)
+        ## Weak, so a graph outliving the view (like a shared template)
+        ## doesn't keep calling into it
+        self.shot.graph.subscribe(self.graphEvent, weak=True)
         self.graphChanged()
 
     def shotname(self):
@@ -132,31 +159,76 @@ class NodeGraphView(QGraphicsView):
             return None
 
     def graphChanged(self):
+        """
+        Brings the whole scene in sync with the graph.
+        Edits after that are picked up one by one in graphEvent.
+        """
         graph = self.shot.graph
         logger.debug("Graph has {num} nodes. Populating.".format(num=len(graph.nodes)))
-        items = []
+
         ## Nodes first
-        nodesInScene = []
-        for item in self.scene().items():
-            if hasattr(item, "node"):
-                logger.debug("Node already in scene: {}".format(item.node.name))
-                if item.node in graph.nodes.values():
-                    nodesInScene.append(item.node)
-                    items.append(item)
-                else:
-                    self.scene().removeItem(item)
-                    item.removedFromScene()
+        for item in list(self.nodeItems.values()):
+            if graph.nodes.get(item.node.name) is not item.node:
+                self.removeNodeItem(item)
 
         for node in graph.nodes.values():
-            if node in nodesInScene:
+            if self.itemForNode(node):
                 continue
             logger.debug("Node not in scene. Creating {}".format(node.name))
             item = self.itemFromNode(node)
-            items.append(item)
-            self.addNodeItem(item)
+            if item:
+                self.addNodeItem(item)
 
         ## Then connections
-        for item in items:
+        for item in self.nodeItems.values():
             item.graphChanged()
     
         self.scene().update()
+
+    def graphEvent(self, event):
+        """
+        Updates only the items touched by a change to the graph.
+        """
+        if not self.shot or event.graph is not self.shot.graph:
+            return
+
+        if isinstance(event, NodeAddedEvent):
+            item = self.itemFromNode(event.node)
+            if not item:
+                return
+            self.addNodeItem(item)
+            item.graphChanged()
+            ## Anything already in the scene that takes this node as input
+            for node in event.graph.downstream(event.node):
+                consumer = self.itemForNode(node)
+                if consumer:
+                    consumer.connectInputs()
+
+        elif isinstance(event, NodeRemovedEvent):
+            item = self.itemForNode(event.node)
+            if item:
+                self.removeNodeItem(item)
+
+        elif isinstance(event, ConnectionChangedEvent):
+            item = self.itemForNode(event.node)
+            if item:
+                item.inputsChanged(event.attribute)
+
+        elif isinstance(event, AttributeChangedEvent):
+            item = self.itemForNode(event.node)
+            if not item:
+                return
+            if event.attribute.key in ("pos.x", "pos.y"):
+                item.graphChanged()
+            else:
+                ## Visual names are built from upstream nodes
+                item.update()
+                for node in event.graph.downstream(event.node):
+                    consumer = self.itemForNode(node)
+                    if consumer:
+                        consumer.update()
+
+        elif isinstance(event, NodeRenamedEvent):
+            item = self.itemForNode(event.node)
+            if item:
+                item.update()
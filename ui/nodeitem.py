@@ -98,9 +98,18 @@ class NodeItem(QGraphicsItem):
         self.updating = False
 
     def removedFromScene(self):
-        for input in self.inputs:
-            for line in input.inLines:
-                line.source.itemRemovedFromScene(self)
+        for socket in self.inputs + self.outputs:
+            socket.removeLines()
+
+    def inputsChanged(self, attribute):
+        """
+        Called when the connections of one of our inputs changed.
+        Redraws the lines going into that input only.
+        """
+        for socket in self.inputs:
+            if socket.attribute is attribute:
+                socket.removeLines()
+        self.connectInputs()
 
     def shape(self):
         path = QPainterPath()
@@ -179,15 +188,11 @@ class NodeItem(QGraphicsItem):
 
             for inputNode in inputNodes:
                 logger.debug("Creating input connection: {}<--{}".format(self.node.name, inputNode.name))
-                items = self.scene().items()
-                item = None
-                for x in items:
-                    if isinstance(x, NodeItem):
-                        if x.node == inputNode:
-                            item = x
+                item = self.controller.itemForNode(inputNode)
                 if not item:
-                    logger.error("Couldn't find item by name: " + str(inputNode.name))
-                    raise Exception
+                    ## The upstream item connects us once it's created
+                    logger.debug("No item for input yet: " + str(inputNode.name))
+                    continue
 
                 ## TODO: We should connect to attributes and not nodes..
                 ## But this should work as long for single output nodes
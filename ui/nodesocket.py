@@ -54,10 +54,22 @@ class NodeSocket(QGraphicsItem):
         painter.setPen(self.pen)
         painter.drawEllipse(self.rect)
 
-    def itemRemovedFromScene(self, removeditem):
-        for line in self.outLines:
-            if line.target in removeditem.inputs:
-                self.scene().removeItem(line)
+    def removeLines(self):
+        """
+        Removes every line going into or out of this socket,
+        from the scene as well as from the socket at the other end.
+        """
+        for line in self.inLines + self.outLines:
+            if line is self.newLine:
+                continue
+            if line.source and line.source is not self and line in line.source.outLines:
+                line.source.outLines.remove(line)
+            if line.target and line.target is not self and line in line.target.inLines:
+                line.target.inLines.remove(line)
+            if line.scene():
+                line.scene().removeItem(line)
+        self.inLines = [x for x in self.inLines if x is self.newLine]
+        self.outLines = [x for x in self.outLines if x is self.newLine]
 
     def createNewLine(self, pos=QPointF(0,0)):
         """
@@ -129,11 +141,14 @@ class NodeSocket(QGraphicsItem):
         self.newLine.source = fro
         self.newLine.target = to
 
+        node = fro.parentItem().node
         if isinstance(to.attribute, ArrayInputAttribute):
-            to.attribute.value.append(fro.parentItem().node)
+            if not any(x is node for x in to.attribute.value):
+                to.attribute.append(node)
             to.inLines.append(self.newLine)
         else:
-            to.attribute.value = fro.parentItem().node
+            if to.attribute.value is not node:
+                to.attribute.value = node
             to.clearInLines()
             to.inLines.append(self.newLine)
 
@@ -26,18 +26,31 @@ class ShotItem(QTreeWidgetItem):
         pasteAction = menu.addAction("Paste Graph")
         pasteAction.triggered.connect(self.pasteGraph)
 
+        if self.shot.parentName():
+            overrideAction = menu.addAction("Override Template")
+            overrideAction.setCheckable(True)
+            overrideAction.setChecked(self.shot.override is not None)
+            overrideAction.toggled.connect(self.setOverrides)
+
+    def setOverrides(self, enabled):
+        if enabled:
+            self.shot.enableOverrides()
+        else:
+            self.shot.disableOverrides()
+
     def clearGraph(self):
         self.shot.graph.clear()
 
     def copyGraph(self):
-        self.clipboard["graph"] = self.shot.graph.serialize()
+        ## Only read, so a graph shared with other shots stays shared
+        self.clipboard["graph"] = self.shot.readGraph().serialize()
         logger.debug("Clipped graph: {}".format(self.clipboard))
 
     def pasteGraph(self):
         if self.clipboard:
-            self.shot.graph.clear()
-            self.shot.graph.paste(self.clipboard["graph"])
-            self.shot.graph.graphChanged()
+            with self.shot.graph.batch():
+                self.shot.graph.clear()
+                self.shot.graph.paste(self.clipboard["graph"])
         else:
             logger.debug("No clipboard")
 
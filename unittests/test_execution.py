@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from core import Shot, Graph, Action
+from core.execution import *
+from core import registry
+from core.actioncache import ActionCache
+
+class TestExecution(unittest.TestCase):
+    def createShot(self, name):
+        """
+        Maya render -> Nuke comp, plus an unrelated geo publish.
+        """
+        shot = Shot(name)
+        shot.graph = Graph()
+        maya = shot.graph.createNode("MayaFile", "lighting")
+        render = maya.createAction("RenderAction", "beauty")
+        renderData = render.createData("RenderData")
+        nuke = shot.graph.createNode("NukeFile", "comp")
+        nuke["input"].append(renderData)
+        nuke.createAction("ComprenderAction", "comp")
+        maya.createAction("PublishGeoAction", "geo")
+        return shot
+
+    def test_order(self):
+        shots = [self.createShot("fx010"), self.createShot("fx020")]
+        engine = ExecutionEngine(maxWorkers=4)
+        order = []
+        lock = threading.Lock()
+        def record(task):
+            with lock:
+                order.append(task.key)
+            return task.action.__class__.__name__
+        engine.registerExecutor(Action, FunctionExecutor(record))
+
+        run = engine.run(shots)
+        self.assertTrue(run.succeeded())
+        self.assertEqual(run.finished, 6)
+        for shot in ("fx010", "fx020"):
+            self.assertLess(order.index((shot, "RenderAction")), order.index((shot, "ComprenderAction")))
+
+    def test_executor_per_class(self):
+        engine = ExecutionEngine(maxWorkers=2)
+        engine.registerExecutor(Action, FunctionExecutor(lambda task: "default"))
+        engine.registerExecutor(registry.nodeClass("RenderAction"), FunctionExecutor(lambda task: "render"))
+        run = engine.run([self.createShot("fx010")])
+        results = dict((task.action.name, task.result) for task in run.tasks)
+        self.assertEqual(results["RenderAction"], "render")
+        self.assertEqual(results["ComprenderAction"], "default")
+
+    def test_failure(self):
+        engine = ExecutionEngine(maxWorkers=2)
+        def fail(task):
+            if task.action.name == "RenderAction":
+                raise Exception("render crashed")
+        engine.registerExecutor(Action, FunctionExecutor(fail))
+        run = engine.run([self.createShot("fx010")])
+        states = dict((task.action.name, task.state) for task in run.tasks)
+        self.assertEqual(states, {"RenderAction": FAILED, "ComprenderAction": SKIPPED, "PublishGeoAction": DONE})
+        self.assertEqual(run.finished, 3)
+        self.assertFalse(run.succeeded())
+
+    def test_local_executor(self):
+        engine = ExecutionEngine(maxWorkers=2)
+        engine.registerExecutor(Action, LocalExecutor([sys.executable, "-c", "print('{shot} {class}')"]))
+        engine.registerExecutor(registry.nodeClass("PublishGeoAction"),
+                                LocalExecutor([sys.executable, "-c", "import sys; sys.exit(3)"]))
+        run = engine.run([self.createShot("fx010")])
+        results = dict((task.action.name, task) for task in run.tasks)
+        self.assertEqual(results["RenderAction"].result.strip(), "fx010 RenderAction")
+        self.assertEqual(results["PublishGeoAction"].state, FAILED)
+        self.assertIn("Exit code 3", results["PublishGeoAction"].error)
+
+    def test_throughput(self):
+        shots = [self.createShot("sh{:04d}".format(i)) for i in range(3400)]
+        engine = ExecutionEngine(maxWorkers=8)
+        engine.registerExecutor(Action, FunctionExecutor(lambda task: None))
+        start = time.time()
+        run = engine.run(shots)
+        self.assertEqual(run.total, 10200)
+        self.assertTrue(run.succeeded())
+        self.assertLess(time.time() - start, 30)
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ActionCache(os.path.join(directory, "test.sgcache"))
+            engine = ExecutionEngine(maxWorkers=2, cache=cache)
+            ran = []
+            engine.registerExecutor(Action, FunctionExecutor(lambda task: ran.append(task.action.name)))
+            shot = self.createShot("fx010")
+
+            self.assertEqual(len(engine.wouldRun(engine.plan([shot]))), 3)
+            engine.run([shot])
+            self.assertEqual(len(ran), 3)
+
+            ## Read back from disk, and moving nodes around changes nothing
+            engine.cache = ActionCache(os.path.join(directory, "test.sgcache"))
+            shot.graph.nodes["RenderAction"]["pos.x"] = 100
+            del ran[:]
+            self.assertEqual(engine.wouldRun(engine.plan([shot])), [])
+            run = engine.run([shot])
+            self.assertEqual(ran, [])
+            self.assertTrue(run.succeeded())
+            self.assertEqual(len(run.tasksInState(UPTODATE)), 3)
+
+            shot.graph.nodes["RenderAction"]["subpart"] = "spec"
+            wouldRun = [x.action.name for x in engine.wouldRun(engine.plan([shot]))]
+            self.assertEqual(sorted(wouldRun), ["ComprenderAction", "RenderAction"])
+            engine.run([shot])
+            self.assertEqual(sorted(ran), ["ComprenderAction", "RenderAction"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_cache_outputs(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output = os.path.join(directory, "{shot}_{node}.txt")
+            engine = ExecutionEngine(maxWorkers=2, cache=ActionCache(os.path.join(directory, "test.sgcache")))
+            engine.registerExecutor(Action, LocalExecutor(
+                            [sys.executable, "-c", "open(r'{}', 'w').write('done')".format(output)],
+                            outputs=[output]))
+            shot = self.createShot("fx010")
+            engine.run([shot])
+            self.assertEqual(engine.wouldRun(engine.plan([shot])), [])
+
+            os.remove(os.path.join(directory, "fx010_RenderAction.txt"))
+            wouldRun = [x.action.name for x in engine.wouldRun(engine.plan([shot]))]
+            self.assertEqual(sorted(wouldRun), ["ComprenderAction", "RenderAction"])
+        finally:
+            shutil.rmtree(directory)
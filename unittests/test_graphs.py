@@ -4,6 +4,7 @@ import json
 from random import random, choice
 
 from core import Graph
+from core.events import *
 
 class TestCreate(unittest.TestCase):
     def test_create_demo(self):
@@ -58,9 +59,286 @@ class TestCreate(unittest.TestCase):
         self.assertEqual(action.name, "RenderAction")
         self.assertEqual(data.name, "RenderData")
 
+    def test_downstream(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        action = scenefile.createAction("RenderAction", "dragon")
+        data = action.createData("RenderData")
+        comp = graph.createNode("NukeFile", "comp")
+        comp["input"].append(data)
+
+        self.assertEqual(graph.downstream(scenefile), [action])
+        self.assertEqual(graph.downstream(action), [data])
+        self.assertIs(graph.consumers(data)[0], comp["input"])
+
+        comp["input"].remove(data)
+        self.assertEqual(graph.consumers(data), [])
+
+        comp["input"] = [data]
+        self.assertIs(graph.downstream(data)[0], comp)
+
+        action["scenefile"] = None
+        self.assertEqual(graph.downstream(scenefile), [])
+
+        graph.removeNode(data)
+        self.assertEqual(graph.downstream(action), [])
+
+    def test_downstream_deserialize(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        scenefile.createAction("RenderAction", "dragon")
+        scenefile.createAction("PublishGeoAction", "dragon")
+
+        revivedGraph = Graph.deserialize(graph.serialize())
+        revivedScene = revivedGraph.nodes[scenefile.name]
+        names = sorted(x.name for x in revivedGraph.downstream(revivedScene))
+        self.assertEqual(names, ["PublishGeoAction", "RenderAction"])
+        action = revivedGraph.nodes["RenderAction"]
+        self.assertIn(action["scenefile"], revivedGraph.consumers(revivedScene))
+
+    def test_downstream_paste(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        data = scenefile.createAction("RenderAction", "dragon").createData("RenderData")
+        comp = graph.createNode("NukeFile", "comp")
+        comp["input"] = [data, data]
+
+        graph.paste(graph.serialize())
+        self.assertEqual(len(graph.nodes), 8)
+        pastedData = graph.nodes["RenderData1"]
+        pastedComp = graph.nodes["NukeFile1"]
+        self.assertEqual(graph.consumers(data), [comp["input"], comp["input"]])
+        self.assertEqual(graph.consumers(pastedData), [pastedComp["input"], pastedComp["input"]])
+        self.assertEqual(graph.downstream(graph.nodes["MayaFile1"]), [graph.nodes["RenderAction1"]])
+
+    def test_loops(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        action = scenefile.createAction("RenderAction", "dragon")
+        data = action.createData("RenderData")
+        comp = graph.createNode("NukeFile", "comp")
+        comp["input"].append(data)
+
+        self.assertTrue(comp.isUpstream(scenefile))
+        self.assertFalse(scenefile.isUpstream(comp))
+        self.assertTrue(graph.wouldCreateLoop(data, scenefile))
+        self.assertFalse(graph.wouldCreateLoop(data, graph.createNode("NukeFile", "comp")))
+
+        ## Connecting against the order
+        lateScene = graph.createNode("MayaFile", "lighting")
+        action["scenefile"] = lateScene
+        self.assertTrue(comp.isUpstream(lateScene))
+        self.assertFalse(comp.isUpstream(scenefile))
+        self.assertTrue(graph.wouldCreateLoop(comp, lateScene))
+        self.assertTrue(comp["input"].isLegalConnection(data["out"]))
+
+    def test_diamonds(self):
+        graph = Graph()
+        top = graph.createNode("NukeFile", "comp")
+        bottom = top
+        for i in range(100):
+            left = graph.createNode("NukeFile", "comp")
+            right = graph.createNode("NukeFile", "comp")
+            left["input"].append(bottom)
+            right["input"].append(bottom)
+            bottom = graph.createNode("NukeFile", "comp")
+            bottom["input"] = [left, right]
+        self.assertTrue(bottom.isUpstream(top))
+        self.assertFalse(top.isUpstream(bottom))
+
+    def test_unique_names(self):
+        graph = Graph()
+        nodes = [graph.createNode("RenderAction", "foo") for x in range(0, 5)]
+        self.assertEqual([x.name for x in nodes],
+                ["RenderAction", "RenderAction1", "RenderAction2", "RenderAction3", "RenderAction4"])
+
+        nodes[2].name = "name22"
+        self.assertEqual(graph.createUniqueName("name22"), "name23")
+        self.assertEqual(graph.createUniqueName("name"), "name")
+
+        ## Freed numbers are reused
+        graph.removeNode(nodes[1])
+        self.assertEqual(graph.createNode("RenderAction", "foo").name, "RenderAction1")
+        self.assertEqual(graph.createNode("RenderAction", "foo").name, "RenderAction2")
+        self.assertEqual(graph.createNode("RenderAction", "foo").name, "RenderAction5")
+
+        ## The first free number after the one asked for, even with higher ones in use
+        graph.createNode("RenderAction", "foo").name = "name30"
+        self.assertEqual(graph.createUniqueName("name22"), "name23")
+        graph.removeNode(graph.nodes["RenderAction2"])
+        self.assertEqual(graph.createUniqueName("RenderAction3"), "RenderAction6")
+        self.assertEqual(graph.createUniqueName("RenderAction"), "RenderAction2")
+
+    def test_remove_nodes(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        actions = [scenefile.createAction("RenderAction", "dragon") for x in range(0, 10)]
+        datas = [x.createData("RenderData") for x in actions]
+        comp = graph.createNode("NukeFile", "comp")
+        comp["input"] = datas
+
+        disconnected = graph.removeNodes([scenefile] + datas[:5])
+        self.assertEqual(len(graph.nodes), 16)
+        self.assertEqual(len(disconnected), 15)
+        self.assertNotIn(scenefile.name, graph.nodes)
+        self.assertIsNone(scenefile.graph)
+        for action in actions:
+            self.assertIsNone(action["scenefile"].value)
+        self.assertEqual(len(comp["input"].value), 5)
+        self.assertEqual(graph.consumers(datas[0]), [])
+
+        ## Removing nodes not in the graph is a no-op
+        self.assertEqual(graph.removeNodes([scenefile]), [])
+
+    def test_remove_nodes_restore(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        datas = [scenefile.createAction("RenderAction", "dragon").createData("RenderData") for x in range(0, 5)]
+        comp = graph.createNode("NukeFile", "comp")
+        comp["input"] = datas + [datas[1]]
+
+        removed = [datas[3], datas[1]]
+        disconnected = graph.removeNodes(removed)
+        self.assertEqual([x[2] for x in disconnected], [3, 1, 3])
+        self.assertEqual(comp["input"].value, [datas[0], datas[2], datas[4]])
+
+        ## Like undo does
+        for node in removed:
+            graph.addNode(node)
+        for attribute, node, index in reversed(disconnected):
+            attribute.insert(index, node)
+        self.assertEqual([x.name for x in comp["input"].value], [x.name for x in datas + [datas[1]]])
+        self.assertEqual(len(graph.consumers(datas[1])), 2)
+
+    def test_batch(self):
+        graph = Graph()
+        calls = []
+        graph.addGraphChangedCallback(lambda: calls.append(len(graph.nodes)))
+
+        with graph.batch():
+            for x in range(0, 10):
+                graph.createNode("MayaFile", "lighting")
+            with graph.batch():
+                graph.createNode("NukeFile", "comp")
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [11])
+
+        with graph.batch():
+            pass
+        self.assertEqual(calls, [11])
+
+        graph.paste(graph.serialize())
+        self.assertEqual(calls, [11, 22])
+
+    def test_events(self):
+        graph = Graph()
+        events = []
+        connections = []
+        graph.subscribe(events.append)
+        graph.subscribe(connections.append, ConnectionChangedEvent)
+
+        scenefile = graph.createNode("MayaFile", "lighting")
+        action = scenefile.createAction("RenderAction", "dragon")
+        self.assertIsInstance(events[0], NodeAddedEvent)
+        self.assertIs(events[0].node, scenefile)
+        ## Actions are connected before they're added to the graph
+        self.assertEqual(connections, [])
+
+        action["scenefile"] = None
+        action["scenefile"] = scenefile
+        self.assertEqual(len(connections), 2)
+        self.assertIs(connections[1].node, action)
+        self.assertEqual(connections[1].removed, [])
+        self.assertEqual(connections[1].added, [scenefile])
+
+        del events[:]
+        action["subpart"] = "beauty"
+        self.assertIsInstance(events[0], AttributeChangedEvent)
+        self.assertEqual(events[0].oldValue, "default")
+        self.assertIs(events[0].attribute, action["subpart"])
+
+        del events[:]
+        scenefile.name = "lighting"
+        self.assertIsInstance(events[0], NodeRenamedEvent)
+        self.assertEqual(events[0].oldName, "MayaFile")
+
+        del events[:]
+        with graph.batch():
+            graph.removeNode(scenefile)
+            self.assertEqual(events, [])
+        self.assertEqual([x.__class__ for x in events], [ConnectionChangedEvent, NodeRemovedEvent])
+
+    def test_unsubscribe(self):
+        class Listener:
+            def __init__(self):
+                self.events = []
+                self.changes = 0
+
+            def graphEvent(self, event):
+                self.events.append(event)
+
+            def graphChanged(self):
+                self.changes += 1
+
+        graph = Graph()
+        listener = Listener()
+        graph.subscribe(listener.graphEvent, weak=True)
+        graph.addGraphChangedCallback(listener.graphChanged, weak=True)
+        graph.createNode("MayaFile", "lighting")
+        self.assertEqual(len(listener.events), 1)
+        self.assertEqual(listener.changes, 1)
+
+        graph.unsubscribe(listener.graphEvent)
+        graph.removeGraphChangedCallback(listener.graphChanged)
+        graph.createNode("MayaFile", "lighting")
+        self.assertEqual(len(listener.events), 1)
+        self.assertEqual(listener.changes, 1)
+
+        ## Weak subscriptions don't keep their listener alive
+        graph.subscribe(listener.graphEvent, weak=True)
+        graph.addGraphChangedCallback(listener.graphChanged, weak=True)
+        del listener
+        graph.createNode("MayaFile", "lighting")
+        self.assertEqual(graph._subscribers, [])
+        self.assertEqual(graph._graphChangedCallbacks, [])
+
+        ## Even when filtered to events that don't happen
+        listener = Listener()
+        graph.subscribe(listener.graphEvent, NodeRemovedEvent, weak=True)
+        del listener
+        graph.createNode("MayaFile", "lighting")
+        self.assertEqual(graph._subscribers, [])
+
+
+    def test_content_hash(self):
+        graph = Graph()
+        scenefile = graph.createNode("MayaFile", "lighting")
+        action = scenefile.createAction("RenderAction", "dragon")
+        comp = graph.createNode("NukeFile", "comp")
+        contentHash = graph.contentHash()
+        self.assertEqual(Graph.deserialize(graph.serialize()).contentHash(), contentHash)
+
+        ## Only the edited node and what's downstream of it get hashed again
+        partname = scenefile["partname"].value
+        scenefile["partname"] = "fx"
+        self.assertIsNone(action._hash)
+        self.assertIsNotNone(comp._hash)
+        self.assertNotEqual(graph.contentHash(), contentHash)
+        scenefile["partname"] = partname
+        self.assertEqual(graph.contentHash(), contentHash)
+
+        graph.renameNode(scenefile, "lightingScene")
+        self.assertNotEqual(graph.contentHash(), contentHash)
+        graph.renameNode(scenefile, "MayaFile")
+        self.assertEqual(graph.contentHash(), contentHash)
+
+        graph.removeNodes([comp])
+        self.assertNotEqual(graph.contentHash(), contentHash)
+        graph.addNode(comp)
+        self.assertEqual(graph.contentHash(), contentHash)
+
     def foo(self):
         self.assertEqual(1, 2)
 
 if __name__ == '__main__':
     unittest.main()
-
@@ -0,0 +1,93 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from core import jobspec
+from core import projectfile
+from core.project import Project
+from core import Shot, Graph
+
+class TestJobSpec(unittest.TestCase):
+    def createGraph(self):
+        graph = Graph()
+        maya = graph.createNode("MayaFile", "lighting")
+        render = maya.createAction("RenderAction", "beauty")
+        nuke = graph.createNode("NukeFile", "comp")
+        nuke["input"].append(render.createData("RenderData"))
+        nuke.createAction("ComprenderAction", "comp")
+        return graph
+
+    def createProject(self, children=3):
+        project = Project(name="test project")
+        template = Shot("template1")
+        template.graph = self.createGraph()
+        project.addTemplate(template)
+        shot = Shot("fx010")
+        shot.graph = self.createGraph()
+        project.addShot(shot)
+        for i in range(children):
+            child = Shot("vg{:04d}".format(i))
+            child.parent = template
+            project.addShot(child)
+        return project
+
+    def test_json(self):
+        outfile = io.StringIO()
+        jobspec.writeJson(self.createProject(), outfile)
+        job = json.loads(outfile.getvalue())
+        self.assertEqual(job["title"], "test project")
+        tasks = dict((x["title"], x) for x in job["tasks"])
+        self.assertEqual(len(tasks), 8)
+        self.assertEqual(tasks["fx010:ComprenderAction"]["dependencies"], ["fx010:RenderAction"])
+        self.assertEqual(tasks["vg0000:RenderAction"]["command"],
+                         ["stuffgrapher-action", "RenderAction", "vg0000", "RenderAction"])
+        self.assertEqual(tasks["vg0001:RenderAction"]["instance"], "vg0000:RenderAction")
+
+    def test_template_dedupe(self):
+        outfile = io.StringIO()
+        project = self.createProject()
+        project.shots["vg0002"].enableOverrides()
+        jobspec.writeJson(project, outfile)
+        tasks = json.loads(outfile.getvalue())["tasks"]
+        ## Written for fx010, vg0000, and vg0002 which has overrides
+        self.assertEqual(len([x for x in tasks if "command" in x]), 6)
+        instances = dict((x["title"], x["instance"]) for x in tasks if "instance" in x)
+        self.assertEqual(instances, {"vg0001:RenderAction": "vg0000:RenderAction",
+                                     "vg0001:ComprenderAction": "vg0000:ComprenderAction"})
+
+    def test_alf(self):
+        outfile = io.StringIO()
+        jobspec.writeAlf(self.createProject(children=1), outfile)
+        alf = outfile.getvalue()
+        self.assertTrue(alf.startswith("##AlfredToDo 3.0\nJob -title {test project} -subtasks {"))
+        self.assertEqual(alf.count("{"), alf.count("}"))
+        ## The render is nested in the comp that waits on it
+        comp = alf.index("Task -title fx010:ComprenderAction")
+        render = alf.index("Task -title fx010:RenderAction")
+        self.assertLess(comp, render)
+        self.assertIn("RemoteCmd {stuffgrapher-action RenderAction vg0000 RenderAction} -service PixarRender", alf)
+
+    def test_streaming(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "test.sg")
+            project = self.createProject(children=0)
+            for i in range(50):
+                shot = Shot("sh{:04d}".format(i))
+                shot.graph = self.createGraph()
+                project.addShot(shot)
+            projectfile.save(project, filename)
+
+            project = projectfile.read(filename)
+            tasks = jobspec.jobTasks(project)
+            shot, shotTasks = next(tasks)
+            self.assertEqual(len(shotTasks), 2)
+            self.assertFalse(project.shots["sh0049"].isLoaded())
+            self.assertEqual(len(list(tasks)), 50)
+            ## Read without being kept loaded
+            self.assertFalse(any(x.isLoaded() for x in project.shots.values()))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from core import projectfile
+from core import journal
+from core.project import Project
+from core import Shot, Graph
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "test.sg")
+        project = Project(name="test.sg")
+        template = Shot("template1")
+        template.graph = Graph()
+        template.graph.createNode("NukeFile", "comp")
+        project.addTemplate(template)
+        for shotname in ["fx010", "fx020"]:
+            shot = Shot(shotname)
+            shot.graph = Graph()
+            scenefile = shot.graph.createNode("MayaFile", "lighting")
+            scenefile.createAction("RenderAction", "dragon")
+            project.addShot(shot)
+        projectfile.save(project, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def edit(self, project):
+        graph = project.shots["fx010"].graph
+        scenefile = graph.createNode("MayaFile", "fx")
+        render = graph.nodes["RenderAction"]
+        render["subpart"] = "beauty"
+        render["scenefile"] = scenefile
+        graph.renameNode(scenefile, "fxScene")
+        graph.removeNodes([graph.nodes["MayaFile"]])
+
+        child = Shot("fx030")
+        child.parent = project.templates["template1"]
+        project.addShot(child)
+        project.shots["fx020"].name = "fx025"
+        project.shots["fx025"] = project.shots.pop("fx020")
+
+    def test_replay(self):
+        project = projectfile.read(self.filename)
+        log = journal.Journal(project, self.filename)
+        self.edit(project)
+        log.commit()
+        project.templates["template1"].graph.createNode("NukeFile", "slapcomp")
+        log.commit()
+        log.close()
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(journal.replay(recovered, self.filename), 2)
+        self.assertEqual(list(recovered.shots.keys()), ["fx010", "fx030", "fx025"])
+        self.assertEqual(recovered, project)
+        render = recovered.shots["fx010"].graph.nodes["RenderAction"]
+        self.assertIs(render["scenefile"].value, recovered.shots["fx010"].graph.nodes["fxScene"])
+        self.assertIs(recovered.shots["fx030"].graph, recovered.templates["template1"].graph)
+
+    def test_incomplete_record(self):
+        project = projectfile.read(self.filename)
+        log = journal.Journal(project, self.filename)
+        project.shots["fx010"].graph.nodes["RenderAction"]["subpart"] = "beauty"
+        log.commit()
+        project.shots["fx010"].graph.nodes["RenderAction"]["subpart"] = "spec"
+        log.commit()
+        log.close()
+        with open(journal.journalName(self.filename), "r+") as journalFile:
+            journalFile.truncate(os.path.getsize(journal.journalName(self.filename)) - 10)
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(journal.replay(recovered, self.filename), 1)
+        self.assertEqual(recovered.shots["fx010"].graph.nodes["RenderAction"]["subpart"].value, "beauty")
+
+    def test_checkpoint(self):
+        project = projectfile.read(self.filename)
+        log = journal.Journal(project, self.filename)
+        project.shots["fx010"].graph.createNode("NukeFile", "comp")
+        log.checkpoint()
+        job = projectfile.SaveJob(project, self.filename)
+        ## Edits made while saving stay in the journal
+        project.shots["fx020"].graph.createNode("NukeFile", "comp")
+        log.commit()
+        job.run()
+        job.finish()
+        log.saved()
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(len(recovered.shots["fx020"].graph.nodes), 2)
+        self.assertEqual(journal.replay(recovered, self.filename), 1)
+        self.assertEqual(recovered, project)
+
+        log.discard()
+        self.assertFalse(os.path.exists(journal.journalName(self.filename)))
+
+    def test_crash_after_save(self):
+        project = projectfile.read(self.filename)
+        log = journal.Journal(project, self.filename)
+        project.shots["fx010"].graph.createNode("NukeFile", "comp")
+        log.checkpoint()
+        projectfile.save(project, self.filename)
+        project.shots["fx020"].graph.createNode("NukeFile", "comp")
+        log.commit()
+        ## Crashed before log.saved()
+        log.close()
+        self.assertTrue(os.path.exists(journal.journalName(self.filename) + journal.SAVING))
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(journal.replay(recovered, self.filename), 1)
+        self.assertEqual(sorted(recovered.shots["fx010"].graph.nodes), ["MayaFile", "NukeFile", "RenderAction"])
+        self.assertEqual(recovered, project)
+
+    def test_overrides(self):
+        project = projectfile.read(self.filename)
+        child = Shot("fx030")
+        child.parent = project.templates["template1"]
+        project.addShot(child)
+        projectfile.save(project, self.filename)
+
+        log = journal.Journal(project, self.filename)
+        child.enableOverrides()
+        child.graph.createNode("HoudiniFile", "fx")
+        log.commit()
+        child.graph.nodes["NukeFile"]["partname"] = "slap"
+        log.commit()
+        log.close()
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(journal.replay(recovered, self.filename), 2)
+        self.assertEqual(recovered, project)
+        self.assertEqual(len(recovered.templates["template1"].graph.nodes), 1)
+
+    def test_unresolved_overrides(self):
+        project = projectfile.read(self.filename)
+        child = Shot("fx030")
+        child.parent = project.templates["template1"]
+        project.addShot(child)
+        child.enableOverrides()
+        child.graph.createNode("HoudiniFile", "fx")
+        projectfile.save(project, self.filename)
+
+        project = projectfile.read(self.filename)
+        log = journal.Journal(project, self.filename)
+        project.shots["fx010"].graph.nodes["RenderAction"]["subpart"] = "beauty"
+        project.shots["fx030"].name = "fx035"
+        project.shots["fx035"] = project.shots.pop("fx030")
+        log.commit()
+        ## Renamed, but its overrides are journaled without resolving them
+        self.assertFalse(project.shots["fx035"].override.isResolved())
+        log.close()
+
+        recovered = projectfile.read(self.filename)
+        self.assertEqual(journal.replay(recovered, self.filename), 1)
+        self.assertEqual(recovered, project)
+        self.assertIn("HoudiniFile", recovered.shots["fx035"].graph.nodes)
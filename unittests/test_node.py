@@ -26,3 +26,53 @@ class Tests(unittest.TestCase):
         for attribute in obj1.attributes:
             self.assertEqual(obj1[attribute], obj2[attribute])
         self.assertEqual(obj1, obj2)
+
+    def test_shared_schema(self):
+        from core.scenefiles import MayaFile
+        obj1 = MayaFile("foo")
+        obj2 = MayaFile("bar")
+        self.assertIs(obj1._schema, obj2._schema)
+        self.assertIs(obj1["template"].elements, obj2["template"].elements)
+        obj2["department"] = "anim"
+        self.assertIs(obj1._schema, obj2._schema)
+        self.assertEqual(obj1["department"].value, "lit")
+
+        ## Changes to one node's schema leave the other's alone
+        obj2["template"].addElement("TestTemplate")
+        self.assertIsNot(obj1._schema, obj2._schema)
+        self.assertNotIn("TestTemplate", obj1["template"].elements)
+
+        ## Attributes keep their own values
+        obj1["partname"] = "other"
+        self.assertEqual(obj2["partname"].value, "main")
+
+        ## Connection callbacks are shared too, and still called with the right node
+        self.assertFalse(obj2["input"].isLegalConnection(Node("foo")["out"]))
+
+    def test_create(self):
+        from core.scenefiles import HoudiniFile
+        obj1 = HoudiniFile("foo")
+        obj2 = HoudiniFile.create("foo")
+        obj3 = HoudiniFile.create("bar")
+        self.assertIsInstance(obj2, HoudiniFile)
+        self.assertEqual(obj1, obj2)
+        self.assertEqual(obj1.serialize(), obj2.serialize())
+        self.assertEqual(obj3.match, "bar")
+
+        ## Copies don't share anything they can change
+        data = obj2.createAction("RenderAction", "foo").createData("RenderData")
+        obj2["input"].append(data)
+        self.assertEqual(obj3["input"].value, [])
+        obj2["partname"] = "other"
+        self.assertEqual(obj3["partname"].value, "main")
+
+    def test_create_all(self):
+        ## Every node class builds the same node from its prototype as from __init__
+        import core.scenefiles, core.actions, core.data
+        from core import registry
+        for name, cls in registry.nodeClasses().items():
+            created = cls.create("foo")
+            built = cls("foo")
+            self.assertIs(created._schema, built._schema, name)
+            self.assertEqual(created.serialize(), built.serialize(), name)
+            self.assertEqual(getattr(created, "__dict__", {}), getattr(built, "__dict__", {}), name)
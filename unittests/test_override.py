@@ -0,0 +1,148 @@
+import gc
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from core import projectfile
+from core.projectdb import ProjectStore
+from core.project import Project
+from core import Shot, Graph
+
+class TestOverride(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def createProject(self):
+        project = Project(name="test.sg")
+        template = Shot("template1")
+        template.graph = Graph()
+        scenefile = template.graph.createNode("MayaFile", "lighting")
+        scenefile.createAction("RenderAction", "dragon")
+        template.graph.createNode("NukeFile", "comp")
+        project.addTemplate(template)
+        for shotname in ["fx010", "fx020"]:
+            shot = Shot(shotname)
+            shot.parent = template
+            project.addShot(shot)
+        shot = project.shots["fx010"]
+        shot.enableOverrides()
+        graph = shot.graph
+        graph.nodes["RenderAction"]["subpart"] = "beauty"
+        graph.removeNodes([graph.nodes["NukeFile"]])
+        graph.createNode("HoudiniFile", "fx")
+        return project
+
+    def test_overrides(self):
+        project = self.createProject()
+        template = project.templates["template1"]
+        shot = project.shots["fx010"]
+        self.assertIsNot(shot.graph, template.graph)
+        self.assertIs(project.shots["fx020"].graph, template.graph)
+        self.assertEqual(sorted(shot.graph.nodes.keys()), ["HoudiniFile", "MayaFile", "RenderAction"])
+        self.assertEqual(sorted(template.graph.nodes.keys()), ["MayaFile", "NukeFile", "RenderAction"])
+        self.assertEqual(template.graph.nodes["RenderAction"]["subpart"].value, "default")
+        self.assertEqual([x["op"] for x in shot.override.ops()], ["remove", "add", "set"])
+
+    def test_template_changes(self):
+        project = self.createProject()
+        template = project.templates["template1"]
+        shot = project.shots["fx010"]
+        graph = shot.graph
+
+        template.graph.createNode("NukeFile", "slapcomp")
+        template.graph.nodes["RenderAction"]["subpart"] = "spec"
+        template.graph.nodes["MayaFile"]["partname"] = "fx"
+        ## Resolved again in place
+        self.assertIs(shot.graph, graph)
+        self.assertIn("NukeFile1", graph.nodes)
+        self.assertEqual(graph.nodes["MayaFile"]["partname"].value, "fx")
+        self.assertEqual(graph.nodes["RenderAction"]["subpart"].value, "beauty")
+        self.assertIs(graph.nodes["RenderAction"]["scenefile"].value, graph.nodes["MayaFile"])
+        self.assertEqual(len(shot.override.ops()), 3)
+
+    def test_serialization(self):
+        project = self.createProject()
+        root = json.loads(json.dumps(project.serialize()))
+        self.assertIsNone(root["shots"]["fx010"]["graph"])
+        self.assertEqual(len(root["shots"]["fx010"]["override"]["ops"]), 3)
+
+        project2 = Project.deserialize(root)
+        self.assertEqual(project, project2)
+        self.assertEqual(sorted(project2.shots["fx010"].graph.nodes.keys()),
+                         sorted(project.shots["fx010"].graph.nodes.keys()))
+
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(project, filename)
+        project3 = projectfile.read(filename)
+        self.assertEqual(project, project3)
+
+        store = ProjectStore(os.path.join(self.directory, "test.sgdb"))
+        store.save(project)
+        project4 = store.project()
+        self.assertEqual(project, project4)
+        project4.shots["fx010"].disableOverrides()
+        store.save(project4)
+        self.assertEqual(store.connection.execute("SELECT COUNT(*) FROM overrides").fetchone()[0], 0)
+        store.close()
+
+    def test_dirty(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        shot = project.shots["fx010"]
+        shot.graph
+        self.assertFalse(shot.isDirty())
+        shot.graph.nodes["RenderAction"]["subpart"] = "spec"
+        self.assertTrue(shot.isDirty())
+        projectfile.save(project, filename)
+        self.assertEqual(projectfile.read(filename).shots["fx010"].graph.nodes["RenderAction"]["subpart"].value, "spec")
+
+    def test_template_clash(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        template = project.templates["template1"]
+        ## Before the shot was ever resolved, then after
+        template.graph.createNode("HoudiniFile", "fromTemplate")
+        graph = project.shots["fx010"].graph
+        self.assertEqual(graph.nodes["HoudiniFile"].match, "fromTemplate")
+        self.assertEqual(graph.nodes["HoudiniFile1"].match, "fx")
+        self.assertTrue(project.shots["fx010"].isDirty())
+        projectfile.save(project, filename)
+
+        project = projectfile.read(filename)
+        graph = project.shots["fx010"].graph
+        self.assertEqual(graph.nodes["HoudiniFile"].match, "fromTemplate")
+        self.assertEqual(graph.nodes["HoudiniFile1"].match, "fx")
+        project.templates["template1"].graph.createNode("HoudiniFile", "again")
+        self.assertEqual(project.shots["fx010"].graph.nodes["HoudiniFile2"].match, "fx")
+        projectfile.save(project, filename)
+        graph = projectfile.read(filename).shots["fx010"].graph
+        self.assertEqual(sorted(x.match for x in graph.nodes.values() if x.name.startswith("HoudiniFile")),
+                         ["again", "fromTemplate", "fx"])
+
+    def test_unused_graph(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        shot = project.shots["fx010"]
+        template = project.templates["template1"].graph
+        graph = shot.graph
+        ## Copies of the template's nodes share their values
+        self.assertIs(graph.nodes["MayaFile"]["partname"].value, template.nodes["MayaFile"]["partname"].value)
+        ## Nodes and their graph refer to each other, so it takes a collection
+        del graph
+        gc.collect()
+        self.assertFalse(shot.override.isResolved())
+        shot.graph.nodes["RenderAction"]["subpart"] = "spec"
+        ## Kept while it has unsaved edits
+        self.assertTrue(shot.override.isResolved())
+        projectfile.save(project, filename)
+        gc.collect()
+        self.assertFalse(shot.override.isResolved())
+        self.assertEqual(shot.graph.nodes["RenderAction"]["subpart"].value, "spec")
@@ -1,6 +1,8 @@
 import unittest
+import json
 
 from core.project import Project
+from core import Shot, Graph
 
 
 
@@ -10,3 +12,59 @@ class TestProject(unittest.TestCase):
         json = project.serialize()
         project2 = Project.deserialize(json)
         self.assertEqual(project, project2)
+
+    def createProject(self):
+        project = Project(name="test.sg")
+        template = Shot("template1")
+        template.graph = Graph()
+        template.graph.createNode("NukeFile", "comp")
+        project.addTemplate(template)
+        for shotname in ["fx010", "fx020"]:
+            shot = Shot(shotname)
+            shot.graph = Graph()
+            scenefile = shot.graph.createNode("MayaFile", "lighting")
+            scenefile.createAction("RenderAction", "dragon")
+            project.addShot(shot)
+        return project
+
+    def test_lazy_loading(self):
+        project = self.createProject()
+        root = json.loads(json.dumps(project.serialize()))
+        project2 = Project.deserialize(root)
+
+        for shot in project2.shots.values():
+            self.assertFalse(shot.isLoaded())
+
+        ## Unloaded shots serialize straight from their data
+        self.assertEqual(project2.serialize(), root)
+
+        shot = project2.shots["fx010"]
+        self.assertEqual(len(shot.graph.nodes), 2)
+        self.assertTrue(shot.isLoaded())
+        self.assertFalse(project2.shots["fx020"].isLoaded())
+        self.assertEqual(project, project2)
+
+    def test_separate_projects(self):
+        project = Project()
+        project.addShot(Shot("fx010"))
+        self.assertEqual(Project().shots, {})
+
+    def test_inherited_graphs(self):
+        project = self.createProject()
+        template = project.templates["template1"]
+        for i in range(100):
+            child = Shot("vg{:03d}".format(i))
+            child.parent = template
+            project.addShot(child)
+
+        root = json.loads(json.dumps(project.serialize()))
+        self.assertIsNone(root["shots"]["vg000"]["graph"])
+        self.assertEqual(root["shots"]["vg000"]["parent"], "template1")
+
+        project2 = Project.deserialize(root)
+        self.assertEqual(project, project2)
+        template2 = project2.templates["template1"]
+        for i in range(100):
+            child = project2.shots["vg{:03d}".format(i)]
+            self.assertIs(child.parent, template2)
+            self.assertIs(child.graph, template2.graph)
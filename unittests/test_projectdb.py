@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from core.projectdb import ProjectStore
+from core.project import Project
+from core import Shot, Graph
+from core.override import Override
+
+class TestProjectStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "test.sgdb")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def createProject(self):
+        project = Project(name="test.sgdb")
+        template = Shot("template1")
+        template.graph = Graph()
+        template.graph.createNode("HoudiniFile", "fx")
+        project.addTemplate(template)
+        for shotname in ["fx010", "fx020", "fx030"]:
+            shot = Shot(shotname)
+            shot.graph = Graph()
+            scenefile = shot.graph.createNode("MayaFile", "lighting")
+            scenefile.createAction("RenderAction", "dragon")
+            project.addShot(shot)
+        child = Shot("fx040")
+        child.parent = template
+        project.addShot(child)
+        return project
+
+    def test_roundtrip(self):
+        project = self.createProject()
+        store = ProjectStore(self.filename)
+        store.save(project)
+        store.close()
+
+        store = ProjectStore(self.filename)
+        project2 = store.project()
+        for shot in project2.shots.values():
+            self.assertFalse(shot.isLoaded())
+        self.assertEqual(project, project2)
+        self.assertIs(project2.shots["fx040"].graph, project2.templates["template1"].graph)
+        store.close()
+
+    def test_incremental(self):
+        store = ProjectStore(self.filename)
+        store.save(self.createProject())
+        store.close()
+
+        store = ProjectStore(self.filename)
+        project = store.project()
+        statements = []
+        store.connection.set_trace_callback(statements.append)
+
+        store.save(project)
+        writes = [x for x in statements if x.startswith(("INSERT", "DELETE"))]
+        ## Besides moving the generation on, see core/journal.py
+        self.assertEqual(writes, ["INSERT OR REPLACE INTO project VALUES ('generation', '2')"])
+
+        ## Loading without changing writes nothing either
+        project.shots["fx010"].graph
+        del statements[:]
+        store.save(project)
+        writes = [x for x in statements if x.startswith(("INSERT", "DELETE"))]
+        self.assertEqual(writes, ["INSERT OR REPLACE INTO project VALUES ('generation', '3')"])
+
+        project.shots["fx010"].graph.nodes["RenderAction"]["subpart"] = "beauty"
+        del statements[:]
+        changes = store.connection.total_changes
+        store.save(project)
+        ## The edited node's rows, the new graph's list of nodes, the shot's row
+        ## and the generation.
+        ## The old graph is still fx020's and fx030's, so nothing is deleted
+        writes = [x for x in statements if x.startswith(("INSERT", "DELETE")) and "attributes" in x]
+        nodeHash = store.connection.execute("SELECT node FROM attributes WHERE value=?", ('"beauty"',)).fetchone()[0]
+        self.assertTrue(all(nodeHash in x for x in writes))
+        node = project.shots["fx010"].graph.nodes["RenderAction"]
+        self.assertEqual(store.connection.total_changes - changes, 1 + len(node.attributes) + 2 + 1 + 1)
+        store.close()
+
+        project2 = ProjectStore(self.filename).project()
+        self.assertEqual(project2.shots["fx010"].graph.nodes["RenderAction"]["subpart"].value, "beauty")
+
+    def test_clean_shots_skipped(self):
+        project = self.createProject()
+        project.shots["fx040"].enableOverrides()
+        project.shots["fx040"].graph.nodes["HoudiniFile"]["partname"] = "sim"
+        store = ProjectStore(self.filename)
+        store.save(project)
+        store.close()
+
+        store = ProjectStore(self.filename)
+        project = store.project()
+        for shot in project.shots.values():
+            shot.graph
+        with mock.patch.object(Graph, "serialize", autospec=True, side_effect=Graph.serialize) as graphSerialize, \
+             mock.patch.object(Override, "serialize", autospec=True, side_effect=Override.serialize) as overrideSerialize:
+            store.save(project)
+            graphSerialize.assert_not_called()
+            overrideSerialize.assert_not_called()
+
+            project.shots["fx020"].graph.nodes["RenderAction"]["subpart"] = "beauty"
+            store.save(project)
+            self.assertEqual(graphSerialize.call_count, 1)
+            overrideSerialize.assert_not_called()
+        store.close()
+
+    def count(self, store, query):
+        return store.connection.execute(query).fetchone()[0]
+
+    def test_shared_graphs(self):
+        store = ProjectStore(self.filename)
+        store.save(self.createProject())
+        ## fx010 to fx030 have the same graph, stored once
+        self.assertEqual(self.count(store, "SELECT COUNT(DISTINCT graph) FROM shots"), 1)
+        self.assertEqual(self.count(store, "SELECT COUNT(*) FROM nodes"), 3)
+        store.close()
+
+        store = ProjectStore(self.filename)
+        project = store.project()
+        graph = project.shots["fx020"].graph
+        self.assertIs(project.shots["fx010"].readGraph(), graph)
+
+        ## Only the node that changed is added
+        graph.nodes["RenderAction"]["subpart"] = "beauty"
+        self.assertIsNot(project.shots["fx010"].readGraph(), graph)
+        store.save(project)
+        self.assertEqual(self.count(store, "SELECT COUNT(DISTINCT graph) FROM shots"), 2)
+        self.assertEqual(self.count(store, "SELECT COUNT(*) FROM nodes"), 4)
+
+        ## And rows nothing points at any more are deleted
+        for name in ["fx010", "fx030"]:
+            project.shots[name].graph.nodes["RenderAction"]["subpart"] = "beauty"
+        store.save(project)
+        self.assertEqual(self.count(store, "SELECT COUNT(DISTINCT graph) FROM shots"), 1)
+        self.assertEqual(self.count(store, "SELECT COUNT(*) FROM nodes"), 3)
+        self.assertEqual(self.count(store, "SELECT COUNT(DISTINCT node) FROM attributes"), 3)
+        self.assertEqual(project, ProjectStore(self.filename).project())
+        store.close()
+
+    def test_query(self):
+        store = ProjectStore(self.filename)
+        store.save(self.createProject())
+        self.assertEqual(store.shotsWithNodeClass("HoudiniFile"), ["fx040"])
+        self.assertEqual(store.shotsWithNodeClass("MayaFile"), ["fx010", "fx020", "fx030"])
+        store.close()
@@ -0,0 +1,272 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+
+from core import projectfile
+from core.projectdb import ProjectStore
+from core.project import Project
+from core import Shot, Graph
+
+class TestProjectFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def createProject(self):
+        project = Project(name="test.sg")
+        template = Shot("template1")
+        template.graph = Graph()
+        template.graph.createNode("NukeFile", "comp")
+        project.addTemplate(template)
+        for shotname in ["fx010", "fx020", "fx030"]:
+            shot = Shot(shotname)
+            shot.graph = Graph()
+            scenefile = shot.graph.createNode("MayaFile", "lighting")
+            scenefile.createAction("RenderAction", "dragon")
+            project.addShot(shot)
+        child = Shot("fx040")
+        child.parent = template
+        project.addShot(child)
+        return project
+
+    def test_roundtrip(self):
+        project = self.createProject()
+        for codec in projectfile.CODECS:
+            filename = os.path.join(self.directory, codec + ".sg")
+            projectfile.write(project, filename, codec)
+            self.assertTrue(projectfile.isProjectFile(filename))
+
+            project2 = projectfile.read(filename)
+            for shot in project2.shots.values():
+                self.assertFalse(shot.isLoaded())
+            self.assertEqual(project, project2)
+            self.assertIs(project2.shots["fx040"].graph, project2.templates["template1"].graph)
+
+    def test_random_access(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.write(self.createProject(), filename)
+        projectFile = projectfile.ProjectFile(filename)
+        root = projectFile.readShot("fx020")
+        self.assertEqual(root["name"], "fx020")
+        self.assertEqual(len(root["graph"]["nodes"]), 2)
+        projectFile.close()
+
+    def test_convert(self):
+        source = os.path.join(os.path.dirname(__file__), "..", "projects", "test.sg")
+        chunked = os.path.join(self.directory, "test.sg")
+        exported = os.path.join(self.directory, "test.json")
+        projectfile.convert(source, chunked)
+        projectfile.convert(chunked, exported)
+        self.assertFalse(projectfile.isProjectFile(exported))
+
+        with open(source) as infile:
+            original = json.load(infile)
+        with open(exported) as infile:
+            self.assertEqual(json.load(infile), original)
+
+    def test_overwrite_while_reading(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.write(self.createProject(), filename)
+        project = projectfile.read(filename)
+        projectfile.write(Project(name="other"), filename)
+        self.assertEqual(len(project.shots["fx030"].graph.nodes), 2)
+
+    def test_incremental_save(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        self.assertEqual(project.dirtyShots(), [])
+        size = os.path.getsize(filename)
+
+        ## Looking at a shot doesn't make it dirty
+        project.shots["fx010"].graph
+        self.assertEqual(project.dirtyShots(), [])
+
+        graph = project.shots["fx020"].graph
+        graph.createNode("NukeFile", "comp")
+        self.assertEqual(project.dirtyShots(), [project.shots["fx020"]])
+
+        self.assertTrue(projectfile.save(project, filename))
+        self.assertEqual(project.dirtyShots(), [])
+        self.assertGreater(os.path.getsize(filename), size)
+        ## Shots that weren't touched are still read from their old chunks
+        self.assertFalse(project.shots["fx030"].isLoaded())
+        self.assertEqual(len(project.shots["fx030"].graph.nodes), 2)
+
+        project2 = projectfile.read(filename)
+        self.assertEqual(len(project2.shots["fx020"].graph.nodes), 3)
+        self.assertEqual(project, project2)
+
+    def test_unchanged_save(self):
+        filename = os.path.join(self.directory, "test.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        ## Hashes come from the index, so comparing doesn't load anything
+        self.assertEqual(project, projectfile.read(filename))
+        self.assertFalse(project.shots["fx010"].isLoaded())
+
+        render = project.shots["fx010"].graph.nodes["RenderAction"]
+        subpart = render["subpart"].value
+        render["subpart"] = "beauty"
+        render["subpart"] = subpart
+        self.assertTrue(project.shots["fx010"].isDirty())
+        _, index = projectfile.readIndex(filename)
+        projectfile.save(project, filename)
+        ## Edited, but back the way it was saved, so its chunk is kept
+        self.assertEqual(project.dirtyShots(), [])
+        self.assertEqual(projectfile.readIndex(filename)[1]["shots"]["fx010"], index["shots"]["fx010"])
+
+    def test_shared_graphs(self):
+        filename = os.path.join(self.directory, "test.sg")
+        project = self.createProject()
+        pasted = Shot("fx050")
+        pasted.graph = Graph()
+        pasted.graph.paste(project.shots["fx010"].graph.serialize())
+        project.addShot(pasted)
+        projectfile.save(project, filename)
+        _, index = projectfile.readIndex(filename)
+        offsets = set(index["shots"][x]["offset"] for x in ["fx010", "fx020", "fx030", "fx050"])
+        self.assertEqual(len(offsets), 1)
+
+        projectFile = projectfile.ProjectFile(filename)
+        project2 = projectFile.project()
+        self.assertEqual(projectFile.readShot("fx020")["name"], "fx020")
+        ## Read as a single graph
+        graphs = [project2.shots[x].readGraph() for x in ["fx010", "fx020", "fx030", "fx050"]]
+        self.assertEqual(len(set(id(x) for x in graphs)), 1)
+        self.assertFalse(project2.shots["fx010"].isLoaded())
+        self.assertEqual(project, project2)
+
+        ## Looking at a shot's graph keeps it shared
+        self.assertIs(project2.shots["fx030"].graph, graphs[0])
+        graph = project2.shots["fx020"].graph
+        self.assertIs(graph, graphs[0])
+        self.assertIs(project2.shots["fx010"].readGraph(), graph)
+        self.assertEqual(project2.dirtyShots(), [])
+
+        ## Once edited, it's the shot that last handed it out's, and the others stop sharing it
+        graph.createNode("NukeFile", "comp")
+        self.assertIs(project2.shots["fx020"].graph, graph)
+        self.assertIsNot(project2.shots["fx030"].graph, graph)
+        self.assertEqual(len(project2.shots["fx010"].readGraph().nodes), 2)
+        self.assertFalse(project2.shots["fx010"].isLoaded())
+        self.assertEqual(project2.dirtyShots(), [project2.shots["fx020"]])
+        projectfile.save(project2, filename)
+        _, index = projectfile.readIndex(filename)
+        self.assertNotEqual(index["shots"]["fx020"]["offset"], index["shots"]["fx010"]["offset"])
+        self.assertEqual(index["shots"]["fx030"]["offset"], index["shots"]["fx010"]["offset"])
+        self.assertEqual(project2, projectfile.read(filename))
+        projectFile.close()
+
+    def test_compaction(self):
+        filename = os.path.join(self.directory, "test.sg")
+        project = self.createProject()
+        projectfile.save(project, filename)
+        for i in range(3):
+            for shot in project.shots.values():
+                shot.graph.createNode("NukeFile", "comp")
+            projectfile.save(project, filename)
+        _, index = projectfile.readIndex(filename)
+        live = projectfile.HEADER.size + sum(entry["length"] for group in ("templates", "shots")
+                                                                for entry in index[group].values())
+        self.assertLessEqual(1.0 - float(live) / os.path.getsize(filename), projectfile.MAX_GARBAGE + 0.1)
+        self.assertEqual(project, projectfile.read(filename))
+
+    def test_save_elsewhere(self):
+        filename = os.path.join(self.directory, "test.sg")
+        other = os.path.join(self.directory, "other.sg")
+        project = self.createProject()
+        projectfile.save(project, filename)
+        self.assertFalse(projectfile.save(project, other))
+        self.assertEqual(project.source, os.path.abspath(other))
+
+    def test_reopen_after_write(self):
+        filename = os.path.join(self.directory, "test.sg")
+        other = os.path.join(self.directory, "other.sg")
+        project = self.createProject()
+        project.shots["fx040"].enableOverrides()
+        project.shots["fx040"].graph.createNode("NukeFile", "comp")
+        projectfile.save(project, filename)
+
+        projectFile = projectfile.ProjectFile(filename)
+        project = projectFile.project()
+        job = projectfile.SaveJob(project, other)
+        job.run()
+        job.finish()
+        ## Unloaded shots read from the new file from now on
+        projectFile.close()
+        self.assertEqual(len(project.shots["fx010"].graph.nodes), 2)
+        self.assertEqual(len(project.shots["fx040"].graph.nodes), 2)
+        self.assertEqual(project, projectfile.read(other))
+        job.projectFile.close()
+
+    def test_edit_while_saving(self):
+        filename = os.path.join(self.directory, "test.sg")
+        project = self.createProject()
+        projectfile.save(project, filename)
+
+        project.shots["fx010"].graph.createNode("NukeFile", "comp")
+        job = projectfile.SaveJob(project, filename)
+        self.assertEqual(job.total, 1)
+        self.assertEqual(project.dirtyShots(), [])
+        ## Made after the snapshot, so it's left for the next save
+        project.shots["fx020"].graph.createNode("NukeFile", "comp")
+        project.shots["fx010"].graph.nodes["RenderAction"]["subpart"] = "beauty"
+        thread = threading.Thread(target=job.run)
+        thread.start()
+        thread.join()
+        job.finish()
+        self.assertEqual(job.done, 1)
+        self.assertEqual(project.dirtyShots(), [project.shots["fx010"], project.shots["fx020"]])
+
+        project2 = projectfile.read(filename)
+        self.assertEqual(len(project2.shots["fx010"].graph.nodes), 3)
+        self.assertEqual(project2.shots["fx010"].graph.nodes["RenderAction"]["subpart"].value, "default")
+        self.assertEqual(len(project2.shots["fx020"].graph.nodes), 2)
+
+        projectfile.save(project, filename)
+        self.assertEqual(project, projectfile.read(filename))
+
+    def test_save_store_in_thread(self):
+        store = ProjectStore(os.path.join(self.directory, "test.sgdb"))
+        store.save(self.createProject())
+        store.close()
+
+        store = ProjectStore(os.path.join(self.directory, "test.sgdb"))
+        project = store.project()
+        project.shots["fx020"].graph.createNode("NukeFile", "comp")
+        filename = os.path.join(self.directory, "test.sg")
+        job = projectfile.SaveJob(project, filename)
+        thread = threading.Thread(target=job.run)
+        thread.start()
+        thread.join()
+        job.finish()
+        self.assertEqual(job.done, 5)
+        self.assertEqual(project, projectfile.read(filename))
+        store.close()
+
+    def test_failed_save(self):
+        filename = os.path.join(self.directory, "missing", "test.sg")
+        project = self.createProject()
+        with self.assertRaises(Exception):
+            projectfile.save(project, filename)
+        self.assertEqual(len(project.dirtyShots()), 5)
+
+    def test_copy_unloaded(self):
+        filename = os.path.join(self.directory, "test.sg")
+        other = os.path.join(self.directory, "other.sg")
+        projectfile.save(self.createProject(), filename)
+        project = projectfile.read(filename)
+        project.shots["fx030"].name = "fx035"
+        project.shots["fx035"] = project.shots.pop("fx030")
+        projectfile.save(project, other)
+        self.assertFalse(project.shots["fx010"].isLoaded())
+
+        project2 = projectfile.read(other)
+        self.assertEqual(project2.shots["fx035"].name, "fx035")
+        self.assertEqual(project, project2)
@@ -0,0 +1,37 @@
+import unittest
+
+from core import registry
+from core import Graph, Node, Action, Data
+from core.attributes import *
+
+class TestRegistry(unittest.TestCase):
+    def tearDown(self):
+        for name in ("CustomAction",):
+            cls = registry.nodeClass(name)
+            if cls:
+                registry.unregisterNodeClass(cls)
+
+    def test_lookup(self):
+        self.assertIs(registry.nodeClass("Node"), Node)
+        self.assertEqual(registry.nodeClass("RenderAction").__name__, "RenderAction")
+        self.assertIsNone(registry.nodeClass("RenderAction", Data))
+        self.assertIsNone(registry.nodeClass("NotANode"))
+        self.assertIs(registry.attributeClass("BoolAttribute"), BoolAttribute)
+
+        ## Base classes aren't nodes of their own
+        self.assertIsNone(registry.nodeClass("Action"))
+        self.assertIsNone(registry.nodeClass("SceneFile"))
+        with self.assertRaises(Exception):
+            Graph().createNode("Action", "foo")
+
+    def test_subclass(self):
+        class CustomAction(Action):
+            def knownData(self):
+                return ["RenderData"]
+
+        self.assertIs(registry.nodeClass("CustomAction", Action), CustomAction)
+
+        graph = Graph()
+        node = graph.createNode("CustomAction", "foo")
+        revivedGraph = Graph.deserialize(graph.serialize())
+        self.assertIsInstance(revivedGraph.nodes[node.name], CustomAction)
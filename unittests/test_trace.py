@@ -0,0 +1,53 @@
+import logging
+import unittest
+from unittest import mock
+
+from core import Graph
+from core import trace
+
+class TestTrace(unittest.TestCase):
+    def test_disabled(self):
+        self.assertFalse(trace.logger.isEnabledFor(logging.DEBUG))
+        graph = Graph()
+        node = graph.createNode("RenderAction", "foo")
+        with mock.patch.object(trace, "valueSet") as valueSet:
+            node["subpart"] = "other"
+        valueSet.assert_not_called()
+
+    def test_logging(self):
+        graph = Graph()
+        node = graph.createNode("RenderAction", "foo")
+        with self.assertLogs(trace.logger, logging.DEBUG) as logs:
+            node["subpart"] = "other"
+        self.assertEqual(logs.output, ["DEBUG:core.trace:RenderAction.subpart = other"])
+
+    def test_recorder(self):
+        graph = Graph()
+        scene = graph.createNode("MayaFile", "foo")
+        with trace.Recorder() as recorder:
+            action = scene.createAction("RenderAction", "foo")
+            graph.renameNode(action, "render")
+            graph.removeNodes([action])
+        self.assertFalse(trace.logger.isEnabledFor(logging.DEBUG))
+
+        ops = [(x.op, x.node, x.key, x.value) for x in recorder.entries]
+        self.assertIn(("set", "RenderAction", "scenefile", "MayaFile"), ops)
+        self.assertEqual(ops[-3:], [("add", "RenderAction", None, None),
+                                    ("rename", "render", None, "RenderAction"),
+                                    ("remove", "render", None, None)])
+        times = [x.time for x in recorder.entries]
+        self.assertEqual(times, sorted(times))
+
+    def test_array_connections(self):
+        graph = Graph()
+        comp = graph.createNode("NukeFile", "comp")
+        data = graph.createNode("RenderData", "foo")
+        with trace.Recorder() as recorder:
+            comp["input"].append(data)
+            comp["input"].remove(data)
+        ops = [(x.op, x.node, x.key, x.value) for x in recorder.entries]
+        self.assertEqual(ops, [("set", "NukeFile", "input", ["RenderData"]),
+                               ("set", "NukeFile", "input", [])])
+
+if __name__ == '__main__':
+    unittest.main()